@@ -10,6 +10,7 @@ import numpy as np
 
 from ai_economist.foundation.agents import agent_registry
 from ai_economist.foundation.base.registrar import Registry
+from ai_economist.foundation.base.snapshot import get_object_state, set_object_state
 from ai_economist.foundation.base.world import World
 
 
@@ -60,6 +61,11 @@ class BaseComponent(ABC):
     # The (non-agent) game entities that are expected to be in play
     required_entities = None  # Replace with list or tuple (can be empty)
 
+    # Attributes holding append-only episode logs (lists whose entries are not
+    # modified once the step that added them is over), which snapshots copy
+    # shallowly (see get_state)
+    snapshot_shallow_attributes = ()
+
     def __init__(self, world, episode_length, inventory_scale=1):
         assert self.name
 
@@ -374,6 +380,35 @@ class BaseComponent(ABC):
         """
         return None
 
+    def get_state(self):
+        """
+        Return a copy of the internal state of this component, such as order books,
+        buffers and trackers. Used by BaseEnvironment.snapshot.
+
+        By default, this copies all the instance attributes (other than the reference
+        to the world object). Arrays flagged as read-only are shared rather than
+        copied, and the logs listed in snapshot_shallow_attributes are copied
+        shallowly. Override this together with set_state if the component holds
+        state that cannot be copied this way.
+
+        Returns:
+            state (dict): The captured state.
+        """
+        return get_object_state(
+            self, exclude=("_world",), shallow=self.snapshot_shallow_attributes
+        )
+
+    def set_state(self, state):
+        """
+        Restore the internal state of this component from the output of get_state.
+        Used by BaseEnvironment.restore.
+
+        Args:
+            state (dict): A state captured by get_state. It is not modified, so the
+                same state can be restored multiple times.
+        """
+        set_object_state(self, state, shallow=self.snapshot_shallow_attributes)
+
 
 component_registry = Registry(BaseComponent)
 """The registry for Component classes.
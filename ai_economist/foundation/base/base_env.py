@@ -6,12 +6,19 @@
 
 import random
 from abc import ABC, abstractmethod
-from copy import deepcopy
 
 import numpy as np
 
 from ai_economist.foundation.agents import agent_registry
+from ai_economist.foundation.base.dense_log import (
+    DenseLog,
+    DenseLogRecorder,
+    recursive_cast,
+)
+from ai_economist.foundation.base.obs_packer import ObservationPacker
+from ai_economist.foundation.base.profiler import NullProfiler, StepProfiler
 from ai_economist.foundation.base.registrar import Registry
+from ai_economist.foundation.base.snapshot import get_object_state, set_object_state
 from ai_economist.foundation.base.world import World
 from ai_economist.foundation.components import component_registry
 from ai_economist.foundation.entities import (
@@ -31,7 +38,7 @@ class BaseEnvironment(ABC):
         obs, rew, done, info <-- env.step(actions)
 
     Also provides Gym-style API for controlling random behavior:
-        env.seed(seed) # Sets numpy and built-in RNG seeds to seed
+        env.seed(seed) # Seeds the environment's random number generator
 
     Reference: OpenAI Gym [https://github.com/openai/gym]
 
@@ -160,9 +167,31 @@ class BaseEnvironment(ABC):
             (the default), the world state will be included in the dense log for
             timesteps where t is a multiple of 50.
             Note: More frequent world snapshots increase the dense log memory footprint.
-        seed (int, optional): If provided, sets the numpy and built-in random number
-            generator seeds to seed. You can control the seed after env construction
+        seed (int, optional): If provided, seeds the environment's random number
+            generator with seed (see the 'seed' method). Otherwise, the environment is
+            seeded from OS entropy. You can control the seed after env construction
             using the 'seed' method.
+        reuse_observation_buffers (bool): Whether flattened observations should be
+            packed into the same preallocated buffer at every step. This avoids
+            allocating a new "flat" array for each agent at each step, but the
+            returned arrays are then overwritten by the next reset/step and must be
+            copied if they need to persist. Default is False.
+        array_observations (bool): Whether to return every observation field as a
+            numpy array with a stable dtype (float32 for floating point values),
+            including scalar fields and (unflattened) action masks, which are
+            otherwise returned as Python numbers/lists. This removes the need to
+            convert observations back to arrays downstream (e.g. in RL wrappers).
+            Default is False.
+        profile_steps (bool): Whether to accumulate the wall time and call count of
+            each phase of the step (action parsing, each component step, the
+            scenario step, observation/mask generation per component, reward
+            generation and dense logging). See profile_report. Default is False,
+            in which case the instrumentation has (near) zero overhead.
+        sparse_maps (bool): Whether to store the world maps sparsely, keyed by
+            location, rather than as dense arrays (see SparseMaps in world.py). This
+            is meant for large worlds that are mostly empty: point updates and
+            observation windows then cost the same regardless of the world size, but
+            whole-map accessors build dense arrays on demand. Default is False.
     """
 
     # The name associated with this Scenario class (must be unique)
@@ -190,6 +219,10 @@ class BaseEnvironment(ABC):
         world_dense_log_frequency=50,
         collate_agent_step_and_reset_data=False,
         seed=None,
+        reuse_observation_buffers=False,
+        array_observations=False,
+        profile_steps=False,
+        sparse_maps=False,
     ):
 
         # Make sure a name was declared by child class
@@ -282,10 +315,6 @@ class BaseEnvironment(ABC):
         self._world_dense_log_frequency = int(world_dense_log_frequency)
         assert self._world_dense_log_frequency >= 1
 
-        # Seed control
-        if seed is not None:
-            self.seed(seed)
-
         # Initialize the set of entities used in the game that's being created.
         # Coin and Labor are always included.
         self._entities = {
@@ -322,8 +351,17 @@ class BaseEnvironment(ABC):
             self.landmarks,
             self.multi_action_mode_agents,
             self.multi_action_mode_planner,
+            sparse_maps=sparse_maps,
         )
 
+        # Seed control (before building the components, which may draw from the RNG)
+        if seed is not None:
+            self.seed(seed)
+        else:
+            self._rng_entropy = np.random.SeedSequence().entropy
+            self._rng_episode = -1
+            self.world.rng = self._make_rng(self._rng_entropy)
+
         # Initialize the component objects.
         for component_cls, component_kwargs in component_classes:
             component_object = component_cls(
@@ -353,13 +391,27 @@ class BaseEnvironment(ABC):
 
         # For dense logging
         self._dense_log = {"world": [], "states": [], "actions": [], "rewards": []}
+        self._dense_log_recorder = DenseLogRecorder(
+            self.world, self._episode_length, self._world_dense_log_frequency
+        )
         self._last_ep_dense_log = self.dense_log.copy()
 
         # For episode replay
         self._replay_log = {"reset": dict(seed_state=None), "step": []}
         self._last_ep_replay_log = self.replay_log.copy()
 
+        # Observation packers (compiled from the first observation of each agent)
         self._packagers = {}
+        self._reuse_observation_buffers = bool(reuse_observation_buffers)
+
+        # Whether to return all observation fields as numpy arrays
+        self._array_observations = bool(array_observations)
+
+        # Action lookup tables used by step_arrays (built on first use)
+        self._action_tables = None
+
+        # Per-phase step instrumentation (see profile_report)
+        self._profiler = StepProfiler() if profile_steps else NullProfiler()
 
         # To collate all the agents ('0', '1', ...) data during reset and step
         # into a single agent with index 'a'
@@ -439,6 +491,10 @@ class BaseEnvironment(ABC):
     @property
     def dense_log(self):
         """The contents of the current (potentially incomplete) dense log."""
+        if self._dense_log_recorder.active:
+            return self._dense_log_recorder.materialize()
+        if isinstance(self._dense_log, DenseLog):
+            self._dense_log = self.previous_episode_dense_log
         return self._dense_log
 
     @property
@@ -448,7 +504,13 @@ class BaseEnvironment(ABC):
 
     @property
     def previous_episode_dense_log(self):
-        """Dense log from the last completed episode that was being logged."""
+        """Dense log from the last completed episode that was being logged.
+
+        The dense log is recorded in a columnar format (see dense_log.py) and only
+        converted to the dictionary format the first time it is accessed.
+        """
+        if isinstance(self._last_ep_dense_log, DenseLog):
+            self._last_ep_dense_log = self._last_ep_dense_log.materialize()
         return self._last_ep_dense_log
 
     @property
@@ -467,9 +529,22 @@ class BaseEnvironment(ABC):
                 _ = env.step(**replay_step)
             dense_log = env.previous_episode_dense_log
             metrics = env.previous_episode_metrics
+
+        Note:
+            Steps taken through step_arrays are logged with a "planner_action" entry
+            and should be replayed with env.step_arrays(**replay_step).
+
+            Randomness is recorded as seed_state entries of a few integers
+            ([entropy, episode] for the reset, [entropy, episode, timestep] for each
+            step) that identify the random streams used (see seed).
         """
         return self._last_ep_replay_log
 
+    @property
+    def array_observations(self):
+        """Whether all observation fields are returned as numpy arrays."""
+        return self._array_observations
+
     @property
     def generate_rewards(self):
         """Compute the rewards for each agent."""
@@ -478,9 +553,20 @@ class BaseEnvironment(ABC):
     # Seed control
     # -----------------
 
-    @staticmethod
-    def seed(seed):
-        """Sets the numpy and built-in random number generator seed.
+    def seed(self, seed):
+        """Sets the seed of the environment's random number generator.
+
+        All the randomness of the environment dynamics is drawn from world.rng, a
+        numpy Generator that is private to this environment instance (so several
+        environments can run in the same process, e.g. in threads, without sharing
+        a random stream). It is derived from a SeedSequence with the seed as entropy.
+        Each episode, and each step within it, gets its own stream, identified by
+        the spawn key (episode,) for the reset and (episode, timestep) for a step.
+        That makes it possible to reproduce an episode (or any step of it) from a
+        handful of integers (see previous_episode_replay_log).
+
+        For backwards compatibility, this also seeds the global numpy and built-in
+        random number generators.
 
         Args:
             seed (int, float): Seed value to use. Must be > 0. Converted to int
@@ -490,9 +576,143 @@ class BaseEnvironment(ABC):
         seed = int(seed)
         assert seed > 0
 
-        np.random.seed(seed)
+        np.random.seed(seed % 2**32)
         random.seed(seed)
 
+        self._rng_entropy = seed
+        self._rng_episode = -1
+        self.world.rng = self._make_rng(seed)
+
+    @staticmethod
+    def _make_rng(entropy, *spawn_key):
+        """Create the Generator for the stream identified by entropy and spawn_key."""
+        return np.random.Generator(
+            np.random.PCG64(np.random.SeedSequence(entropy, spawn_key=spawn_key))
+        )
+
+    def _set_rng(self, seed_state):
+        """
+        Point world.rng to the stream identified by seed_state, which is either
+        [entropy, episode] (reset) or [entropy, episode, timestep] (step).
+        """
+        assert isinstance(seed_state, (tuple, list))
+        assert len(seed_state) in (2, 3), "Expected [entropy, episode(, timestep)]."
+        seed_state = [int(v) for v in seed_state]
+        self._rng_entropy, self._rng_episode = seed_state[:2]
+        self.world.rng = self._make_rng(*seed_state)
+        return seed_state
+
+    # Snapshots
+    # ---------
+
+    # Attributes that are not part of the simulation state: references to the
+    # objects that are captured separately, caches, and previous-episode logs
+    _snapshot_exclude = (
+        "world",
+        "_components",
+        "_components_dict",
+        "_shorthand_lookup",
+        "_agent_lookup",
+        "_entities",
+        "_packagers",
+        "_action_tables",
+        "_profiler",
+        "_dense_log_recorder",
+        "_replay_log",
+        "_last_ep_dense_log",
+        "_last_ep_replay_log",
+        "_last_ep_metrics",
+    )
+
+    def snapshot(self):
+        """
+        Capture the current state of the environment in memory, so that the
+        simulation can later be rewound to it (with restore), e.g. to evaluate
+        several branches from the same mid-episode state.
+
+        The snapshot covers the world (maps, agent states and actions, timestep and
+        random number generator), the internal state of each component (see
+        BaseComponent.get_state), the scenario attributes and the episode logs.
+        Arrays flagged as read-only (static data such as the source maps of a
+        layout) are shared between the environment and its snapshots rather than
+        copied.
+
+        Example:
+            snap = env.snapshot()
+            for tax_schedule in candidate_schedules:
+                env.restore(snap)
+                evaluate(env, tax_schedule)
+
+        Returns:
+            snapshot (dict): The captured state. Treat it as opaque; it is only
+                meant to be passed to restore (of this environment instance).
+        """
+        return dict(
+            env=get_object_state(self, exclude=self._snapshot_exclude),
+            # Replay log entries are never modified once logged
+            replay_log=dict(
+                reset=self._replay_log["reset"], step=list(self._replay_log["step"])
+            ),
+            world=self.world.get_state(),
+            components=[component.get_state() for component in self._components],
+            dense_log_recorder=self._dense_log_recorder.get_state(),
+        )
+
+    def restore(self, snapshot):
+        """
+        Restore the state of the environment from a snapshot (see snapshot).
+
+        The snapshot is not modified, so it can be restored any number of times.
+
+        Args:
+            snapshot (dict): A snapshot produced by this environment's snapshot
+                method.
+        """
+        set_object_state(self, snapshot["env"])
+        self._replay_log = dict(
+            reset=snapshot["replay_log"]["reset"],
+            step=list(snapshot["replay_log"]["step"]),
+        )
+        self.world.set_state(snapshot["world"])
+        assert len(snapshot["components"]) == len(self._components)
+        for component, component_state in zip(self._components, snapshot["components"]):
+            component.set_state(component_state)
+        self._dense_log_recorder.set_state(snapshot["dense_log_recorder"])
+
+    # Profiling
+    # ---------
+
+    def profile_report(self, as_text=False):
+        """
+        Report where step time goes, when the environment was created with
+        profile_steps=True.
+
+        Time is broken down by owner and phase: "env" covers the whole step
+        ("step") as well as action parsing, observation generation (total),
+        flattening and stacking, and dense logging; "scenario" covers the scenario
+        step, the scenario's observations and the rewards; and each component
+        (by name) covers its component_step, its observations and its masks.
+
+        Args:
+            as_text (bool): Whether to return the report as a printable table
+                instead of a dictionary. Default is False.
+
+        Returns:
+            report (dict or str): Dictionary {owner: {phase: stats}}, where stats
+                holds the number of "calls", the "total_s" time, the "mean_us" time
+                per call and the "share" of the total step time (see
+                StepProfiler.report). Empty if profiling is disabled.
+        """
+        if as_text:
+            if not self._profiler.enabled:
+                return "Profiling is disabled (create the env with profile_steps=True)."
+            return self._profiler.format_report()
+        return self._profiler.report()
+
+    def reset_profile(self):
+        """Clear the accumulated profiling statistics."""
+        self._profiler.reset()
+
     # Getters & Setters
     # -----------------
 
@@ -555,82 +775,93 @@ class BaseEnvironment(ABC):
             agent = self.get_agent(agent_idx)
             agent.parse_actions(agent_actions)
 
-    # Core control of environment execution
-    # -------------------------------------
-
     @staticmethod
-    def _build_packager(sub_obs, put_in_both=None):
+    def _build_action_table(agent):
         """
-        Decides which keys-vals should be flattened or not.
-        put_in_both: include in both (e.g., 'time')
+        Precompute how an agent's integer action(s) map onto its action buffer.
+
+        In multi_action_mode, the table is the list of (action_name, n_actions)
+        pairs of the action subspaces (the i'th action sets the i'th subspace).
+        Otherwise, it is a list indexed by action where entry a holds the
+        (action_name, sub_action) pair for action a (and None for the NO-OP action 0).
         """
-        if put_in_both is None:
-            put_in_both = []
-        keep_as_is = []
-        flatten = []
-        wrap_as_list = {}
-        for k, v in sub_obs.items():
-            if isinstance(v, np.ndarray):
-                multi_d_array = len(v.shape) > 1
-            else:
-                multi_d_array = False
+        if agent.multi_action_mode:
+            return [
+                (action_name, int(n_actions))
+                for action_name, n_actions in zip(
+                    agent._action_names, agent.action_spaces
+                )
+            ]
+        table = [None] * (1 + agent._total_actions)
+        for action, (action_name, sub_action) in agent.single_action_map.items():
+            table[action] = (action_name, int(sub_action))
+        return table
 
-            if k == "action_mask" or multi_d_array:
-                keep_as_is.append(k)
-            else:
-                flatten.append(k)
-                if k in put_in_both:
-                    keep_as_is.append(k)
+    def parse_action_arrays(self, actions=None, planner_action=None):
+        """
+        Put array-formatted actions directly into the agents' action buffers.
 
-            wrap_as_list[k] = np.isscalar(v)
+        Array counterpart of parse_actions. Decoding uses per-agent lookup tables
+        that are built once, rather than going through agent.parse_actions.
 
-        flatten = sorted(flatten)
+        Args:
+            actions (ndarray): Integer array of mobile agent actions with shape
+                [n_agents] or, if the agents use multi_action_mode,
+                [n_agents, n_action_subspaces]. Row i holds the action of the agent
+                with idx i. If None, mobile agents keep their current actions.
+            planner_action (int or ndarray): The planner action: an integer or, if
+                the planner uses multi_action_mode, an integer array with one entry
+                per action subspace. If None, the planner keeps its current action.
+        """
+        if self._action_tables is None:
+            self._action_tables = [
+                self._build_action_table(agent) for agent in self.all_agents
+            ]
 
-        return keep_as_is, flatten, wrap_as_list
+        if actions is not None:
+            actions = np.asarray(actions)
+            assert actions.shape[0] == self.n_agents
+            for agent, table, agent_actions in zip(
+                self.world.agents, self._action_tables, actions.tolist()
+            ):
+                self._decode_action(agent, table, agent_actions)
+
+        if planner_action is not None:
+            self._decode_action(
+                self.world.planner,
+                self._action_tables[-1],
+                np.asarray(planner_action).tolist(),
+            )
 
     @staticmethod
-    def _package(obs_dict, keep_as_is, flatten, wrap_as_list):
-        new_obs = {k: obs_dict[k] for k in keep_as_is}
-        if len(flatten) == 1:
-            k = flatten[0]
-            o = obs_dict[k]
-            if wrap_as_list[k]:
-                o = [o]
-            new_obs["flat"] = np.array(o, dtype=np.float32)
-        else:
-            to_flatten = [
-                [obs_dict[k]] if wrap_as_list[k] else obs_dict[k] for k in flatten
-            ]
-            try:
-                new_obs["flat"] = np.concatenate(to_flatten).astype(np.float32)
-            except ValueError:
-                for k, v in zip(flatten, to_flatten):
-                    print(k, np.array(v).shape)
-                    print(v)
-                    print("")
-                raise
-        return new_obs
-
-    def _generate_observations(self, flatten_observations=False, flatten_masks=False):
-        def recursive_listify(d):
-            assert isinstance(d, dict)
-            for k, v in d.items():
-                if isinstance(v, dict):
-                    d[k] = recursive_listify(v)
-                elif isinstance(v, (int, float)):
-                    d[k] = v
-                elif isinstance(v, (list, tuple, set)):
-                    d[k] = list(v)
-                elif isinstance(v, (np.ndarray, np.integer, np.floating)):
-                    d[k] = v.tolist()
-                else:
-                    raise NotImplementedError(
-                        "Not clear how to handle {} with type {}".format(k, type(v))
+    def _decode_action(agent, table, action):
+        """Write a (listified) action into agent's action buffer using table."""
+        if agent.multi_action_mode:
+            assert len(action) == len(table)
+            for (action_name, n_actions), sub_action in zip(table, action):
+                if not 0 <= sub_action < n_actions:
+                    raise ValueError(
+                        "Action {} of agent {} is out of range for {} "
+                        "({} actions)".format(
+                            sub_action, agent.idx, action_name, n_actions
+                        )
                     )
-                if isinstance(d[k], list) and len(d[k]) == 1:
-                    d[k] = d[k][0]
-            return d
+                agent.action[action_name] = int(sub_action)
+            return
+        if not 0 <= action < len(table):
+            raise ValueError(
+                "Action {} of agent {} is out of range ({} actions)".format(
+                    action, agent.idx, len(table)
+                )
+            )
+        if action:
+            action_name, sub_action = table[action]
+            agent.action[action_name] = sub_action
 
+    # Core control of environment execution
+    # -------------------------------------
+
+    def _generate_observations(self, flatten_observations=False, flatten_masks=False):
         # Initialize empty observations
         if self.collate_agent_step_and_reset_data:
             obs = {"a": {}, "p": {}}
@@ -640,8 +871,12 @@ class BaseEnvironment(ABC):
             "p" + str(agent.idx): {} for agent in self.world.agents
         }
 
+        profiler = self._profiler
+
         # Get/process observations generated by the scenario
-        world_obs = {str(k): v for k, v in self.generate_observations().items()}
+        with profiler.phase("scenario", "generate_observations"):
+            scenario_obs = self.generate_observations()
+        world_obs = {str(k): v for k, v in scenario_obs.items()}
         time_scale = self.episode_length if self._allow_observation_scaling else 1.0
         for idx, o in world_obs.items():
             if idx in obs:
@@ -664,7 +899,9 @@ class BaseEnvironment(ABC):
 
         # Get/process observations generated by the components
         for component in self._components:
-            for idx, o in component.obs().items():
+            with profiler.phase(component.name, "generate_observations"):
+                component_obs = component.obs()
+            for idx, o in component_obs.items():
                 if idx in obs:
                     obs[idx].update({component.name + "-" + k: v for k, v in o.items()})
                 elif idx in agent_wise_planner_obs:
@@ -676,20 +913,23 @@ class BaseEnvironment(ABC):
 
         # Process the observations
         if flatten_observations:
-            for o_dict in [obs, agent_wise_planner_obs]:
-                for aidx, aobs in o_dict.items():
-                    if not aobs:
-                        continue
-                    if aidx not in self._packagers:
-                        self._packagers[aidx] = self._build_packager(
-                            aobs, put_in_both=["time"]
-                        )
-                    try:
-                        o_dict[aidx] = self._package(aobs, *self._packagers[aidx])
-                    except ValueError:
-                        print("Error when packaging obs.")
-                        print("Agent index: {}\nRaw obs: {}\n".format(aidx, aobs))
-                        raise
+            with profiler.phase("env", "flatten_observations"):
+                for o_dict in [obs, agent_wise_planner_obs]:
+                    for aidx, aobs in o_dict.items():
+                        if not aobs:
+                            continue
+                        if aidx not in self._packagers:
+                            self._packagers[aidx] = ObservationPacker(
+                                aobs,
+                                put_in_both=["time"],
+                                reuse_buffer=self._reuse_observation_buffers,
+                            )
+                        try:
+                            o_dict[aidx] = self._packagers[aidx].pack(aobs)
+                        except ValueError:
+                            print("Error when packaging obs.")
+                            print("Agent index: {}\nRaw obs: {}\n".format(aidx, aobs))
+                            raise
 
         for k, v in agent_wise_planner_obs.items():
             if len(v) > 0:
@@ -701,8 +941,35 @@ class BaseEnvironment(ABC):
         for aidx, amask in self._generate_masks(flatten_masks=flatten_masks).items():
             obs[aidx]["action_mask"] = amask
 
+        if self._array_observations:
+            obs = self._recursive_to_arrays(obs)
+
         return obs
 
+    @classmethod
+    def _recursive_to_arrays(cls, d):
+        """
+        Convert the leaves of an observation dictionary into numpy arrays with
+        stable dtypes. Arrays are kept as they are. Scalars and lists become float32
+        arrays (scalars are wrapped as arrays of shape [1]), so that their dtype does
+        not depend on whether a given value happens to be an int or a float.
+        """
+        new_d = {}
+        for k, v in d.items():
+            if isinstance(v, np.ndarray):
+                new_d[k] = v
+            elif isinstance(v, dict):
+                new_d[k] = cls._recursive_to_arrays(v)
+            elif isinstance(v, (list, tuple)):
+                new_d[k] = np.array(v, dtype=np.float32)
+            elif isinstance(v, (int, float, np.integer, np.floating)):
+                new_d[k] = np.array([v], dtype=np.float32)
+            else:
+                raise NotImplementedError(
+                    "Not clear how to handle {} with type {}".format(k, type(v))
+                )
+        return new_d
+
     def _generate_masks(self, flatten_masks=True):
         if self.collate_agent_step_and_reset_data:
             masks = {"a": {}, "p": {}}
@@ -710,7 +977,10 @@ class BaseEnvironment(ABC):
             masks = {agent.idx: {} for agent in self.all_agents}
         for component in self._components:
             # Use the component's generate_masks method to get action masks
-            component_masks = component.generate_masks(completions=self._completions)
+            with self._profiler.phase(component.name, "generate_masks"):
+                component_masks = component.generate_masks(
+                    completions=self._completions
+                )
 
             for idx, mask in component_masks.items():
                 if isinstance(mask, dict):
@@ -747,6 +1017,13 @@ class BaseEnvironment(ABC):
                 str(agent.idx): agent.flatten_masks(masks[agent.idx])
                 for agent in self.all_agents
             }
+        if self._array_observations:
+            return {
+                str(agent_idx): {
+                    k: np.array(v, dtype=np.uint8) for k, v in masks[agent_idx].items()
+                }
+                for agent_idx in list(masks.keys())
+            }
         return {
             str(agent_idx): {
                 k: np.array(v, dtype=np.uint8).tolist()
@@ -767,51 +1044,27 @@ class BaseEnvironment(ABC):
         if not self._dense_log_this_episode:
             return
 
-        def recursive_cast(d):
-            if isinstance(d, (list, tuple, set)):
-                new_d = [recursive_cast(v_) for v_ in d]
-                return new_d
-            if isinstance(d, dict):
-                for k, v in d.items():
-                    if isinstance(v, (list, tuple, set, dict)):
-                        d[k] = recursive_cast(v)
-                    elif isinstance(v, (int, float, str)):
-                        d[k] = v
-                    elif isinstance(v, (np.ndarray, np.integer, np.floating)):
-                        d[k] = v.tolist()
-                    else:
-                        raise NotImplementedError(
-                            "Not clear how to handle {} with type {}".format(k, type(v))
-                        )
-                return d
-            if isinstance(d, (int, float, str)):
-                return d
-            if isinstance(d, (np.ndarray, np.integer, np.floating)):
-                return d.tolist()
-            raise NotImplementedError(
-                "Not clear how to handle {} with type {}".format(d, type(d))
-            )
-
-        self._dense_log["world"].append(deepcopy(self.world.maps.state_dict))
-        self._dense_log["states"].append(
-            {str(agent.idx): deepcopy(agent.state) for agent in self.all_agents}
-        )
+        self._dense_log_recorder.record_final()
 
         # Back-fill the log with each component's dense log to complete the aggregate
         # dense log
+        component_logs = {}
         for component in self._components:
             component_log = component.get_dense_log()
             if component_log is None:
                 continue
             if isinstance(component_log, dict):
                 for k, v in component_log.items():
-                    self._dense_log[component.shorthand + "-" + k] = v
+                    component_logs[component.shorthand + "-" + k] = v
             elif isinstance(component_log, (tuple, list)):
-                self._dense_log[component.shorthand] = list(component_log)
+                component_logs[component.shorthand] = list(component_log)
             else:
                 raise TypeError
 
-        self._last_ep_dense_log = recursive_cast(self._dense_log)
+        self._dense_log = self._dense_log_recorder.finish(
+            recursive_cast(component_logs)
+        )
+        self._last_ep_dense_log = self._dense_log
 
     def collate_agent_obs(self, obs):
         # Collating observations from all agents
@@ -849,14 +1102,55 @@ class BaseEnvironment(ABC):
             del info[str(agent_idx)]
         return info
 
+    def stack_agent_obs(self, obs):
+        """
+        Group per-agent observations into arrays.
+
+        Observations of the mobile agents are stacked along a new leading axis
+        (ordered by agent idx) under "a", so that each leaf has shape
+        [n_agents, ...]. The planner observations are placed under "p", with their
+        arrays copied. Neither part shares memory with the observation buffers of
+        the environment (see reuse_observation_buffers), so the result stays valid
+        after the next step or reset.
+
+        Args:
+            obs (dict): Observations as returned by reset or step (without
+                collate_agent_step_and_reset_data).
+
+        Returns:
+            obs (dict): {"a": stacked_agent_obs, "p": planner_obs}
+        """
+
+        def recursive_stack(obs_list):
+            if isinstance(obs_list[0], dict):
+                return {
+                    k: recursive_stack([o[k] for o in obs_list]) for k in obs_list[0]
+                }
+            return np.stack(obs_list, axis=0)
+
+        def recursive_copy(obs_dict):
+            return {
+                k: (
+                    recursive_copy(v)
+                    if isinstance(v, dict)
+                    else (v.copy() if isinstance(v, np.ndarray) else v)
+                )
+                for k, v in obs_dict.items()
+            }
+
+        return {
+            "a": recursive_stack([obs[str(agent.idx)] for agent in self.world.agents]),
+            "p": recursive_copy(obs[str(self.world.planner.idx)]),
+        }
+
     def reset(self, seed_state=None, force_dense_logging=False):
         """
         Reset the state of the environment to initialize a new episode.
 
         Arguments:
-            seed_state (tuple or list): Optional state that the numpy RNG should be set
-                to prior to the reset cycle must be length 5, following the format
-                expected by np.random.set_state()
+            seed_state (tuple or list): Optional [entropy, episode] pair identifying
+                the random stream to use for this episode (see seed). By default,
+                the next episode of the current seed is used.
             force_dense_logging (bool): Optional whether to force dense logging to take
                 place this episode; default behavior is to do dense logging every
                 create_dense_log_every episodes
@@ -868,17 +1162,9 @@ class BaseEnvironment(ABC):
                 which itself is a dictionary. The "agent_idx" key matches the
                 agent.idx property for the given agent.
         """
-        if seed_state is not None:
-            assert isinstance(seed_state, (tuple, list))
-            assert len(seed_state) == 5
-            seed_state = (
-                str(seed_state[0]),
-                np.array(seed_state[1], dtype=np.uint32),
-                int(seed_state[2]),
-                int(seed_state[3]),
-                float(seed_state[4]),
-            )
-            np.random.set_state(seed_state)
+        if seed_state is None:
+            seed_state = [self._rng_entropy, self._rng_episode + 1]
+        seed_state = self._set_rng(seed_state)
 
         if force_dense_logging:
             self._dense_log_this_episode = True
@@ -891,9 +1177,13 @@ class BaseEnvironment(ABC):
 
         # For dense logging
         self._dense_log = {"world": [], "states": [], "actions": [], "rewards": []}
+        if self._dense_log_this_episode:
+            self._dense_log_recorder.start()
+        else:
+            self._dense_log_recorder.active = False
 
         # For episode replay
-        self._replay_log = {"reset": dict(seed_state=np.random.get_state()), "step": []}
+        self._replay_log = {"reset": dict(seed_state=seed_state), "step": []}
 
         # Reset the timestep counter
         self.world.timestep = 0
@@ -943,9 +1233,9 @@ class BaseEnvironment(ABC):
                 specifying the chosen action for each action subspace.
                 Otherwise, action must be a single integer specifying the chosen
                 action (where the action space is the concatenation of the subspaces).
-            seed_state (tuple or list): Optional state that the numpy RNG should be set
-                to prior to the reset cycle must be length 5, following the format
-                expected by np.random.set_state().
+            seed_state (tuple or list): Optional [entropy, episode, timestep] triplet
+                identifying the random stream to use for this step (see seed). By
+                default, the stream of the current episode and timestep is used.
 
         Returns:
             obs (dict): A dictionary of {"agent_idx": agent_obs} with an entry for
@@ -961,75 +1251,142 @@ class BaseEnvironment(ABC):
             info (dict): Placeholder dictionary with structure {"agent_idx": {}},
                 with the same keys as obs and rew.
         """
-        if actions is not None:
-            assert isinstance(actions, dict)
-            self.parse_actions(actions)
-
-        if seed_state is not None:
-            assert isinstance(seed_state, (tuple, list))
-            assert len(seed_state) == 5
-            seed_state = (
-                str(seed_state[0]),
-                np.array(seed_state[1], dtype=np.uint32),
-                int(seed_state[2]),
-                int(seed_state[3]),
-                float(seed_state[4]),
-            )
-            np.random.set_state(seed_state)
+        with self._profiler.phase("env", "step"):
+            if actions is not None:
+                assert isinstance(actions, dict)
+                with self._profiler.phase("env", "parse_actions"):
+                    self.parse_actions(actions)
 
-        self._replay_log["step"].append(
-            dict(actions=actions, seed_state=np.random.get_state())
-        )
+            seed_state = self._set_step_rng(seed_state)
 
-        if self._dense_log_this_episode:
-            self._dense_log["world"].append(
-                deepcopy(self.world.maps.state_dict)
-                if (self.world.timestep % self._world_dense_log_frequency) == 0
-                else {}
+            self._replay_log["step"].append(
+                dict(actions=actions, seed_state=seed_state)
             )
-            self._dense_log["states"].append(
-                {str(agent.idx): deepcopy(agent.state) for agent in self.all_agents}
+
+            obs, rew, done = self._advance()
+            info = {k: {} for k in obs.keys()}
+
+            if self.collate_agent_step_and_reset_data:
+                obs = self.collate_agent_obs(obs)
+                rew = self.collate_agent_rew(rew)
+                info = self.collate_agent_info(info)
+
+        return obs, rew, {"__all__": done}, info
+
+    def step_arrays(self, actions=None, planner_action=None, seed_state=None):
+        """
+        Array-native counterpart of step, meant for the hot path.
+
+        Actions are given as arrays and decoded through precomputed lookup tables
+        (see parse_action_arrays). Rewards are returned as a single vector and
+        observations are returned with the mobile agent observations stacked into
+        arrays (see stack_agent_obs). No per-agent reward or info dictionaries are
+        built.
+
+        Arguments:
+            actions (ndarray): Integer array of mobile agent actions with shape
+                [n_agents] or, if the agents use multi_action_mode,
+                [n_agents, n_action_subspaces]. If None, agents take the NO-OP
+                action.
+            planner_action (int or ndarray): The planner action (an integer array
+                with one entry per action subspace if the planner uses
+                multi_action_mode). If None, the planner takes the NO-OP action.
+            seed_state (tuple or list): Optional [entropy, episode, timestep] triplet
+                identifying the random stream to use for this step (see step).
+
+        Returns:
+            obs (dict): {"a": stacked_agent_obs, "p": planner_obs}. With
+                collate_agent_step_and_reset_data, observations are formatted as in
+                step instead.
+            rew (ndarray): float32 array of shape [n_agents + 1] holding the
+                rewards of the mobile agents (ordered by agent idx) followed by the
+                reward of the planner.
+            done (bool): Whether the episode is complete.
+        """
+        with self._profiler.phase("env", "step"):
+            with self._profiler.phase("env", "parse_actions"):
+                self.parse_action_arrays(actions, planner_action)
+
+            seed_state = self._set_step_rng(seed_state)
+
+            self._replay_log["step"].append(
+                dict(
+                    actions=None if actions is None else np.array(actions),
+                    planner_action=(
+                        None if planner_action is None else np.array(planner_action)
+                    ),
+                    seed_state=seed_state,
+                )
             )
-            self._dense_log["actions"].append(
-                {
-                    str(agent.idx): {k: v for k, v in agent.action.items() if v > 0}
-                    for agent in self.all_agents
-                }
+
+            obs, rew, done = self._advance()
+
+            rew = np.array(
+                [rew[str(agent.idx)] for agent in self.all_agents], dtype=np.float32
             )
 
+            if self.collate_agent_step_and_reset_data:
+                obs = self.collate_agent_obs(obs)
+            else:
+                with self._profiler.phase("env", "stack_observations"):
+                    obs = self.stack_agent_obs(obs)
+
+        return obs, rew, done
+
+    def _set_step_rng(self, seed_state=None):
+        """Set world.rng to the stream of this step and return its seed_state."""
+        if seed_state is None:
+            seed_state = [self._rng_entropy, self._rng_episode, self.world.timestep]
+        assert len(seed_state) == 3
+        return self._set_rng(seed_state)
+
+    def _advance(self):
+        """
+        Advance the environment by one timestep using the actions currently in the
+        agents' action buffers. Shared by step and step_arrays.
+
+        Returns:
+            obs (dict): Per-agent observations.
+            rew (dict): Per-agent rewards.
+            done (bool): Whether the episode is complete.
+        """
+        profiler = self._profiler
+
+        if self._dense_log_this_episode:
+            with profiler.phase("env", "dense_log"):
+                self._dense_log_recorder.record_step()
+
         self.world.timestep += 1
 
         for component in self._components:
-            component.component_step()
+            with profiler.phase(component.name, "component_step"):
+                component.component_step()
 
-        self.scenario_step()
+        with profiler.phase("scenario", "scenario_step"):
+            self.scenario_step()
 
-        obs = self._generate_observations(
-            flatten_observations=self._flatten_observations,
-            flatten_masks=self._flatten_masks,
-        )
-        rew = self._generate_rewards()
-        done = {"__all__": self.world.timestep >= self._episode_length}
-        info = {k: {} for k in obs.keys()}
+        with profiler.phase("env", "generate_observations"):
+            obs = self._generate_observations(
+                flatten_observations=self._flatten_observations,
+                flatten_masks=self._flatten_masks,
+            )
+        with profiler.phase("scenario", "generate_rewards"):
+            rew = self._generate_rewards()
+        done = self.world.timestep >= self._episode_length
 
         if self._dense_log_this_episode:
-            self._dense_log["rewards"].append(rew)
+            with profiler.phase("env", "dense_log"):
+                self._dense_log_recorder.record_rewards(rew)
 
         for agent in self.all_agents:
             agent.reset_actions()
 
-        if done[
-            "__all__"
-        ]:  # Complete the dense log and stash it as well as the metrics
-            self._finalize_logs()
+        if done:  # Complete the dense log and stash it as well as the metrics
+            with profiler.phase("env", "finalize_logs"):
+                self._finalize_logs()
             self._completions += 1
 
-        if self.collate_agent_step_and_reset_data:
-            obs = self.collate_agent_obs(obs)
-            rew = self.collate_agent_rew(rew)
-            info = self.collate_agent_info(info)
-
-        return obs, rew, done, info
+        return obs, rew, done
 
     # The following methods must be implemented for each scenario
     # -----------------------------------------------------------
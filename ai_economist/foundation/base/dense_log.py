@@ -0,0 +1,487 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+from copy import deepcopy
+
+import numpy as np
+
+from ai_economist.foundation.base.snapshot import get_object_state, set_object_state
+
+
+def recursive_cast(d):
+    """Recursively cast numpy values in d to python types (in place for dicts)."""
+    if isinstance(d, (list, tuple, set)):
+        new_d = [recursive_cast(v_) for v_ in d]
+        return new_d
+    if isinstance(d, dict):
+        for k, v in d.items():
+            if isinstance(v, (list, tuple, set, dict)):
+                d[k] = recursive_cast(v)
+            elif isinstance(v, (int, float, str)):
+                d[k] = v
+            elif isinstance(v, (np.ndarray, np.integer, np.floating)):
+                d[k] = v.tolist()
+            else:
+                raise NotImplementedError(
+                    "Not clear how to handle {} with type {}".format(k, type(v))
+                )
+        return d
+    if isinstance(d, (int, float, str)):
+        return d
+    if isinstance(d, (np.ndarray, np.integer, np.floating)):
+        return d.tolist()
+    raise NotImplementedError(
+        "Not clear how to handle {} with type {}".format(d, type(d))
+    )
+
+
+def _flatten(d, prefix=()):
+    """Return the (path, value) leaves of a nested dictionary, in order."""
+    leaves = []
+    for k, v in d.items():
+        if isinstance(v, dict) and v:
+            leaves += _flatten(v, prefix + (k,))
+        else:
+            leaves.append((prefix + (k,), v))
+    return leaves
+
+
+def _unflatten(leaves):
+    """Build a nested dictionary from (path, value) leaves."""
+    d = {}
+    for path, value in leaves:
+        node = d
+        for k in path[:-1]:
+            node = node.setdefault(k, {})
+        node[path[-1]] = value
+    return d
+
+
+_MISSING = object()
+
+
+def _describe(value):
+    """Return the (kind, shape) column storage of a state value, or None."""
+    if isinstance(value, (bool, np.bool_)):
+        return "bool", ()
+    if isinstance(value, (int, np.integer)):
+        return "int", ()
+    if isinstance(value, (float, np.floating)):
+        return "float", ()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            return None
+        if array.dtype.kind == "b":
+            return "bool", array.shape
+        if array.dtype.kind in "iu":
+            return "int", array.shape
+        if array.dtype.kind == "f":
+            return "float", array.shape
+    return None
+
+
+_DTYPES = {"bool": bool, "int": np.int64, "float": np.float64, "number": np.float64}
+
+
+def _column_rows(column, n):
+    """Return the first n rows of a state column as python values."""
+    if column["kind"] == "object":
+        return [
+            row and [v if v is None else recursive_cast(v) for v in row]
+            for row in column["objects"][:n]
+        ]
+    rows = column["data"][:n].tolist()
+    if column["kind"] == "number":
+        for t, j in np.argwhere(column["is_int"][:n]).tolist():
+            rows[t][j] = int(rows[t][j])
+    return rows
+
+
+class DenseLogRecorder:
+    """
+    Columnar recorder for the dense log of an episode.
+
+    Rather than deep-copying every agent state at every timestep, agent state fields
+    are written into preallocated NumPy columns of shape [episode_length + 1,
+    n_agents(, ...)], with one column per state field (e.g. ("inventory", "Coin")).
+    Columns are added as state fields appear, so fields added during the episode
+    are recorded from the timestep they first appear at. Numeric scalars and
+    fixed-size numeric sequences (e.g. "loc") keep their type (bool, int or float).
+    Scalar fields holding both ints and floats are stored as floats along with a
+    mask of the int entries, and any other field falls back to a deep copy per
+    timestep. Actions and rewards are stored in the same columnar way.
+
+    World maps are stored as key frames (full copies) every
+    world_key_frame_interval snapshots, with sparse deltas (flat indices and new
+    values of the changed cells) in between.
+
+    The dense log dictionary (in the format documented in BaseEnvironment) is only
+    built when requested, through materialize.
+
+    Args:
+        world (World): The world object whose agents and maps are recorded.
+        episode_length (int): Number of timesteps in an episode. Used to size the
+            columns (which grow if more timesteps are recorded).
+        world_dense_log_frequency (int): How often (in timesteps) to snapshot the
+            world maps.
+        world_key_frame_interval (int): Store a full copy of the world maps every
+            world_key_frame_interval snapshots, and sparse deltas otherwise.
+    """
+
+    def __init__(
+        self,
+        world,
+        episode_length,
+        world_dense_log_frequency=50,
+        world_key_frame_interval=10,
+    ):
+        self.world = world
+        self.capacity = int(episode_length) + 1
+        self.world_dense_log_frequency = int(world_dense_log_frequency)
+        self.world_key_frame_interval = int(world_key_frame_interval)
+        assert self.world_key_frame_interval >= 1
+        self.active = False
+
+    # Recording
+    # ---------
+
+    def start(self):
+        """Allocate the action and reward columns and reset the state columns."""
+        agents = self.world.agents + [self.world.planner]
+        self.agent_ids = [str(agent.idx) for agent in agents]
+
+        # Per agent, the (first timestep, state field paths) of each state schema
+        self.state_paths = [[] for _ in agents]
+        # One column per state field path, covering the agents that have the field
+        self.state_columns = {}
+
+        self.action_names = [list(agent.action.keys()) for agent in agents]
+        self.actions = [
+            np.zeros((self.capacity, len(names)), dtype=np.int64)
+            for names in self.action_names
+        ]
+        self.rewards = np.zeros((self.capacity, len(agents)), dtype=np.float64)
+
+        # World frames: None (no snapshot), ("key", leaves) or ("delta", changes)
+        self.world_frames = []
+        self._last_world = None
+        self._n_world_snapshots = 0
+
+        self.n_states = 0
+        self.n_actions = 0
+        self.n_rewards = 0
+        self.active = True
+
+    def _new_column(self, value):
+        """Create an empty state column, given a sample value of the field."""
+        description = _describe(value)
+        if description is None:
+            return {
+                "kind": "object",
+                "agents": [],
+                "slot": {},
+                "objects": [None] * self.n_states,
+            }
+        kind, shape = description
+        return {
+            "kind": kind,
+            "shape": shape,
+            "agents": [],
+            "slot": {},
+            "data": np.zeros((self.capacity, 0) + shape, dtype=_DTYPES[kind]),
+        }
+
+    def _add_schema(self, agent_pos, leaves):
+        """Start recording the state fields leaves of agent agent_pos."""
+        paths = [path for path, _ in leaves]
+        self.state_paths[agent_pos].append((self.n_states, paths))
+        for path, value in leaves:
+            column = self.state_columns.get(path)
+            if column is None:
+                column = self._new_column(value)
+                self.state_columns[path] = column
+            if agent_pos in column["slot"]:
+                continue
+            column["slot"][agent_pos] = len(column["agents"])
+            column["agents"].append(agent_pos)
+            for key in ["data", "is_int"]:
+                if key in column:
+                    array = column[key]
+                    new_slot = np.zeros(
+                        (len(array), 1) + array.shape[2:], dtype=array.dtype
+                    )
+                    column[key] = np.concatenate([array, new_slot], axis=1)
+
+    def _fits(self, column, value):
+        """Return whether value can be stored in column, widening it if needed."""
+        description = _describe(value)
+        kind = column["kind"]
+        if description == (kind, column["shape"]):
+            return True
+        if description is None or description[1] != () or column["shape"] != ():
+            return False
+        if kind == "number":
+            return description[0] != "bool"
+        if {kind, description[0]} == {"int", "float"}:
+            # Store ints as floats and remember which entries were ints
+            is_int = np.zeros(column["data"].shape, dtype=bool)
+            if kind == "int":
+                is_int[: self.n_states] = True
+            column.update(
+                kind="number", data=column["data"].astype(np.float64), is_int=is_int
+            )
+            return True
+        return False
+
+    def _grow(self):
+        """Double the capacity of all the columns."""
+
+        def grow(array):
+            return np.concatenate([array, np.zeros_like(array)], axis=0)
+
+        for column in self.state_columns.values():
+            for key in ["data", "is_int"]:
+                if key in column:
+                    column[key] = grow(column[key])
+        self.actions = [grow(a) for a in self.actions]
+        self.rewards = grow(self.rewards)
+        self.capacity *= 2
+
+    def record_step(self):
+        """Record the world (if due), agent states and actions of this timestep."""
+        if self.world.timestep % self.world_dense_log_frequency == 0:
+            self._record_world()
+        else:
+            self.world_frames.append(None)
+        self._record_states()
+
+        t = self.n_actions
+        if t >= self.capacity:
+            self._grow()
+        agents = self.world.agents + [self.world.planner]
+        for agent, actions in zip(agents, self.actions):
+            actions[t] = list(agent.action.values())
+        self.n_actions += 1
+
+    def record_rewards(self, rew):
+        """Record the rewards {agent_idx: reward} of this timestep."""
+        t = self.n_rewards
+        if t >= self.capacity:
+            self._grow()
+        self.rewards[t] = [rew[agent_id] for agent_id in self.agent_ids]
+        self.n_rewards += 1
+
+    def record_final(self):
+        """Record the world and agent states at the end of the episode."""
+        self._record_world()
+        self._record_states()
+
+    def _record_states(self):
+        t = self.n_states
+        if t >= self.capacity:
+            self._grow()
+        agents = self.world.agents + [self.world.planner]
+        states = []
+        for agent_pos, agent in enumerate(agents):
+            leaves = _flatten(agent.state)
+            schemas = self.state_paths[agent_pos]
+            if not schemas or [path for path, _ in leaves] != schemas[-1][1]:
+                self._add_schema(agent_pos, leaves)
+            states.append(dict(leaves))
+
+        for path, column in self.state_columns.items():
+            values = [
+                states[agent_pos].get(path, _MISSING) for agent_pos in column["agents"]
+            ]
+            if column["kind"] != "object" and not all(
+                v is _MISSING or self._fits(column, v) for v in values
+            ):
+                # Fall back to deep copies for the rest of the episode
+                column.update(kind="object", objects=_column_rows(column, t))
+                column.pop("data")
+                column.pop("is_int", None)
+            if column["kind"] == "object":
+                column["objects"].append(
+                    [None if v is _MISSING else deepcopy(v) for v in values]
+                )
+                continue
+            column["data"][t] = [0 if v is _MISSING else v for v in values]
+            if column["kind"] == "number":
+                column["is_int"][t] = [isinstance(v, (int, np.integer)) for v in values]
+        self.n_states += 1
+
+    def _record_world(self):
+        leaves = {
+            path: np.array(value)
+            for path, value in _flatten(self.world.maps.state_dict)
+        }
+        is_key_frame = (
+            self._last_world is None
+            or self._n_world_snapshots % self.world_key_frame_interval == 0
+        )
+        if is_key_frame:
+            self.world_frames.append(("key", leaves))
+        else:
+            changes = {}
+            for path, value in leaves.items():
+                last = self._last_world.get(path)
+                if last is None or last.shape != value.shape:
+                    changes[path] = ("full", value)
+                    continue
+                changed = np.flatnonzero(value != last)
+                if changed.size:
+                    changes[path] = ("sparse", changed, value.ravel()[changed])
+            for path in self._last_world:
+                if path not in leaves:
+                    changes[path] = ("removed",)
+            self.world_frames.append(("delta", changes))
+        self._last_world = leaves
+        self._n_world_snapshots += 1
+
+    def finish(self, component_logs=None):
+        """
+        Stop recording and hand over the recorded data.
+
+        Args:
+            component_logs (dict): Additional (already python-typed) entries to
+                include in the dense log, such as the component dense logs.
+
+        Returns:
+            dense_log (DenseLog): Lazy dense log of the recorded episode.
+        """
+        dense_log = DenseLog(self, component_logs)
+        self.active = False
+        return dense_log
+
+    def materialize(self):
+        """Build the dense log dictionary from what has been recorded so far."""
+        return DenseLog(self).materialize()
+
+    def get_state(self):
+        """Return a copy of the recording state (see BaseEnvironment.snapshot)."""
+        if not self.active:
+            return dict(active=False)
+        return get_object_state(self, exclude=("world",))
+
+    def set_state(self, state):
+        """Restore the recording state from the output of get_state."""
+        set_object_state(self, state)
+
+
+class DenseLog:
+    """
+    Recorded dense log data, which is turned into the dense log dictionary format
+    (see BaseEnvironment) on request.
+
+    Args:
+        recorder (DenseLogRecorder): The recorder holding the data.
+        component_logs (dict): Additional entries to include in the dense log.
+    """
+
+    def __init__(self, recorder, component_logs=None):
+        self.agent_ids = recorder.agent_ids
+        self.state_paths = [list(schemas) for schemas in recorder.state_paths]
+        self.state_columns = {
+            path: dict(column, slot=dict(column["slot"]))
+            for path, column in recorder.state_columns.items()
+        }
+        for column in self.state_columns.values():
+            for key in ["data", "is_int"]:
+                if key in column:
+                    column[key] = column[key][: recorder.n_states]
+            if "objects" in column:
+                column["objects"] = list(column["objects"])
+        self.action_names = recorder.action_names
+        self.actions = [a[: recorder.n_actions] for a in recorder.actions]
+        self.rewards = recorder.rewards[: recorder.n_rewards]
+        self.world_frames = list(recorder.world_frames)
+        self.n_states = recorder.n_states
+        self.component_logs = component_logs or {}
+
+    def _materialize_world(self):
+        world = []
+        current = {}
+        for frame in self.world_frames:
+            if frame is None:
+                world.append({})
+                continue
+            if frame[0] == "key":
+                current = {path: value.copy() for path, value in frame[1].items()}
+            else:
+                for path, change in frame[1].items():
+                    if change[0] == "full":
+                        current[path] = change[1].copy()
+                    elif change[0] == "sparse":
+                        current[path].ravel()[change[1]] = change[2]
+                    else:
+                        del current[path]
+            world.append(
+                _unflatten([(path, value.tolist()) for path, value in current.items()])
+            )
+        return world
+
+    def _materialize_states(self):
+        columns = {
+            path: (_column_rows(column, self.n_states), column["slot"])
+            for path, column in self.state_columns.items()
+        }
+
+        states = []
+        schema_idx = [0] * len(self.agent_ids)
+        for t in range(self.n_states):
+            states_t = {}
+            for agent_pos, agent_id in enumerate(self.agent_ids):
+                schemas = self.state_paths[agent_pos]
+                while (
+                    schema_idx[agent_pos] + 1 < len(schemas)
+                    and schemas[schema_idx[agent_pos] + 1][0] <= t
+                ):
+                    schema_idx[agent_pos] += 1
+                states_t[agent_id] = _unflatten(
+                    [
+                        (path, columns[path][0][t][columns[path][1][agent_pos]])
+                        for path in schemas[schema_idx[agent_pos]][1]
+                    ]
+                )
+            states.append(states_t)
+        return states
+
+    def _materialize_actions(self):
+        actions = [a.tolist() for a in self.actions]
+        n_steps = len(self.actions[0]) if self.actions else 0
+        return [
+            {
+                agent_id: {
+                    name: v
+                    for name, v in zip(
+                        self.action_names[agent_pos], actions[agent_pos][t]
+                    )
+                    if v > 0
+                }
+                for agent_pos, agent_id in enumerate(self.agent_ids)
+            }
+            for t in range(n_steps)
+        ]
+
+    def _materialize_rewards(self):
+        return [dict(zip(self.agent_ids, rew)) for rew in self.rewards.tolist()]
+
+    def materialize(self):
+        """
+        Returns:
+            dense_log (dict): The dense log, in the format produced by
+                BaseEnvironment, with all values cast to python types.
+        """
+        dense_log = {
+            "world": self._materialize_world(),
+            "states": self._materialize_states(),
+            "actions": self._materialize_actions(),
+            "rewards": self._materialize_rewards(),
+        }
+        dense_log.update(self.component_logs)
+        return dense_log
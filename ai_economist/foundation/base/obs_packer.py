@@ -0,0 +1,90 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+import numpy as np
+
+
+class ObservationPacker:
+    """
+    Precompiled layout for packing an agent's observation dictionary.
+
+    Scalar and vector observation fields are packed into a single float32 "flat"
+    array, while multi-dimensional fields and the action mask are kept as they are
+    (see BaseEnvironment._generate_observations). The layout is compiled once, from
+    the first observation of the agent, into a fixed schedule of
+    (key, offset, length) entries. Packing then writes each field directly into its
+    slice of a preallocated float32 buffer, instead of building a list of fields,
+    concatenating it and casting the result on every step.
+
+    Args:
+        sample_obs (dict): An observation dictionary of the agent. Its keys and the
+            sizes of its values define the layout. Subsequent observations must
+            have the same structure.
+        put_in_both (list): Keys of fields to include in the flat array and also
+            keep as they are (e.g. "time").
+        reuse_buffer (bool): If True, every call to pack returns the same flat
+            buffer, which is overwritten by the next call (no allocation at all).
+            If False (the default), pack returns a fresh copy of the buffer.
+    """
+
+    def __init__(self, sample_obs, put_in_both=None, reuse_buffer=False):
+        if put_in_both is None:
+            put_in_both = []
+
+        self.keep_as_is = []
+        flatten = []
+        for k, v in sample_obs.items():
+            if isinstance(v, np.ndarray):
+                multi_d_array = len(v.shape) > 1
+            else:
+                multi_d_array = False
+
+            if k == "action_mask" or multi_d_array:
+                self.keep_as_is.append(k)
+            else:
+                flatten.append(k)
+                if k in put_in_both:
+                    self.keep_as_is.append(k)
+
+        # Fixed (key, offset, length) schedule of the flat array
+        self.schedule = []
+        offset = 0
+        for k in sorted(flatten):
+            length = int(np.size(sample_obs[k]))
+            self.schedule.append((k, offset, length))
+            offset += length
+        self.size = offset
+
+        self.reuse_buffer = bool(reuse_buffer)
+        self._buffer = np.zeros(self.size, dtype=np.float32)
+
+    def pack(self, obs):
+        """
+        Pack an observation dictionary.
+
+        Args:
+            obs (dict): The agent's observation dictionary.
+
+        Returns:
+            packed_obs (dict): Dictionary with the fields that are kept as they are
+                and the float32 "flat" array.
+        """
+        new_obs = {k: obs[k] for k in self.keep_as_is}
+
+        buffer = self._buffer
+        for k, offset, length in self.schedule:
+            try:
+                buffer[offset : offset + length] = obs[k]
+            except ValueError:
+                print(
+                    "Expected {} of size {} but got {}".format(
+                        k, length, np.array(obs[k]).shape
+                    )
+                )
+                raise
+
+        new_obs["flat"] = buffer if self.reuse_buffer else buffer.copy()
+        return new_obs
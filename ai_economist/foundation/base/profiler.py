@@ -0,0 +1,149 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Lightweight wall-time instrumentation of the phases of an environment step
+(see the profile_steps argument of BaseEnvironment).
+"""
+
+from time import perf_counter
+
+
+class _PhaseTimer:
+    """Context manager adding the elapsed time of its block to an accumulator."""
+
+    __slots__ = ("_totals", "_key", "_start")
+
+    def __init__(self, totals, key):
+        self._totals = totals
+        self._key = key
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = perf_counter() - self._start
+        total = self._totals.get(self._key)
+        if total is None:
+            self._totals[self._key] = [elapsed, 1]
+        else:
+            total[0] += elapsed
+            total[1] += 1
+
+
+class _NullTimer:
+    """Context manager that does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullProfiler:
+    """Stand-in for StepProfiler when profiling is disabled (does not time anything)."""
+
+    enabled = False
+
+    @staticmethod
+    def phase(owner, phase):
+        return _NULL_TIMER
+
+    def reset(self):
+        return
+
+    def report(self):
+        return {}
+
+
+class StepProfiler:
+    """
+    Accumulates wall time and call counts per phase of the environment step.
+
+    Phases are identified by an owner (such as "env", "scenario" or the name of a
+    component) and a phase name (such as "component_step" or "generate_masks").
+
+    Example:
+        profiler = StepProfiler()
+        with profiler.phase("Build", "component_step"):
+            build.component_step()
+        profiler.report()["Build"]["component_step"]["calls"]  # 1
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._totals = {}
+
+    def phase(self, owner, phase):
+        """
+        Return a context manager timing its block as the given phase.
+
+        Args:
+            owner (str): What the phase belongs to, e.g. "env", "scenario" or a
+                component name.
+            phase (str): The name of the phase.
+        """
+        return _PhaseTimer(self._totals, (owner, phase))
+
+    def reset(self):
+        """Clear all accumulated times and counts."""
+        self._totals = {}
+
+    def report(self):
+        """
+        Returns:
+            report (dict): Nested dictionary {owner: {phase: stats}}, where stats is
+                a dictionary with the number of "calls", the "total_s" wall time (in
+                seconds), the "mean_us" time per call (in microseconds) and the
+                "share" of the total step time ("env"/"step") spent in the phase.
+        """
+        step_total = self._totals.get(("env", "step"), [0.0, 0])[0]
+        report = {}
+        for (owner, phase), (total, calls) in self._totals.items():
+            report.setdefault(owner, {})[phase] = dict(
+                calls=calls,
+                total_s=total,
+                mean_us=1e6 * total / calls,
+                share=total / step_total if step_total > 0 else 0.0,
+            )
+        return report
+
+    def format_report(self):
+        """
+        Returns:
+            text (str): The report as a table, with phases sorted by total time.
+        """
+        rows = [
+            (owner, phase, stats)
+            for owner, phases in self.report().items()
+            for phase, stats in phases.items()
+        ]
+        rows.sort(key=lambda row: -row[2]["total_s"])
+        lines = [
+            "{:<28} {:<24} {:>8} {:>11} {:>11} {:>7}".format(
+                "owner", "phase", "calls", "total [s]", "mean [us]", "share"
+            )
+        ]
+        for owner, phase, stats in rows:
+            lines.append(
+                "{:<28} {:<24} {:>8d} {:>11.4f} {:>11.1f} {:>6.1%}".format(
+                    owner,
+                    phase,
+                    stats["calls"],
+                    stats["total_s"],
+                    stats["mean_us"],
+                    stats["share"],
+                )
+            )
+        return "\n".join(lines)
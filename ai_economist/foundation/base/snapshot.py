@@ -0,0 +1,89 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Helpers for capturing and restoring the in-memory state of environment objects
+(see BaseEnvironment.snapshot and BaseEnvironment.restore).
+"""
+
+from copy import copy, deepcopy
+
+import numpy as np
+
+_IMMUTABLE_TYPES = {bool, int, float, complex, str, bytes, type(None)}
+
+
+def copy_state(value):
+    """
+    Return an independent copy of a (possibly nested) state value.
+
+    Dictionaries, lists and tuples are copied recursively and arrays are copied,
+    except for arrays that are flagged as read-only: those are treated as static
+    data and shared rather than copied. Code that needs to change such an array
+    has to replace it with a (writable) copy, so sharing it is safe.
+    Immutable values are returned as they are, and any other object is deep-copied.
+
+    Args:
+        value: The value to copy.
+
+    Returns:
+        The copied value.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return {k: copy_state(v) for k, v in value.items()}
+    if value_type is list:
+        return [copy_state(v) for v in value]
+    if value_type is np.ndarray:
+        return value.copy() if value.flags.writeable else value
+    if value_type in _IMMUTABLE_TYPES or isinstance(value, np.generic):
+        return value
+    if value_type is tuple:
+        return tuple(copy_state(v) for v in value)
+    return deepcopy(value)
+
+
+def get_object_state(obj, exclude=(), shallow=()):
+    """
+    Return a copy of the instance attributes of obj (see copy_state).
+
+    Args:
+        obj: The object whose state to capture.
+        exclude (iterable): Names of attributes to leave out, such as references
+            to other environment objects.
+        shallow (iterable): Names of attributes to copy shallowly, such as
+            append-only logs (lists whose entries are never modified once added).
+
+    Returns:
+        state (dict): The copied {attribute_name: value} dictionary.
+    """
+    return {
+        k: copy(v) if k in shallow else copy_state(v)
+        for k, v in vars(obj).items()
+        if k not in exclude
+    }
+
+
+def set_object_state(obj, state, shallow=()):
+    """
+    Set the instance attributes of obj to copies of the values in state.
+
+    The state itself is left untouched, so that it can be restored again.
+
+    Args:
+        obj: The object whose state to restore.
+        state (dict): A dictionary produced by get_object_state.
+        shallow (iterable): Names of attributes to copy shallowly (see
+            get_object_state).
+    """
+    for k, v in state.items():
+        setattr(obj, k, copy(v) if k in shallow else copy_state(v))
+
+
+def freeze(array):
+    """Flag array as read-only, so that snapshots share it instead of copying it."""
+    array.setflags(write=False)
+    return array
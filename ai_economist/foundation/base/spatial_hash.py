@@ -0,0 +1,197 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+import numpy as np
+
+_METRICS = ("chebyshev", "manhattan", "euclidean")
+
+
+class SpatialHash:
+    """Grid-bucket index of the agent locations, for batched neighbor queries.
+
+    The world is divided into square buckets of bucket_size x bucket_size
+    locations. Moving an agent only records its new location (see set_loc); the
+    agents are sorted by bucket and by location the next time the index is
+    queried, with a few array operations over all agents. Queries are answered for
+    many locations at once:
+        - agents_at: the agent occupying each of K locations;
+        - agents_within: the agents within a radius of each of K locations, which
+          only looks at the agents in the buckets overlapping each query square.
+
+    Args:
+        size (list): [height, width] of the world.
+        n_agents (int): The number of mobile agents.
+        bucket_size (int): Side of the square buckets, in locations. Queries with a
+            radius comparable to the bucket size are the most efficient.
+    """
+
+    def __init__(self, size, n_agents, bucket_size=8):
+        assert bucket_size >= 1
+        self.sz_h, self.sz_w = size
+        self.n_agents = n_agents
+        self.bucket_size = int(bucket_size)
+        self.n_bucket_rows = -(-self.sz_h // self.bucket_size)
+        self.n_bucket_cols = -(-self.sz_w // self.bucket_size)
+        self.n_buckets = self.n_bucket_rows * self.n_bucket_cols
+
+        # [n_agents, 2] agent locations ([-1, -1] for agents off the map)
+        self._locs = -np.ones((n_agents, 2), dtype=np.int64)
+        self._stale = True
+
+    # Updates
+    # -------
+
+    def set_loc(self, agent_idx, r, c):
+        """Record that agent agent_idx is at location [r, c]."""
+        self._locs[agent_idx] = r, c
+        self._stale = True
+
+    def clear_loc(self, agent_idx=None):
+        """Take agent agent_idx (or all agents, if None) off the map."""
+        if agent_idx is None:
+            self._locs[:] = -1
+        else:
+            self._locs[agent_idx] = -1
+        self._stale = True
+
+    def _rebuild(self):
+        """Sort the agents on the map by location and by bucket."""
+        placed = np.flatnonzero(self._locs[:, 0] >= 0)
+        rs, cs = self._locs[placed, 0], self._locs[placed, 1]
+
+        cells = rs * self.sz_w + cs
+        order = np.argsort(cells, kind="stable")
+        self._sorted_cells = cells[order]
+        self._cell_agents = placed[order]
+
+        buckets = (rs // self.bucket_size) * self.n_bucket_cols + (
+            cs // self.bucket_size
+        )
+        order = np.argsort(buckets, kind="stable")
+        self._bucket_agents = placed[order]
+        self._bucket_start = np.zeros(self.n_buckets + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(buckets, minlength=self.n_buckets),
+            out=self._bucket_start[1:],
+        )
+        self._stale = False
+
+    # Queries
+    # -------
+
+    @property
+    def locs(self):
+        """[n_agents, 2] array of agent locations ([-1, -1] when off the map)."""
+        return self._locs
+
+    def agents_at(self, rs, cs):
+        """Return the index of the agent at each of the locations [rs, cs].
+
+        Args:
+            rs (ndarray): Row coordinates.
+            cs (ndarray): Column coordinates (broadcast with rs).
+
+        Returns:
+            agent_idx (ndarray): int array with the broadcast shape, holding the
+                index of the agent at each location, or -1 if there is none (or if
+                the location is outside of the world).
+        """
+        if self._stale:
+            self._rebuild()
+        rs, cs = np.broadcast_arrays(np.asarray(rs), np.asarray(cs))
+        valid = (rs >= 0) & (rs < self.sz_h) & (cs >= 0) & (cs < self.sz_w)
+        if len(self._sorted_cells) == 0:
+            return -np.ones(rs.shape, dtype=np.int64)
+        cells = np.where(valid, rs * self.sz_w + cs, -1)
+        pos = np.searchsorted(self._sorted_cells, cells)
+        pos = np.minimum(pos, len(self._sorted_cells) - 1)
+        found = valid & (self._sorted_cells[pos] == cells)
+        return np.where(found, self._cell_agents[pos], -1)
+
+    def agents_within(self, rs, cs, radius, metric="chebyshev"):
+        """Return the agents within radius of each of the K locations [rs, cs].
+
+        Args:
+            rs (ndarray): [K] row coordinates.
+            cs (ndarray): [K] column coordinates.
+            radius (int, float): Maximum distance (inclusive) to the query location.
+            metric (str): Distance between locations. One of "chebyshev" (square
+                neighborhoods, like observation windows), "manhattan" or
+                "euclidean".
+
+        Returns:
+            query_idx (ndarray): Index (in [0, K)) of the query location of each
+                match, in increasing order.
+            agent_idx (ndarray): Index of the agent of each match. Within a query,
+                agents are ordered by bucket and then by index.
+        """
+        assert metric in _METRICS
+        assert radius >= 0
+        if self._stale:
+            self._rebuild()
+        rs = np.asarray(rs, dtype=np.int64).ravel()
+        cs = np.asarray(cs, dtype=np.int64).ravel()
+        assert rs.shape == cs.shape
+        reach = int(np.floor(radius))
+        b = self.bucket_size
+
+        # The [K, span, span] buckets overlapping the query squares
+        span = (2 * reach) // b + 2
+        offsets = np.arange(span)
+        first_rows, first_cols = (rs - reach) // b, (cs - reach) // b
+        last_rows = np.minimum((rs + reach) // b, self.n_bucket_rows - 1)
+        last_cols = np.minimum((cs + reach) // b, self.n_bucket_cols - 1)
+        bucket_rows = first_rows[:, None, None] + offsets[None, :, None]
+        bucket_cols = first_cols[:, None, None] + offsets[None, None, :]
+        in_reach = (
+            (bucket_rows >= 0)
+            & (bucket_rows <= last_rows[:, None, None])
+            & (bucket_cols >= 0)
+            & (bucket_cols <= last_cols[:, None, None])
+        )
+        bucket_rows, bucket_cols = np.broadcast_arrays(bucket_rows, bucket_cols)
+        query_idx = np.nonzero(in_reach)[0]
+        bucket_rows, bucket_cols = bucket_rows[in_reach], bucket_cols[in_reach]
+        buckets = bucket_rows * self.n_bucket_cols + bucket_cols
+
+        # The candidate agents of all the buckets, flattened
+        starts = self._bucket_start[buckets]
+        counts = self._bucket_start[buckets + 1] - starts
+        n_candidates = counts.sum()
+        first = np.cumsum(counts) - counts
+        positions = np.arange(n_candidates) - np.repeat(first - starts, counts)
+        query_idx = np.repeat(query_idx, counts)
+        agent_idx = self._bucket_agents[positions]
+
+        dr = np.abs(self._locs[agent_idx, 0] - rs[query_idx])
+        dc = np.abs(self._locs[agent_idx, 1] - cs[query_idx])
+        if metric == "chebyshev":
+            within = np.maximum(dr, dc) <= radius
+        elif metric == "manhattan":
+            within = dr + dc <= radius
+        else:
+            within = dr * dr + dc * dc <= radius * radius
+        return query_idx[within], agent_idx[within]
+
+    def count_within(self, rs, cs, radius, metric="chebyshev"):
+        """Return the number of agents within radius of each of the K locations.
+
+        Arguments are as in agents_within.
+        """
+        query_idx, _ = self.agents_within(rs, cs, radius, metric=metric)
+        return np.bincount(query_idx, minlength=np.size(rs))
+
+    # State
+    # -----
+
+    def get_state(self):
+        """Return a copy of the agent locations."""
+        return self._locs.copy()
+
+    def set_state(self, state):
+        """Restore the agent locations from the output of get_state."""
+        self._locs[:] = state
+        self._stale = True
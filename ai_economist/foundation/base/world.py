@@ -5,10 +5,16 @@
 # or https://opensource.org/licenses/BSD-3-Clause
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 from ai_economist.foundation.agents import agent_registry
+from ai_economist.foundation.base.snapshot import copy_state, freeze
+from ai_economist.foundation.base.spatial_hash import SpatialHash
 from ai_economist.foundation.entities import landmark_registry, resource_registry
 
+# Owner-map value of locations where several agents own private landmarks
+_CONTESTED = -2
+
 
 class Maps:
     """Manages the spatial configuration of the world as a set of entity maps.
@@ -54,12 +60,9 @@ class Maps:
 
         self._map_keys = []
 
-        self._accessibility_lookup = {}
-
         for resource in self.resources:
             resource_cls = resource_registry.get(resource)
             if resource_cls.collectible:
-                self._maps[resource] = np.zeros(shape=self.size)
                 self._resources.append(resource)
                 self._map_keys.append(resource)
 
@@ -69,74 +72,133 @@ class Maps:
             dummy_landmark = landmark_registry.get(landmark)()
 
             if dummy_landmark.public:
-                self._maps[landmark] = np.zeros(shape=self.size)
                 self._public.append(landmark)
                 self._map_keys.append(landmark)
 
             elif dummy_landmark.blocking:
-                self._maps[landmark] = np.zeros(shape=self.size)
                 self._blocked.append(landmark)
                 self._map_keys.append(landmark)
-                self._accessibility_lookup[landmark] = len(self._accessibility_lookup)
 
             elif dummy_landmark.private:
                 self._private_landmark_types.append(landmark)
-                self._maps[landmark] = dict(
-                    owner=-np.ones(shape=self.size, dtype=np.int16),
-                    health=np.zeros(shape=self.size),
-                )
                 self._private.append(landmark)
                 self._map_keys.append(landmark)
-                self._accessibility_lookup[landmark] = len(self._accessibility_lookup)
 
             else:
                 raise NotImplementedError
 
-        self._idx_map = np.stack(
-            [i * np.ones(shape=self.size) for i in range(self.n_agents)]
-        )
-        self._idx_array = np.arange(self.n_agents)
-        if self._accessibility_lookup:
-            self._accessibility = np.ones(
-                shape=[len(self._accessibility_lookup), self.n_agents] + self.size,
-                dtype=bool,
-            )
-            self._net_accessibility = None
-        else:
-            self._accessibility = None
-            self._net_accessibility = np.ones(
-                shape=[self.n_agents] + self.size, dtype=bool
+        # Index of each map in state (and of each private landmark in owner_state)
+        self._channels = {key: i for i, key in enumerate(self._map_keys)}
+        self._owner_channels = {
+            key: i for i, key in enumerate(self._private_landmark_types)
+        }
+        # Maps that can be written point-wise without updating accessibility
+        self._passable_channels = freeze(
+            np.array(
+                [k in self._resources or k in self._public for k in self._map_keys]
             )
+        )
 
+        self._idx_array = freeze(np.arange(self.n_agents))
         self._agent_locs = [None for _ in range(self.n_agents)]
-        self._unoccupied = np.ones(self.size, dtype=bool)
+        # Bucketed index of the agent locations, for batched neighbor queries
+        self.spatial_hash = SpatialHash(self.size, self.n_agents)
+        self._init_storage()
+
+    def _init_storage(self):
+        """Allocate the storage of the maps, accessibility and occupancy."""
+        self._pad = None
+        self._allocate_maps(pad=0)
+
+        # Accessibility is derived from two [H, W] maps, which are updated
+        # incrementally as landmarks are placed or removed:
+        #  - _blocked_map flags the locations holding a blocking landmark;
+        #  - _owner_map holds the owner of the private landmarks at each location
+        #    (-1 if none, _CONTESTED if several agents own landmarks there).
+        # Location [r, c] is accessible to agent i if it is not blocked and its
+        # owner is -1 or i. The [n_agents, H, W] accessibility tensor is only built
+        # when requested and then kept up to date cell by cell.
+        self._blocked_map = np.zeros(self.size, dtype=bool)
+        self._owner_map = -np.ones(self.size, dtype=np.int16)
+        self._net_accessibility = None
+
+    def _allocate_maps(self, pad):
+        """(Re)allocate the map tensors with pad locations of padding on each side.
+
+        All the maps are channels of a single float32 tensor (ordered as the map keys,
+        plus a last channel that is 1 inside the world and 0 in the padding). The
+        owners of private landmarks and the index of the agent at each location
+        (-1 where unoccupied) are the channels of a parallel int16 tensor (-1 in the
+        padding). State, owner_state, loc_map and the entries of self._maps are
+        views of the inside of these tensors, so the maps are updated in place and
+        the padding lets observation windows be read without copying the maps.
+        """
+        h, w = self.size
+        inside = (slice(pad, pad + h), slice(pad, pad + w))
+        padded_state = np.zeros(
+            [len(self._map_keys) + 1, h + 2 * pad, w + 2 * pad], dtype=np.float32
+        )
+        padded_state[(-1,) + inside] = 1
+        padded_idx = -np.ones(
+            [len(self._private_landmark_types) + 1, h + 2 * pad, w + 2 * pad],
+            dtype=np.int16,
+        )
+        if self._pad is not None:
+            padded_state[(slice(0, -1),) + inside] = self._state
+            padded_idx[(slice(None),) + inside] = self._padded_idx[
+                (slice(None),) + self._inside
+            ]
+
+        self._pad = pad
+        self._inside = inside
+        self._padded_state = padded_state
+        self._padded_idx = padded_idx
+        self._state = padded_state[(slice(0, -1),) + inside]
+        self._owner_state = padded_idx[(slice(0, -1),) + inside]
+        self._loc_map = padded_idx[(-1,) + inside]
+        for channel, key in enumerate(self._map_keys):
+            if key in self._private_landmark_types:
+                self._maps[key] = dict(
+                    owner=self._owner_state[self._private_landmark_types.index(key)],
+                    health=self._state[channel],
+                )
+            else:
+                self._maps[key] = self._state[channel]
+
+    def reserve_window_padding(self, half_width):
+        """Pad the maps so that windows up to half_width are read without copies.
+
+        This reallocates the maps, so it should be called before holding onto any
+        of them (e.g. when constructing the scenario). Windows wider than the
+        padding trigger the reallocation otherwise.
+        """
+        if half_width > self._pad:
+            self._allocate_maps(pad=half_width)
 
     def clear(self, entity_name=None):
         """Clear resource and landmark maps."""
         if entity_name is not None:
             assert entity_name in self._maps
-            if entity_name in self._private_landmark_types:
-                self._maps[entity_name] = dict(
-                    owner=-np.ones(shape=self.size, dtype=np.int16),
-                    health=np.zeros(shape=self.size),
-                )
-            else:
-                self._maps[entity_name] *= 0
-
+            self._clear_map(entity_name)
         else:
             for name in self.keys():
-                self.clear(entity_name=name)
+                self._clear_map(name)
+        self._update_accessibility()
 
-        if self._accessibility is not None:
-            self._accessibility = np.ones_like(self._accessibility)
-            self._net_accessibility = None
+    def _clear_map(self, entity_name):
+        if entity_name in self._private_landmark_types:
+            self._maps[entity_name]["owner"][:] = -1
+            self._maps[entity_name]["health"][:] = 0
+        else:
+            self._maps[entity_name][:] = 0
 
     def clear_agent_loc(self, agent=None):
         """Remove agents or agent from the world map."""
         # Clear all agent locations
         if agent is None:
             self._agent_locs = [None for _ in range(self.n_agents)]
-            self._unoccupied[:, :] = 1
+            self._loc_map[:, :] = -1
+            self.spatial_hash.clear_loc()
 
         # Clear the location of the provided agent
         else:
@@ -144,8 +206,9 @@ class Maps:
             if self._agent_locs[i] is None:
                 return
             r, c = self._agent_locs[i]
-            self._unoccupied[r, c] = 1
+            self._loc_map[r, c] = -1
             self._agent_locs[i] = None
+            self.spatial_hash.clear_loc(i)
 
     def set_agent_loc(self, agent, r, c):
         """Set the location of agent to [r, c].
@@ -164,13 +227,14 @@ class Maps:
                 return
             # Make the location the agent is currently at as unoccupied
             # (since the agent is going to move)
-            self._unoccupied[curr_r, curr_c] = 1
+            self._loc_map[curr_r, curr_c] = -1
 
         # Set the agent location to the specified coordinates
         # and update the occupation map
         agent.state["loc"] = [r, c]
         self._agent_locs[i] = [r, c]
-        self._unoccupied[r, c] = 0
+        self._loc_map[r, c] = i
+        self.spatial_hash.set_loc(i, r, c)
 
     def keys(self):
         """Return an iterable over map keys."""
@@ -208,24 +272,16 @@ class Maps:
             if len(tmp) > 0:
                 assert np.min(tmp) >= 0
 
-            self._maps[entity_name] = dict(owner=o, health=h)
-
-            owned_by_agent = o[None] == self._idx_map
-            owned_by_none = o[None] == -1
-            self._accessibility[
-                self._accessibility_lookup[entity_name]
-            ] = np.logical_or(owned_by_agent, owned_by_none)
-            self._net_accessibility = None
+            self._maps[entity_name]["owner"][:] = o
+            self._maps[entity_name]["health"][:] = h
+            self._update_accessibility()
 
         else:
             assert self.get(entity_name).shape == map_state.shape
-            self._maps[entity_name] = np.maximum(0, map_state)
+            self._maps[entity_name][:] = np.maximum(0, map_state)
 
             if entity_name in self._blocked:
-                self._accessibility[
-                    self._accessibility_lookup[entity_name]
-                ] = np.repeat(map_state[None] == 0, self.n_agents, axis=0)
-                self._net_accessibility = None
+                self._update_accessibility()
 
     def set_add(self, entity_name, map_state):
         """Add map_state to the existing map for entity_name."""
@@ -237,6 +293,34 @@ class Maps:
         point_map = self.get(entity_name, **kwargs)
         return point_map[r, c]
 
+    def channel(self, entity_name):
+        """Return the index of the map of entity_name in state."""
+        return self._channels[entity_name]
+
+    def get_points(self, channels, rs, cs):
+        """Return the values of the given state channels at the locations [rs, cs].
+
+        Args:
+            channels (ndarray): Channel indices (see channel).
+            rs (ndarray): Row coordinates.
+            cs (ndarray): Column coordinates. The three arrays are broadcast
+                together and the locations must be inside of the world.
+
+        Returns:
+            values (ndarray): float32 array with the broadcast shape.
+        """
+        return self._state[channels, rs, cs]
+
+    def set_points(self, channels, rs, cs, values):
+        """Set the values of the given state channels at the locations [rs, cs].
+
+        Only resource and public landmark channels can be set this way (these do
+        not affect accessibility). Arguments are as in get_points, with values
+        broadcast with them as well. Negative values are set to 0.
+        """
+        assert self._passable_channels[channels].all()
+        self._state[channels, rs, cs] = np.maximum(0, values)
+
     def set_point(self, entity_name, r, c, val, owner=None):
         """Set the entity state at the specified coordinates."""
         if entity_name in self._private_landmark_types:
@@ -250,22 +334,13 @@ class Maps:
             else:
                 o[r, c] = int(owner)
 
-            self._maps[entity_name]["owner"] = o
-            self._maps[entity_name]["health"] = h
-
-            self._accessibility[
-                self._accessibility_lookup[entity_name], :, r, c
-            ] = np.logical_or(o[r, c] == self._idx_array, o[r, c] == -1).astype(bool)
-            self._net_accessibility = None
+            self._update_accessibility_at(r, c)
 
         else:
             self._maps[entity_name][r, c] = np.maximum(0, val)
 
             if entity_name in self._blocked:
-                self._accessibility[
-                    self._accessibility_lookup[entity_name]
-                ] = np.repeat(np.array([val]) == 0, self.n_agents, axis=0)
-                self._net_accessibility = None
+                self._update_accessibility_at(r, c)
 
     def set_point_add(self, entity_name, r, c, value, **kwargs):
         """Add value to the existing entity state at the specified coordinates."""
@@ -279,7 +354,74 @@ class Maps:
 
     def is_accessible(self, r, c, agent_id):
         """Return True if agent with id agent_id can occupy the location [r, c]."""
-        return bool(self.accessibility[agent_id, r, c])
+        if self._blocked_map[r, c]:
+            return False
+        owner = self._owner_map[r, c]
+        return bool(owner == -1 or owner == agent_id)
+
+    def accessible_at(self, agent_ids, rs, cs):
+        """Vectorized version of is_accessible.
+
+        Args:
+            agent_ids (ndarray): Agent indices.
+            rs (ndarray): Row coordinates.
+            cs (ndarray): Column coordinates. The three arrays are broadcast
+                together.
+
+        Returns:
+            accessible (ndarray): Boolean array with the broadcast shape. Locations
+                outside of the world are not accessible.
+        """
+        agent_ids, rs, cs = np.broadcast_arrays(agent_ids, rs, cs)
+        valid = (rs >= 0) & (rs < self.sz_h) & (cs >= 0) & (cs < self.sz_w)
+        rs = np.where(valid, rs, 0)
+        cs = np.where(valid, cs, 0)
+        owner = self._owner_map[rs, cs]
+        return (
+            valid & ~self._blocked_map[rs, cs] & ((owner == -1) | (owner == agent_ids))
+        )
+
+    def _update_accessibility(self):
+        """Rebuild the blocked and owner maps from the landmark maps."""
+        blocked = np.zeros(self.size, dtype=bool)
+        for landmark in self._blocked:
+            blocked |= self._maps[landmark] > 0
+        owner = -np.ones(self.size, dtype=np.int16)
+        for landmark in self._private:
+            o = self._maps[landmark]["owner"]
+            owner = np.where(
+                owner == -1,
+                o,
+                np.where((o == -1) | (o == owner), owner, _CONTESTED),
+            ).astype(np.int16)
+        self._blocked_map = blocked
+        self._owner_map = owner
+        self._net_accessibility = None
+
+    def _update_accessibility_at(self, r, c):
+        """Update the blocked and owner maps (and accessibility) at [r, c]."""
+        self._blocked_map[r, c] = any(
+            self._maps[landmark][r, c] > 0 for landmark in self._blocked
+        )
+        owners = {
+            int(self._maps[landmark]["owner"][r, c]) for landmark in self._private
+        }
+        owners.discard(-1)
+        if not owners:
+            owner = -1
+        elif len(owners) == 1:
+            owner = owners.pop()
+        else:
+            owner = _CONTESTED
+        self._owner_map[r, c] = owner
+
+        if self._net_accessibility is not None:
+            if self._blocked_map[r, c]:
+                self._net_accessibility[:, r, c] = False
+            elif owner == -1:
+                self._net_accessibility[:, r, c] = True
+            else:
+                self._net_accessibility[:, r, c] = self._idx_array == owner
 
     def location_resources(self, r, c):
         """Return {resource: health} dictionary for any resources at location [r, c]."""
@@ -292,16 +434,96 @@ class Maps:
         tmp = {k: self.get_point(k, r, c) for k in self.keys()}
         return {k: v for k, v in tmp.items() if k not in self._resources and v > 0}
 
+    def is_unoccupied(self, r, c):
+        """Return True if no agent occupies the location [r, c]."""
+        return bool(self._loc_map[r, c] == -1)
+
+    def unoccupied_at(self, rs, cs):
+        """Vectorized version of is_unoccupied.
+
+        Args:
+            rs (ndarray): Row coordinates.
+            cs (ndarray): Column coordinates (broadcast with rs).
+
+        Returns:
+            unoccupied (ndarray): Boolean array with the broadcast shape. Locations
+                outside of the world are not unoccupied.
+        """
+        rs, cs = np.broadcast_arrays(rs, cs)
+        valid = (rs >= 0) & (rs < self.sz_h) & (cs >= 0) & (cs < self.sz_w)
+        loc_idx = self._loc_map[np.where(valid, rs, 0), np.where(valid, cs, 0)]
+        return valid & (loc_idx == -1)
+
+    def window(self, r, c, half_width):
+        """Return the maps in the square window of the given half width around [r, c].
+
+        Args:
+            r (int): Row of the center of the window.
+            c (int): Column of the center of the window.
+            half_width (int): Half width w of the (2w+1) x (2w+1) window.
+
+        Returns:
+            maps_window (ndarray): [n_maps + 1, 2w+1, 2w+1] float32 array with the
+                map channels (as in state), plus a last channel that is 1 inside the
+                world and 0 outside of it. The maps are 0 outside of the world.
+            idx_window (ndarray): [n_private_landmarks + 1, 2w+1, 2w+1] int16 array
+                with the owner channels (as in owner_state), plus a last channel with
+                the index of the agent at each location. Both are -1 where there is
+                no owner or agent, including outside of the world.
+        """
+        maps_windows, idx_windows = self.windows([r], [c], half_width)
+        return maps_windows[0], idx_windows[0]
+
+    def windows(self, rs, cs, half_width):
+        """Batched version of window: return the windows around several locations.
+
+        Args:
+            rs (ndarray): Rows of the centers of the windows.
+            cs (ndarray): Columns of the centers of the windows.
+            half_width (int): Half width w of the (2w+1) x (2w+1) windows.
+
+        Returns:
+            maps_windows (ndarray): [n_windows, n_maps + 1, 2w+1, 2w+1] float32 array.
+            idx_windows (ndarray): [n_windows, n_private_landmarks + 1, 2w+1, 2w+1]
+                int16 array. See window for the content of each window.
+        """
+        self.reserve_window_padding(half_width)
+        k = 2 * half_width + 1
+        offset = self._pad - half_width
+        rs = np.asarray(rs) + offset
+        cs = np.asarray(cs) + offset
+        # [H', W', channels, k, k] views of all the windows of the padded maps
+        maps_view = np.moveaxis(
+            sliding_window_view(self._padded_state, (k, k), axis=(1, 2)), 0, 2
+        )
+        idx_view = np.moveaxis(
+            sliding_window_view(self._padded_idx, (k, k), axis=(1, 2)), 0, 2
+        )
+        return maps_view[rs, cs], idx_view[rs, cs]
+
     @property
     def unoccupied(self):
         """Return a boolean map indicating which locations are unoccupied."""
-        return self._unoccupied
+        return self._loc_map == -1
+
+    @property
+    def loc_map(self):
+        """Return a map indicating the agent index occupying each location.
+
+        Locations with a value of -1 are not occupied by an agent.
+
+        Note: This map is kept up to date as agents move, it is not a copy."""
+        return self._loc_map
 
     @property
     def accessibility(self):
-        """Return a boolean map indicating which locations are accessible."""
+        """Return a [n_agents, H, W] boolean map indicating which locations are
+        accessible to each agent."""
         if self._net_accessibility is None:
-            self._net_accessibility = self._accessibility.prod(axis=0).astype(bool)
+            owner = self._owner_map[None]
+            self._net_accessibility = ~self._blocked_map[None] & (
+                (owner == -1) | (owner == self._idx_array[:, None, None])
+            )
         return self._net_accessibility
 
     @property
@@ -309,25 +531,504 @@ class Maps:
         """Return a boolean map indicating which locations are empty.
 
         Empty locations have no landmarks or resources."""
-        return self.state.sum(axis=0) == 0
+        return ~self._state.any(axis=0)
 
     @property
     def state(self):
-        """Return the concatenated maps of landmark and resources."""
-        return np.stack([self.get(k) for k in self.keys()]).astype(np.float32)
+        """Return the concatenated maps of landmark and resources.
+
+        Note: This is the [n_maps, H, W] tensor holding the maps, not a copy. It is
+        updated in place, so copy it if it needs to be kept around."""
+        return self._state
 
     @property
     def owner_state(self):
-        """Return the concatenated ownership maps of private landmarks."""
-        return np.stack(
-            [self.get(k, owner=True) for k in self._private_landmark_types]
-        ).astype(np.int16)
+        """Return the concatenated ownership maps of private landmarks.
+
+        Note: Like state, this is not a copy."""
+        return self._owner_state
 
     @property
     def state_dict(self):
         """Return a dictionary of the map states."""
         return self._maps
 
+    def get_state(self):
+        """Return a copy of the mutable spatial state (see World.get_state)."""
+        return dict(
+            state=self._state.copy(),
+            owner_state=self._owner_state.copy(),
+            blocked_map=self._blocked_map.copy(),
+            owner_map=self._owner_map.copy(),
+            net_accessibility=copy_state(self._net_accessibility),
+            agent_locs=copy_state(self._agent_locs),
+            spatial_hash=self.spatial_hash.get_state(),
+            loc_map=self._loc_map.copy(),
+        )
+
+    def set_state(self, state):
+        """Restore the spatial state from the output of get_state."""
+        self._state[:] = state["state"]
+        self._owner_state[:] = state["owner_state"]
+        self._blocked_map = state["blocked_map"].copy()
+        self._owner_map = state["owner_map"].copy()
+        self._net_accessibility = copy_state(state["net_accessibility"])
+        self._agent_locs = copy_state(state["agent_locs"])
+        self.spatial_hash.set_state(state["spatial_hash"])
+        self._loc_map[:] = state["loc_map"]
+
+
+class SparseMaps(Maps):
+    """Maps backend that only stores the non-empty locations of the world.
+
+    Meant for large worlds where landmarks and resources cover a small fraction of
+    the locations. Rather than in dense [H, W] arrays, the map values, the owners
+    of private landmarks, the blocked locations and the agent locations are stored
+    in dictionaries keyed by (row, column). Point queries and updates (get_point,
+    set_point, location_resources, is_accessible, ...) and observation windows
+    do not depend on the size of the world, and memory scales with the number of
+    non-empty locations. Whole-map accessors (get, state, owner_state, empty,
+    accessibility, unoccupied, ...) build dense arrays on demand, which takes time
+    and memory proportional to the area of the world.
+
+    The arguments are the same as for Maps.
+    """
+
+    def _init_storage(self):
+        """Allocate the storage of the maps, accessibility and occupancy."""
+        self._blocked_channels = [self._channels[k] for k in self._blocked]
+
+        # {(r, c): [n_maps] float32 array of the map values} of non-empty locations
+        self._cells = {}
+        # {(r, c): [n_private_landmarks] int16 array of owners} of owned locations
+        self._cell_owners = {}
+        # Blocked locations and {(r, c): owner} of owned locations (see Maps)
+        self._blocked_cells = set()
+        self._owner_cells = {}
+        # {(r, c): agent_idx} of occupied locations
+        self._occupied = {}
+
+    def _set_cell(self, loc, channel, value):
+        values = self._cells.get(loc)
+        if values is None:
+            if value == 0:
+                return
+            values = np.zeros(len(self._map_keys), dtype=np.float32)
+            self._cells[loc] = values
+        values[channel] = value
+        if not values.any():
+            del self._cells[loc]
+
+    def _set_cell_owner(self, loc, channel, owner):
+        owners = self._cell_owners.get(loc)
+        if owners is None:
+            if owner == -1:
+                return
+            owners = -np.ones(len(self._private_landmark_types), dtype=np.int16)
+            self._cell_owners[loc] = owners
+        owners[channel] = owner
+        if (owners == -1).all():
+            del self._cell_owners[loc]
+
+    def _to_dense(self, cells, n_channels, fill, dtype, channel=None):
+        """Dense [n_channels, H, W] array of cells (or [H, W] array of channel)."""
+        shape = self.size if channel is not None else [n_channels] + self.size
+        dense = np.full(shape, fill, dtype=dtype)
+        if cells:
+            rs, cs = np.array(list(cells.keys())).T
+            values = np.array(list(cells.values()))
+            if channel is None:
+                dense[:, rs, cs] = values.T
+            else:
+                dense[rs, cs] = values[:, channel]
+        return dense
+
+    def clear(self, entity_name=None):
+        """Clear resource and landmark maps."""
+        if entity_name is not None:
+            assert entity_name in self._channels
+            self._clear_map(entity_name)
+        else:
+            self._cells = {}
+            self._cell_owners = {}
+        self._update_accessibility()
+
+    def _clear_map(self, entity_name):
+        channel = self._channels[entity_name]
+        for loc in list(self._cells):
+            self._set_cell(loc, channel, 0)
+        if entity_name in self._private_landmark_types:
+            owner_channel = self._owner_channels[entity_name]
+            for loc in list(self._cell_owners):
+                self._set_cell_owner(loc, owner_channel, -1)
+
+    def clear_agent_loc(self, agent=None):
+        """Remove agents or agent from the world map."""
+        if agent is None:
+            self._agent_locs = [None for _ in range(self.n_agents)]
+            self._occupied = {}
+            self.spatial_hash.clear_loc()
+        else:
+            i = agent.idx
+            if self._agent_locs[i] is None:
+                return
+            del self._occupied[tuple(self._agent_locs[i])]
+            self._agent_locs[i] = None
+            self.spatial_hash.clear_loc(i)
+
+    def set_agent_loc(self, agent, r, c):
+        """Set the location of agent to [r, c] (see Maps.set_agent_loc)."""
+        assert (0 <= r < self.size[0]) and (0 <= c < self.size[1])
+        i = agent.idx
+        if self._agent_locs[i] is not None:
+            if tuple(self._agent_locs[i]) == (r, c):
+                return
+            del self._occupied[tuple(self._agent_locs[i])]
+        agent.state["loc"] = [r, c]
+        self._agent_locs[i] = [r, c]
+        self._occupied[(int(r), int(c))] = i
+        self.spatial_hash.set_loc(i, r, c)
+
+    def keys(self):
+        """Return an iterable over map keys."""
+        return self._channels.keys()
+
+    def values(self):
+        """Return an iterable over (dense copies of the) map values."""
+        return self.state_dict.values()
+
+    def items(self):
+        """Return an iterable over map (key, dense copy of the value) pairs."""
+        return self.state_dict.items()
+
+    def get(self, entity_name, owner=False):
+        """Return a dense copy of the map or ownership for entity_name."""
+        assert entity_name in self._channels
+        if entity_name in self._private_landmark_types and owner:
+            return self._to_dense(
+                self._cell_owners,
+                len(self._private_landmark_types),
+                -1,
+                np.int16,
+                channel=self._owner_channels[entity_name],
+            )
+        return self._to_dense(
+            self._cells,
+            len(self._map_keys),
+            0,
+            np.float32,
+            channel=self._channels[entity_name],
+        )
+
+    def set(self, entity_name, map_state):
+        """Set the map for entity_name from dense arrays (see Maps.set)."""
+        assert entity_name in self._channels
+        if entity_name in self._private_landmark_types:
+            assert "owner" in map_state
+            assert map_state["owner"].shape == tuple(self.size)
+            assert "health" in map_state
+            assert map_state["health"].shape == tuple(self.size)
+
+            h = np.maximum(0.0, map_state["health"])
+            o = map_state["owner"].astype(np.int16)
+
+            o[h <= 0] = -1
+            tmp = o[h > 0]
+            if len(tmp) > 0:
+                assert np.min(tmp) >= 0
+
+            self._set_dense(entity_name, h.astype(np.float32), o)
+            self._update_accessibility()
+
+        else:
+            assert map_state.shape == tuple(self.size)
+            self._set_dense(entity_name, np.maximum(0, map_state).astype(np.float32))
+
+            if entity_name in self._blocked:
+                self._update_accessibility()
+
+    def _set_dense(self, entity_name, values, owners=None):
+        """Write the locations where values (and owners) differ from the maps."""
+        channel = self._channels[entity_name]
+        changed = values != self.get(entity_name)
+        if owners is not None:
+            changed |= owners != self.get(entity_name, owner=True)
+        for r, c in zip(*np.nonzero(changed)):
+            loc = (int(r), int(c))
+            self._set_cell(loc, channel, values[r, c])
+            if owners is not None:
+                self._set_cell_owner(
+                    loc, self._owner_channels[entity_name], owners[r, c]
+                )
+
+    def get_point(self, entity_name, r, c, owner=False):
+        """Return the entity state at the specified coordinates."""
+        assert entity_name in self._channels
+        loc = (int(r), int(c))
+        if entity_name in self._private_landmark_types and owner:
+            owners = self._cell_owners.get(loc)
+            if owners is None:
+                return np.int16(-1)
+            return owners[self._owner_channels[entity_name]]
+        values = self._cells.get(loc)
+        if values is None:
+            return np.float32(0)
+        return values[self._channels[entity_name]]
+
+    def get_points(self, channels, rs, cs):
+        """Vectorized point query of state channels (see Maps.get_points)."""
+        channels, rs, cs = np.broadcast_arrays(channels, rs, cs)
+        values = [
+            self._cells[(r, c)][channel] if (r, c) in self._cells else 0
+            for channel, r, c in zip(
+                channels.ravel().tolist(), rs.ravel().tolist(), cs.ravel().tolist()
+            )
+        ]
+        return np.array(values, dtype=np.float32).reshape(rs.shape)
+
+    def set_points(self, channels, rs, cs, values):
+        """Vectorized point update of state channels (see Maps.set_points)."""
+        channels, rs, cs, values = np.broadcast_arrays(channels, rs, cs, values)
+        assert self._passable_channels[channels].all()
+        for channel, r, c, value in zip(
+            channels.ravel().tolist(),
+            rs.ravel().tolist(),
+            cs.ravel().tolist(),
+            values.ravel().tolist(),
+        ):
+            self._set_cell((r, c), channel, max(0, value))
+
+    def set_point(self, entity_name, r, c, val, owner=None):
+        """Set the entity state at the specified coordinates."""
+        loc = (int(r), int(c))
+        channel = self._channels[entity_name]
+        if entity_name in self._private_landmark_types:
+            assert owner is not None
+            curr_owner = self.get_point(entity_name, r, c, owner=True)
+            assert curr_owner == -1 or curr_owner == int(owner)
+            h = np.float32(np.maximum(0, val))
+            self._set_cell(loc, channel, h)
+            self._set_cell_owner(
+                loc, self._owner_channels[entity_name], -1 if h == 0 else int(owner)
+            )
+            self._update_accessibility_at(r, c)
+
+        else:
+            self._set_cell(loc, channel, np.maximum(0, val))
+
+            if entity_name in self._blocked:
+                self._update_accessibility_at(r, c)
+
+    def is_accessible(self, r, c, agent_id):
+        """Return True if agent with id agent_id can occupy the location [r, c]."""
+        loc = (int(r), int(c))
+        if loc in self._blocked_cells:
+            return False
+        owner = self._owner_cells.get(loc, -1)
+        return owner == -1 or owner == agent_id
+
+    def accessible_at(self, agent_ids, rs, cs):
+        """Vectorized version of is_accessible (see Maps.accessible_at)."""
+        agent_ids, rs, cs = np.broadcast_arrays(agent_ids, rs, cs)
+        accessible = [
+            0 <= r < self.sz_h and 0 <= c < self.sz_w and self.is_accessible(r, c, i)
+            for i, r, c in zip(agent_ids.ravel(), rs.ravel(), cs.ravel())
+        ]
+        return np.array(accessible, dtype=bool).reshape(rs.shape)
+
+    @staticmethod
+    def _combined_owner(owners):
+        owners = set(owners[owners >= 0].tolist())
+        if not owners:
+            return -1
+        if len(owners) == 1:
+            return owners.pop()
+        return _CONTESTED
+
+    def _update_accessibility(self):
+        """Rebuild the blocked and owned locations from the maps."""
+        blocked_channels = self._blocked_channels
+        self._blocked_cells = (
+            {
+                loc
+                for loc, values in self._cells.items()
+                if values[blocked_channels].any()
+            }
+            if blocked_channels
+            else set()
+        )
+        self._owner_cells = {
+            loc: self._combined_owner(owners)
+            for loc, owners in self._cell_owners.items()
+        }
+
+    def _update_accessibility_at(self, r, c):
+        """Update the blocked and owned locations at [r, c]."""
+        loc = (int(r), int(c))
+        values = self._cells.get(loc)
+        if values is not None and values[self._blocked_channels].any():
+            self._blocked_cells.add(loc)
+        else:
+            self._blocked_cells.discard(loc)
+        owners = self._cell_owners.get(loc)
+        owner = -1 if owners is None else self._combined_owner(owners)
+        if owner == -1:
+            self._owner_cells.pop(loc, None)
+        else:
+            self._owner_cells[loc] = owner
+
+    def location_resources(self, r, c):
+        """Return {resource: health} dictionary for any resources at location [r, c]."""
+        values = self._cells.get((int(r), int(c)))
+        if values is None:
+            return {}
+        return {
+            k: values[self._channels[k]]
+            for k in self._resources
+            if values[self._channels[k]] > 0
+        }
+
+    def is_unoccupied(self, r, c):
+        """Return True if no agent occupies the location [r, c]."""
+        return (int(r), int(c)) not in self._occupied
+
+    def unoccupied_at(self, rs, cs):
+        """Vectorized version of is_unoccupied (see Maps.unoccupied_at)."""
+        rs, cs = np.broadcast_arrays(rs, cs)
+        valid = (rs >= 0) & (rs < self.sz_h) & (cs >= 0) & (cs < self.sz_w)
+        return valid & (self.spatial_hash.agents_at(rs, cs) == -1)
+
+    def window(self, r, c, half_width):
+        """Return the maps in the square window around [r, c] (see Maps.window).
+
+        Only the window is made dense: this takes time proportional to its area."""
+        w = half_width
+        maps_window = np.zeros(
+            [len(self._map_keys) + 1, 2 * w + 1, 2 * w + 1], dtype=np.float32
+        )
+        idx_window = -np.ones(
+            [len(self._private_landmark_types) + 1, 2 * w + 1, 2 * w + 1],
+            dtype=np.int16,
+        )
+        cells, cell_owners, occupied = self._cells, self._cell_owners, self._occupied
+        for wr, rr in enumerate(range(r - w, r + w + 1)):
+            if not 0 <= rr < self.sz_h:
+                continue
+            for wc, cc in enumerate(range(c - w, c + w + 1)):
+                if not 0 <= cc < self.sz_w:
+                    continue
+                loc = (rr, cc)
+                maps_window[-1, wr, wc] = 1
+                values = cells.get(loc)
+                if values is not None:
+                    maps_window[:-1, wr, wc] = values
+                owners = cell_owners.get(loc)
+                if owners is not None:
+                    idx_window[:-1, wr, wc] = owners
+                agent_idx = occupied.get(loc)
+                if agent_idx is not None:
+                    idx_window[-1, wr, wc] = agent_idx
+        return maps_window, idx_window
+
+    def windows(self, rs, cs, half_width):
+        """Batched version of window (see Maps.windows)."""
+        windows = [self.window(r, c, half_width) for r, c in zip(rs, cs)]
+        return (
+            np.stack([maps_window for maps_window, _ in windows]),
+            np.stack([idx_window for _, idx_window in windows]),
+        )
+
+    def reserve_window_padding(self, half_width):
+        """Windows are built from the sparse maps: there is nothing to reserve."""
+        return
+
+    @property
+    def unoccupied(self):
+        """Return a (dense) boolean map indicating which locations are unoccupied."""
+        return self.loc_map == -1
+
+    @property
+    def loc_map(self):
+        """Return a (dense) map indicating the agent index occupying each location.
+
+        Locations with a value of -1 are not occupied by an agent."""
+        loc_map = -np.ones(self.size, dtype=np.int16)
+        for (r, c), agent_idx in self._occupied.items():
+            loc_map[r, c] = agent_idx
+        return loc_map
+
+    @property
+    def accessibility(self):
+        """Return a dense [n_agents, H, W] boolean map indicating which locations
+        are accessible to each agent."""
+        accessible = np.ones([self.n_agents] + self.size, dtype=bool)
+        for r, c in self._blocked_cells:
+            accessible[:, r, c] = False
+        for (r, c), owner in self._owner_cells.items():
+            accessible[:, r, c] &= self._idx_array == owner
+        return accessible
+
+    @property
+    def empty(self):
+        """Return a (dense) boolean map indicating which locations are empty.
+
+        Empty locations have no landmarks or resources."""
+        empty = np.ones(self.size, dtype=bool)
+        if self._cells:
+            rs, cs = np.array(list(self._cells.keys())).T
+            empty[rs, cs] = False
+        return empty
+
+    @property
+    def state(self):
+        """Return a dense copy of the concatenated maps of landmark and resources."""
+        return self._to_dense(self._cells, len(self._map_keys), 0, np.float32)
+
+    @property
+    def owner_state(self):
+        """Return a dense copy of the concatenated ownership maps of private
+        landmarks."""
+        return self._to_dense(
+            self._cell_owners, len(self._private_landmark_types), -1, np.int16
+        )
+
+    @property
+    def state_dict(self):
+        """Return a dictionary of (dense copies of) the map states."""
+        state, owner_state = self.state, self.owner_state
+        state_dict = {}
+        for key, channel in self._channels.items():
+            if key in self._private_landmark_types:
+                state_dict[key] = dict(
+                    owner=owner_state[self._owner_channels[key]],
+                    health=state[channel],
+                )
+            else:
+                state_dict[key] = state[channel]
+        return state_dict
+
+    def get_state(self):
+        """Return a copy of the mutable spatial state (see World.get_state)."""
+        return dict(
+            cells=copy_state(self._cells),
+            cell_owners=copy_state(self._cell_owners),
+            blocked_cells=set(self._blocked_cells),
+            owner_cells=dict(self._owner_cells),
+            occupied=dict(self._occupied),
+            agent_locs=copy_state(self._agent_locs),
+            spatial_hash=self.spatial_hash.get_state(),
+        )
+
+    def set_state(self, state):
+        """Restore the spatial state from the output of get_state."""
+        self._cells = copy_state(state["cells"])
+        self._cell_owners = copy_state(state["cell_owners"])
+        self._blocked_cells = set(state["blocked_cells"])
+        self._owner_cells = dict(state["owner_cells"])
+        self._occupied = dict(state["occupied"])
+        self._agent_locs = copy_state(state["agent_locs"])
+        self.spatial_hash.set_state(state["spatial_hash"])
+
 
 class World:
     """Manages the environment's spatial- and agent-states.
@@ -358,6 +1059,8 @@ class World:
             (see BaseEnvironment in base_env.py).
         multi_action_mode_planner (bool): Whether the planner agent uses multi action
             mode (see BaseEnvironment in base_env.py).
+        sparse_maps (bool): Whether to store the maps with the SparseMaps backend
+            rather than with dense arrays. Default is False.
     """
 
     def __init__(
@@ -368,6 +1071,7 @@ class World:
         world_landmarks,
         multi_action_mode_agents,
         multi_action_mode_planner,
+        sparse_maps=False,
     ):
         self.world_size = world_size
         self.n_agents = n_agents
@@ -375,7 +1079,8 @@ class World:
         self.landmarks = world_landmarks
         self.multi_action_mode_agents = bool(multi_action_mode_agents)
         self.multi_action_mode_planner = bool(multi_action_mode_planner)
-        self.maps = Maps(world_size, n_agents, world_resources, world_landmarks)
+        maps_cls = SparseMaps if sparse_maps else Maps
+        self.maps = maps_cls(world_size, n_agents, world_resources, world_landmarks)
 
         mobile_class = agent_registry.get("BasicMobileAgent")
         planner_class = agent_registry.get("BasicPlanner")
@@ -387,6 +1092,12 @@ class World:
 
         self.timestep = 0
 
+        # Random number generator used for all the randomness in the environment
+        # dynamics (components and scenarios should draw from world.rng rather than
+        # from the global np.random). It is (re)set by the environment, which
+        # derives it from its seed (see BaseEnvironment.seed).
+        self.rng = np.random.default_rng()
+
         # CUDA-related attributes (for GPU simulations).
         # These will be set via the env_wrapper, if required.
         self.use_cuda = False
@@ -408,16 +1119,44 @@ class World:
         """Return a map indicating the agent index occupying each location.
 
         Locations with a value of -1 are not occupied by an agent.
+
+        Note: With dense maps, this is the index map maintained by the maps as
+        agents move (see Maps.loc_map), not a copy.
         """
-        idx_map = -np.ones(shape=self.world_size, dtype=np.int16)
-        for agent in self.agents:
-            r, c = agent.loc
-            idx_map[r, c] = int(agent.idx)
-        return idx_map
+        return self.maps.loc_map
+
+    def get_state(self):
+        """
+        Return a copy of the world state: the timestep, random number generator,
+        maps and the state and action of each agent (including the planner).
+        """
+        return dict(
+            timestep=self.timestep,
+            rng=(type(self.rng.bit_generator), self.rng.bit_generator.state),
+            maps=self.maps.get_state(),
+            agents=[
+                (copy_state(agent.state), dict(agent.action))
+                for agent in self.agents + [self.planner]
+            ],
+        )
+
+    def set_state(self, state):
+        """Restore the world state from the output of get_state."""
+        self.timestep = state["timestep"]
+        bit_generator_cls, bit_generator_state = state["rng"]
+        if not isinstance(self.rng.bit_generator, bit_generator_cls):
+            self.rng = np.random.Generator(bit_generator_cls())
+        self.rng.bit_generator.state = bit_generator_state
+        self.maps.set_state(state["maps"])
+        for agent, (agent_state, agent_action) in zip(
+            self.agents + [self.planner], state["agents"]
+        ):
+            agent.state = copy_state(agent_state)
+            agent.action = dict(agent_action)
 
     def get_random_order_agents(self):
         """The agent list in a randomized order."""
-        agent_order = np.random.permutation(self.n_agents)
+        agent_order = self.rng.permutation(self.n_agents)
         agents = self.agents
         return [agents[i] for i in agent_order]
 
@@ -435,10 +1174,24 @@ class World:
         """Return True if location [r, c] is accessible to agent and unoccupied."""
         if not self.is_location_accessible(r, c, agent):
             return False
-        if self.maps.unoccupied[r, c]:
+        if self.maps.is_unoccupied(r, c):
             return True
         return False
 
+    def agents_at(self, rs, cs):
+        """Return the index of the agent at each location [rs, cs] (or -1).
+
+        See SpatialHash.agents_at.
+        """
+        return self.maps.spatial_hash.agents_at(rs, cs)
+
+    def agents_within(self, rs, cs, radius, metric="chebyshev"):
+        """Return the (query_idx, agent_idx) pairs of agents within radius of [rs, cs].
+
+        See SpatialHash.agents_within.
+        """
+        return self.maps.spatial_hash.agents_within(rs, cs, radius, metric=metric)
+
     def clear_agent_locs(self):
         """Take all agents off the board. Useful for resetting."""
         for agent in self.agents:
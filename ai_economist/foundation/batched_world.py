@@ -0,0 +1,493 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Batched gridworld engine: the maps and agent states of many copies of a world,
+stored with a leading environment dimension, and batched versions of the Gather
+and Build dynamics that advance all the copies with one set of NumPy operations.
+
+Resource regeneration works on batched maps through
+scenarios.utils.regeneration (get_source_cells and regenerate_resources).
+
+Example:
+    env.reset()
+    world = BatchedWorld(env.world, n_envs=1024, seed=0)
+    gather = BatchedGather.from_component(env.get_component("Gather"), world)
+    build = BatchedBuild.from_component(env.get_component("Build"), world)
+    source_cells = regeneration.get_source_cells(
+        world.maps, env.layout_specs, ["Wood", "Stone"]
+    )
+    for _ in range(env.episode_length):
+        gather.step(gather_actions)  # [n_envs, n_agents] ints in [0, 4]
+        build.step(build_actions)  # [n_envs, n_agents] ints in [0, 1]
+        regeneration.regenerate_resources(world.maps, world.rng, source_cells)
+"""
+
+import numpy as np
+
+from ai_economist.foundation.base.world import _CONTESTED
+
+
+class BatchedMaps:
+    """
+    The maps of n_envs copies of a world, as [n_envs, ...] arrays.
+
+    The entity maps, their order and their spatial semantics (blocking, private
+    and public landmarks, collectible resources) are those of the template maps.
+    Points are read and written through flat indices into the (contiguous) arrays,
+    which is much faster than indexing their 4 dimensions.
+
+    Args:
+        maps (Maps): Template maps. Every copy starts from their current state.
+        n_envs (int): Number of copies.
+    """
+
+    def __init__(self, maps, n_envs):
+        assert n_envs >= 1
+        self.n_envs = int(n_envs)
+        self.size = list(maps.size)
+        self.sz_h, self.sz_w = self.size
+        self.n_agents = maps.n_agents
+
+        self._map_keys = list(maps.keys())
+        self._channels = dict(maps._channels)
+        self._owner_channels = dict(maps._owner_channels)
+        self._passable_channels = maps._passable_channels
+        self._resources = list(maps._resources)
+        self._blocked = list(maps._blocked)
+        self._private = list(maps._private)
+
+        self.resource_channels = np.array(
+            [self._channels[k] for k in self._resources], dtype=np.intp
+        )
+        self._blocked_channels = np.array(
+            [self._channels[k] for k in self._blocked], dtype=np.intp
+        )
+        self._private_channels = np.array(
+            [self._owner_channels[k] for k in self._private], dtype=np.intp
+        )
+
+        # state: [n_envs, n_maps, H, W] map values (channels ordered as the keys)
+        # owner_state: [n_envs, n_private_landmarks, H, W] landmark owners (or -1)
+        # loc_map: [n_envs, H, W] index of the agent at each location (or -1)
+        self.state = np.zeros([self.n_envs] + list(maps.state.shape), np.float32)
+        self.owner_state = np.zeros(
+            [self.n_envs] + list(maps.owner_state.shape), np.int16
+        )
+        self.loc_map = np.zeros([self.n_envs] + self.size, np.int16)
+        # Accessibility is derived from [n_envs, H, W] blocked and owner maps, as
+        # with Maps (see Maps._init_storage)
+        self._blocked_map = np.zeros([self.n_envs] + self.size, dtype=bool)
+        self._owner_map = np.zeros([self.n_envs] + self.size, dtype=np.int16)
+        for env_idx in range(self.n_envs):
+            self.set_env(env_idx, maps)
+
+    def set_env(self, env_idx, maps):
+        """Copy the state of maps (a Maps object) to the copy with index env_idx."""
+        self.state[env_idx] = maps.state
+        self.owner_state[env_idx] = maps.owner_state
+        self.loc_map[env_idx] = maps.loc_map
+
+        self._blocked_map[env_idx] = (
+            self.state[env_idx, self._blocked_channels] > 0
+        ).any(axis=0)
+        owner = -np.ones(self.size, dtype=np.int16)
+        for o in self.owner_state[env_idx, self._private_channels]:
+            owner = np.where(
+                owner == -1,
+                o,
+                np.where((o == -1) | (o == owner), owner, _CONTESTED),
+            )
+        self._owner_map[env_idx] = owner
+
+    def keys(self):
+        """Return an iterable over map keys."""
+        return list(self._map_keys)
+
+    def channel(self, entity_name):
+        """Return the index of the map of entity_name in state."""
+        return self._channels[entity_name]
+
+    def get(self, entity_name, owner=False):
+        """Return the [n_envs, H, W] map (or ownership) of entity_name (a view)."""
+        if owner:
+            return self.owner_state[:, self._owner_channels[entity_name]]
+        return self.state[:, self._channels[entity_name]]
+
+    def _state_index(self, env_idx, channels, rs, cs):
+        """Flat index of the points [env_idx, channels, rs, cs] of state."""
+        n_channels = self.state.shape[1]
+        return ((env_idx * n_channels + channels) * self.sz_h + rs) * self.sz_w + cs
+
+    def _cell_index(self, env_idx, rs, cs):
+        """Flat index of the locations [env_idx, rs, cs] of [n_envs, H, W] maps."""
+        return (env_idx * self.sz_h + rs) * self.sz_w + cs
+
+    def get_points(self, channels, rs, cs, env_idx):
+        """Return the values of the given state channels at the locations [rs, cs].
+
+        Arguments are as in Maps.get_points, plus the environment indices env_idx
+        (broadcast with the others).
+        """
+        return self.state.reshape(-1).take(self._state_index(env_idx, channels, rs, cs))
+
+    def set_points(self, channels, rs, cs, values, env_idx):
+        """Set the values of the given state channels at the locations [rs, cs].
+
+        Arguments are as in Maps.set_points, plus the environment indices env_idx
+        (broadcast with the others).
+        """
+        assert self._passable_channels[channels].all()
+        index = self._state_index(env_idx, channels, rs, cs)
+        self.state.reshape(-1)[index] = np.maximum(0, values)
+
+    def create_landmarks(self, landmark_name, rs, cs, env_idx, owners=None):
+        """Place landmarks at the locations [env_idx, rs, cs] (see create_landmark).
+
+        Args:
+            landmark_name (str): The landmark to place.
+            rs (ndarray): Row coordinates.
+            cs (ndarray): Column coordinates.
+            env_idx (ndarray): Environment indices.
+            owners (ndarray): Agent owning each landmark (for private landmarks).
+                The locations should not be owned by other agents.
+        """
+        self.state.reshape(-1)[
+            self._state_index(env_idx, self._channels[landmark_name], rs, cs)
+        ] = 1
+        cells = self._cell_index(env_idx, rs, cs)
+        if landmark_name in self._blocked:
+            self._blocked_map.reshape(-1)[cells] = True
+        elif landmark_name in self._owner_channels:
+            owners = np.asarray(owners, dtype=np.int16)
+            self.owner_state[env_idx, self._owner_channels[landmark_name], rs, cs] = (
+                owners
+            )
+            self._owner_map.reshape(-1)[cells] = owners
+
+    def _valid(self, rs, cs):
+        """Return whether [rs, cs] is inside of the world, and clipped rs, cs."""
+        valid = (rs >= 0) & (rs < self.sz_h) & (cs >= 0) & (cs < self.sz_w)
+        return valid, np.where(valid, rs, 0), np.where(valid, cs, 0)
+
+    def accessible_at(self, env_idx, agent_ids, rs, cs):
+        """Batched version of Maps.accessible_at.
+
+        Args:
+            env_idx (ndarray): Environment indices.
+            agent_ids (ndarray): Agent indices.
+            rs (ndarray): Row coordinates.
+            cs (ndarray): Column coordinates. The four arrays are broadcast
+                together.
+
+        Returns:
+            accessible (ndarray): Boolean array with the broadcast shape. Locations
+                outside of the world are not accessible.
+        """
+        valid, rs, cs = self._valid(rs, cs)
+        cells = self._cell_index(env_idx, rs, cs)
+        owner = self._owner_map.reshape(-1).take(cells)
+        return (
+            valid
+            & ~self._blocked_map.reshape(-1).take(cells)
+            & ((owner == -1) | (owner == agent_ids))
+        )
+
+    def unoccupied_at(self, env_idx, rs, cs):
+        """Batched version of Maps.unoccupied_at (env_idx is broadcast with rs, cs)."""
+        valid, rs, cs = self._valid(rs, cs)
+        cells = self._cell_index(env_idx, rs, cs)
+        return valid & (self.loc_map.reshape(-1).take(cells) == -1)
+
+
+class BatchedWorld:
+    """
+    The spatial and agent states of n_envs copies of a world.
+
+    Agent states are stored as arrays with leading [n_envs, n_agents] dimensions:
+    locations, inventories (see inventory_keys) and endogenous quantities (see
+    endogenous_keys), plus the scalar agent state fields added by components
+    (such as "bonus_gather_prob" or "build_payment") in agent_state.
+
+    Args:
+        world (World): Template world. Every copy starts from its current state
+            (e.g. right after the environment was reset).
+        n_envs (int): Number of copies.
+        seed (int): Seed of the random number generator shared by the copies. If
+            None (default), it is seeded from OS entropy.
+    """
+
+    def __init__(self, world, n_envs, seed=None):
+        self.n_envs = int(n_envs)
+        self.n_agents = world.n_agents
+        self.world_size = list(world.world_size)
+        self.maps = BatchedMaps(world.maps, self.n_envs)
+        self.rng = np.random.default_rng(seed)
+
+        agent_state = world.agents[0].state
+        self.inventory_keys = list(agent_state["inventory"].keys())
+        self.endogenous_keys = list(agent_state["endogenous"].keys())
+        shape = [self.n_envs, self.n_agents]
+        self.loc = np.zeros(shape + [2], dtype=np.int64)
+        self.inventory = np.zeros(shape + [len(self.inventory_keys)])
+        self.endogenous = np.zeros(shape + [len(self.endogenous_keys)])
+        self.agent_state = {
+            k: np.zeros(shape)
+            for k, v in agent_state.items()
+            if isinstance(v, (int, float, np.number))
+        }
+        for env_idx in range(self.n_envs):
+            self.set_env(env_idx, world)
+
+    def set_env(self, env_idx, world):
+        """Copy the state of world (a World object) to the copy with index env_idx.
+
+        This can be used to give the copies different starting states (such as
+        different layouts or skills), e.g. from resetting an environment once per
+        copy.
+        """
+        self.maps.set_env(env_idx, world.maps)
+        for agent in world.agents:
+            state = agent.state
+            self.loc[env_idx, agent.idx] = state["loc"]
+            self.inventory[env_idx, agent.idx] = [
+                state["inventory"][k] for k in self.inventory_keys
+            ]
+            self.endogenous[env_idx, agent.idx] = [
+                state["endogenous"][k] for k in self.endogenous_keys
+            ]
+            for k, v in self.agent_state.items():
+                v[env_idx, agent.idx] = state[k]
+
+    def move_agents(self, env_idx, agent_ids, rs, cs):
+        """Move agents to the locations [rs, cs], which they must be able to occupy.
+
+        Args:
+            env_idx (ndarray): Environment indices.
+            agent_ids (ndarray): Agent indices (at most one per environment).
+            rs (ndarray): Row coordinates.
+            cs (ndarray): Column coordinates.
+        """
+        loc_map = self.maps.loc_map.reshape(-1)
+        old_r, old_c = self.loc[env_idx, agent_ids].T
+        loc_map[self.maps._cell_index(env_idx, old_r, old_c)] = -1
+        loc_map[self.maps._cell_index(env_idx, rs, cs)] = agent_ids
+        self.loc[env_idx, agent_ids, 0] = rs
+        self.loc[env_idx, agent_ids, 1] = cs
+
+    def random_agent_order(self):
+        """Return an [n_envs, n_agents] array of agent indices in random order."""
+        order = np.broadcast_to(np.arange(self.n_agents), (self.n_envs, self.n_agents))
+        return self.rng.permuted(order, axis=1)
+
+
+class BatchedGather:
+    """
+    Batched version of the Gather component: mobile agents move around and collect
+    the resources at the locations they move to (or stay on).
+
+    Within each copy, agents act one after the other in a random order, as with
+    Gather, so that the outcome of conflicting moves is the same. Each rank of the
+    order is processed for all the copies at once.
+
+    Args:
+        world (BatchedWorld): The batched world.
+        move_labor (float): Labor cost associated with movement.
+        collect_labor (float): Labor cost associated with collecting resources.
+    """
+
+    # Row and column offsets of the actions (NO-OP, left, right, up, down)
+    _dr = np.array([0, 0, 0, -1, 1])
+    _dc = np.array([0, -1, 1, 0, 0])
+
+    def __init__(self, world, move_labor=1.0, collect_labor=1.0):
+        self.world = world
+        self.move_labor = float(move_labor)
+        self.collect_labor = float(collect_labor)
+
+        self._labor = world.endogenous_keys.index("Labor")
+        self._resource_inventory = np.array(
+            [world.inventory_keys.index(k) for k in world.maps._resources]
+        )
+
+    @classmethod
+    def from_component(cls, component, world):
+        """Create a BatchedGather with the settings of a Gather component."""
+        return cls(
+            world,
+            move_labor=component.move_labor,
+            collect_labor=component.collect_labor,
+        )
+
+    def step(self, actions, order=None):
+        """
+        Apply the gather actions of all the agents of all the copies.
+
+        Args:
+            actions (ndarray): [n_envs, n_agents] integer array of Gather actions
+                (0: NO-OP, 1: left, 2: right, 3: up, 4: down).
+            order (ndarray): [n_envs, n_agents] order in which the agents act in each
+                copy. Drawn at random if None (default).
+
+        Returns:
+            gathered (ndarray): [n_envs, n_agents, n_resources] amount of each
+                collectible resource (ordered as in the maps) collected this step.
+        """
+        world = self.world
+        maps = world.maps
+        actions = np.asarray(actions)
+        assert actions.shape == (world.n_envs, world.n_agents)
+        if order is None:
+            order = world.random_agent_order()
+
+        envs = np.arange(world.n_envs)
+        resource_channels = maps.resource_channels
+        bonus_gather_prob = world.agent_state.get("bonus_gather_prob")
+        gathered = np.zeros(
+            (world.n_envs, world.n_agents, len(resource_channels)), dtype=np.int64
+        )
+
+        for rank in range(world.n_agents):
+            agents = order[:, rank]
+            action = actions[envs, agents]
+            r, c = world.loc[envs, agents].T
+            new_r = r + self._dr[action]
+            new_c = c + self._dc[action]
+
+            # Move the agents to their new location, if they can occupy it
+            moves = (
+                (action > 0)
+                & maps.accessible_at(envs, agents, new_r, new_c)
+                & maps.unoccupied_at(envs, new_r, new_c)
+            )
+            m_envs, m_agents = envs[moves], agents[moves]
+            world.move_agents(m_envs, m_agents, new_r[moves], new_c[moves])
+            world.endogenous[m_envs, m_agents, self._labor] += self.move_labor
+
+            # Collect the resources at the (new) location
+            r = np.where(moves, new_r, r)[:, None]
+            c = np.where(moves, new_c, c)[:, None]
+            health = maps.get_points(resource_channels, r, c, envs[:, None])
+            collects = health >= 1
+            if not collects.any():
+                continue
+            n_gathered = collects.astype(np.int64)
+            if bonus_gather_prob is not None:
+                bonus = world.rng.random(collects.shape) < (
+                    bonus_gather_prob[envs, agents][:, None]
+                )
+                n_gathered += collects & bonus
+            maps.set_points(resource_channels, r, c, health - collects, envs[:, None])
+            world.inventory[
+                envs[:, None], agents[:, None], self._resource_inventory
+            ] += n_gathered
+            world.endogenous[
+                envs, agents, self._labor
+            ] += self.collect_labor * collects.sum(axis=1)
+            gathered[envs, agents] += n_gathered
+
+        return gathered
+
+    def generate_masks(self):
+        """
+        Return the [n_envs, n_agents, 4] float32 masks of the movement actions
+        (left, right, up, down), as in Gather.generate_masks.
+        """
+        world = self.world
+        envs = np.arange(world.n_envs)[:, None, None]
+        agents = np.arange(world.n_agents)[None, :, None]
+        rs = world.loc[:, :, 0:1] + self._dr[1:]
+        cs = world.loc[:, :, 1:2] + self._dc[1:]
+        masks = world.maps.accessible_at(envs, agents, rs, cs)
+        masks &= world.maps.unoccupied_at(envs, rs, cs)
+        return masks.astype(np.float32)
+
+
+class BatchedBuild:
+    """
+    Batched version of the Build component: mobile agents convert stone and wood
+    into a house (at their location) and coin.
+
+    Whether an agent can build only depends on its own location and inventory, so
+    all the agents of all the copies are processed at once.
+
+    Args:
+        world (BatchedWorld): The batched world. Agent payments are read from its
+            "build_payment" agent state field.
+        build_labor (float): Labor cost associated with building a house.
+        resource_cost (dict): Resources consumed by building. Defaults to one wood
+            and one stone.
+    """
+
+    def __init__(self, world, build_labor=10.0, resource_cost=None):
+        self.world = world
+        self.build_labor = float(build_labor)
+        if resource_cost is None:
+            resource_cost = {"Wood": 1, "Stone": 1}
+
+        self._cost_inventory = np.array(
+            [world.inventory_keys.index(k) for k in resource_cost]
+        )
+        self._cost = np.array(list(resource_cost.values()), dtype=float)
+        self._coin = world.inventory_keys.index("Coin")
+        self._labor = world.endogenous_keys.index("Labor")
+
+    @classmethod
+    def from_component(cls, component, world):
+        """Create a BatchedBuild with the settings of a Build component."""
+        return cls(
+            world,
+            build_labor=component.build_labor,
+            resource_cost=component.resource_cost,
+        )
+
+    def can_build(self):
+        """Return the [n_envs, n_agents] boolean array of agents that can build."""
+        world = self.world
+        has_resources = (world.inventory[:, :, self._cost_inventory] >= self._cost).all(
+            axis=-1
+        )
+        # Agents cannot build on top of a resource or landmark
+        envs = np.arange(world.n_envs)[:, None, None]
+        r, c = world.loc[:, :, 0:1], world.loc[:, :, 1:2]
+        channels = np.arange(world.maps.state.shape[1])
+        location_is_empty = ~(world.maps.get_points(channels, r, c, envs) > 0).any(
+            axis=-1
+        )
+        return has_resources & location_is_empty
+
+    def step(self, actions):
+        """
+        Apply the build actions of all the agents of all the copies.
+
+        Args:
+            actions (ndarray): [n_envs, n_agents] integer array of Build actions
+                (0: NO-OP, 1: build).
+
+        Returns:
+            builds (ndarray): [n_envs, n_agents] boolean array of the agents that
+                built a house this step.
+        """
+        world = self.world
+        actions = np.asarray(actions)
+        assert actions.shape == (world.n_envs, world.n_agents)
+        builds = (actions == 1) & self.can_build()
+
+        envs, agents = np.nonzero(builds)
+        r, c = world.loc[envs, agents].T
+        world.inventory[
+            envs[:, None], agents[:, None], self._cost_inventory
+        ] -= self._cost
+        world.maps.create_landmarks("House", r, c, envs, owners=agents)
+        world.inventory[envs, agents, self._coin] += world.agent_state["build_payment"][
+            envs, agents
+        ]
+        world.endogenous[envs, agents, self._labor] += self.build_labor
+        return builds
+
+    def generate_masks(self):
+        """Return the [n_envs, n_agents, 1] masks of the build action."""
+        return self.can_build()[:, :, None]
@@ -36,6 +36,7 @@ class Build(BaseComponent):
     name = "Build"
     component_type = "Build"
     required_entities = ["Wood", "Stone", "Coin", "House", "Labor"]
+    snapshot_shallow_attributes = ("builds",)
     agent_subclasses = ["BasicMobileAgent"]
 
     def __init__(
@@ -238,10 +239,10 @@ class Build(BaseComponent):
                 sampled_skill = 1
                 pay_rate = 1
             elif self.skill_dist == "pareto":
-                sampled_skill = np.random.pareto(4)
+                sampled_skill = self.world.rng.pareto(4)
                 pay_rate = np.minimum(PMSM, (PMSM - 1) * sampled_skill + 1)
             elif self.skill_dist == "lognormal":
-                sampled_skill = np.random.lognormal(-1, 0.5)
+                sampled_skill = self.world.rng.lognormal(-1, 0.5)
                 pay_rate = np.minimum(PMSM, (PMSM - 1) * sampled_skill + 1)
             else:
                 raise NotImplementedError
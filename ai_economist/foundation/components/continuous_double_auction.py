@@ -10,8 +10,14 @@ from ai_economist.foundation.base.base_component import (
     BaseComponent,
     component_registry,
 )
+from ai_economist.foundation.components.order_book import OrderBook, TradeTape
 from ai_economist.foundation.entities import resource_registry
 
+# Per-step decay factor of the price histories
+PRICE_HISTORY_DECAY = 0.995
+# Stored price histories are renormalized when their scale drops below this
+_MIN_PRICE_HISTORY_SCALE = 1e-6
+
 
 @component_registry.add
 class ContinuousDoubleAuction(BaseComponent):
@@ -32,6 +38,11 @@ class ContinuousDoubleAuction(BaseComponent):
         max_num_orders (int, optional): Maximum number of bids + asks that an agent can
             have open for a given resource. Must be >= 1. Default is no limit to
             number of orders.
+        clearing_mode (str): How orders are matched at each timestep. With
+            "continuous" (the default), crossing orders trade one pair at a time at
+            the price of the earlier order (see match_orders). With "call_auction",
+            the book of each commodity is cleared at once at a uniform price, which
+            is faster for large populations (see clear_call_auction).
     """
 
     name = "ContinuousDoubleAuction"
@@ -46,6 +57,7 @@ class ContinuousDoubleAuction(BaseComponent):
         order_labor=0.25,
         order_duration=50,
         max_num_orders=None,
+        clearing_mode="continuous",
         **kwargs
     ):
         super().__init__(*args, **kwargs)
@@ -71,39 +83,83 @@ class ContinuousDoubleAuction(BaseComponent):
         self.order_labor = float(order_labor)
         self.order_labor = max(self.order_labor, 0.0)
 
+        # How orders are matched
+        self.clearing_mode = clearing_mode
+        assert self.clearing_mode in ["continuous", "call_auction"]
+
         # Each collectible resource in the world can be traded via this component
         self.commodities = [
             r for r in self.world.resources if resource_registry.get(r).collectible
         ]
 
         # These get reset at the start of an episode:
-        self.asks = {c: [] for c in self.commodities}
-        self.bids = {c: [] for c in self.commodities}
+        self.order_books = {
+            c: OrderBook(self.price_floor, self.price_ceiling) for c in self.commodities
+        }
+        self.book_step = 0  # Number of steps the order books have been through
         self.n_orders = {
             c: {i: 0 for i in range(self.n_agents)} for c in self.commodities
         }
-        self.executed_trades = []
-        self.price_history = {
-            c: {i: self._price_zeros() for i in range(self.n_agents)}
-            for c in self.commodities
-        }
-        self.bid_hists = {
-            c: {i: self._price_zeros() for i in range(self.n_agents)}
-            for c in self.commodities
-        }
-        self.ask_hists = {
-            c: {i: self._price_zeros() for i in range(self.n_agents)}
-            for c in self.commodities
+        self.trade_tape = TradeTape(self.commodities)
+        # Per-agent histograms are [n_agents, n_prices] arrays, and the totals over
+        # agents are kept up to date alongside them
+        # Price histories are stored undecayed: their values are the stored values
+        # times _price_history_scale (see price_history)
+        self._price_history = {
+            c: self._price_zeros(self.n_agents) for c in self.commodities
         }
+        self._net_price_history = {c: self._price_zeros() for c in self.commodities}
+        self._price_history_scale = 1.0
+        self.bid_hists = {c: self._price_zeros(self.n_agents) for c in self.commodities}
+        self.ask_hists = {c: self._price_zeros(self.n_agents) for c in self.commodities}
+        self.total_bids = {c: self._price_zeros() for c in self.commodities}
+        self.total_asks = {c: self._price_zeros() for c in self.commodities}
 
     # Convenience methods
     # -------------------
 
-    def _price_zeros(self):
+    def _price_zeros(self, *leading_dims):
         if 1 + self.price_ceiling - self.price_floor <= 0:
             print("ERROR!", self.price_ceiling, self.price_floor)
 
-        return np.zeros(1 + self.price_ceiling - self.price_floor)
+        return np.zeros(leading_dims + (1 + self.price_ceiling - self.price_floor,))
+
+    @property
+    def price_history(self):
+        """{commodity: [n_agents, n_prices] array}. Decayed count of the sales of
+        each agent at each price (read-only view, computed on access)."""
+        return {
+            c: h * self._price_history_scale for c, h in self._price_history.items()
+        }
+
+    @property
+    def net_price_history(self):
+        """{commodity: [n_prices] array}. Decayed count of the sales at each price
+        (read-only view, computed on access)."""
+        return {
+            c: h * self._price_history_scale for c, h in self._net_price_history.items()
+        }
+
+    @property
+    def executed_trades(self):
+        """List of the trades of each step, as dictionaries (see TradeTape.to_dicts).
+
+        Built from the trade tape on access."""
+        return self.trade_tape.to_dicts()
+
+    def _decay_price_history(self):
+        """Decay the price histories by one step.
+
+        This only shrinks their common scale. The stored histories are rescaled
+        once the scale gets small, so that new sales (which are stored divided by
+        the scale) do not grow too large.
+        """
+        self._price_history_scale *= PRICE_HISTORY_DECAY
+        if self._price_history_scale < _MIN_PRICE_HISTORY_SCALE:
+            for c in self.commodities:
+                self._price_history[c] *= self._price_history_scale
+                self._net_price_history[c] *= self._price_history_scale
+            self._price_history_scale = 1.0
 
     def available_asks(self, resource, agent):
         """
@@ -119,14 +175,8 @@ class ContinuousDoubleAuction(BaseComponent):
                 available asks.
         """
         if agent is None:
-            a_idx = -1
-        else:
-            a_idx = agent.idx
-        ask_hist = self._price_zeros()
-        for i, h in self.ask_hists[resource].items():
-            if a_idx != i:
-                ask_hist += h
-        return ask_hist
+            return self.total_asks[resource].copy()
+        return self.total_asks[resource] - self.ask_hists[resource][agent.idx]
 
     def available_bids(self, resource, agent):
         """
@@ -142,14 +192,8 @@ class ContinuousDoubleAuction(BaseComponent):
                 available bids.
         """
         if agent is None:
-            a_idx = -1
-        else:
-            a_idx = agent.idx
-        bid_hist = self._price_zeros()
-        for i, h in self.bid_hists[resource].items():
-            if a_idx != i:
-                bid_hist += h
-        return bid_hist
+            return self.total_bids[resource].copy()
+        return self.total_bids[resource] - self.bid_hists[resource][agent.idx]
 
     def can_bid(self, resource, agent):
         """If agent can submit a bid for resource."""
@@ -183,11 +227,11 @@ class ContinuousDoubleAuction(BaseComponent):
 
         assert self.price_floor <= max_payment <= self.price_ceiling
 
-        bid = {"buyer": agent.idx, "bid": int(max_payment), "bid_lifetime": 0}
-
         # Add this to the bid book
-        self.bids[resource].append(bid)
-        self.bid_hists[resource][bid["buyer"]][bid["bid"] - self.price_floor] += 1
+        self.order_books[resource].add_bid(agent.idx, max_payment, self.book_step)
+        level = int(max_payment) - self.price_floor
+        self.bid_hists[resource][agent.idx, level] += 1
+        self.total_bids[resource][level] += 1
         self.n_orders[resource][agent.idx] += 1
 
         # Set aside whatever money the agent is willing to pay
@@ -214,11 +258,11 @@ class ContinuousDoubleAuction(BaseComponent):
         # is there an upper limit?
         assert self.price_floor <= min_income <= self.price_ceiling
 
-        ask = {"seller": agent.idx, "ask": int(min_income), "ask_lifetime": 0}
-
         # Add this to the ask book
-        self.asks[resource].append(ask)
-        self.ask_hists[resource][ask["seller"]][ask["ask"] - self.price_floor] += 1
+        self.order_books[resource].add_ask(agent.idx, min_income, self.book_step)
+        level = int(min_income) - self.price_floor
+        self.ask_hists[resource][agent.idx, level] += 1
+        self.total_asks[resource][level] += 1
         self.n_orders[resource][agent.idx] += 1
 
         # Set aside the resource the agent is willing to sell
@@ -233,177 +277,199 @@ class ContinuousDoubleAuction(BaseComponent):
         This implements the continuous double auction by identifying valid bid/ask
         pairs and executing trades accordingly.
 
-        Higher (lower) bids (asks) are given priority over lower (higher) bids (asks).
+        Higher (lower) bids (asks) are given priority over lower (higher) bids (asks),
+        and earlier orders over later ones at the same price. An agent's bids are
+        never matched with its own asks (see OrderBook.match).
         Trades are executed using the price of whichever bid/ask order was placed
         first: bid price if bid was placed first, ask price otherwise.
 
         Trading removes the payment and resource from bidder's and asker's escrow,
         respectively, and puts them in the other's inventory.
         """
-        self.executed_trades.append([])
+        self.trade_tape.new_step()
 
         for resource in self.commodities:
-            possible_match = [True for _ in range(self.n_agents)]
-            keep_checking = True
+            for bid, ask in self.order_books[resource].match():
+                # Ask came earlier (in other words, trade triggered by new bid):
+                # ask price. Bid came earlier (trade triggered by new ask): bid price
+                if bid["created"] >= ask["created"]:
+                    price = ask["price"]
+                else:
+                    price = bid["price"]
+                self._execute_trade(resource, bid, ask, price)
+
+    def clear_call_auction(self):
+        """
+        Clear the order books as call auctions.
+
+        The bids and asks of each commodity trade at a single clearing price, which
+        maximizes the number of units traded (see OrderBook.clear). Every buyer
+        pays the clearing price and every seller receives it, and ties are broken at
+        random. Clearing takes time proportional to the number of price levels and
+        orders, regardless of the number of trades.
+        """
+        self.trade_tape.new_step()
 
-            bids = sorted(
-                self.bids[resource],
-                key=lambda b: (b["bid"], b["bid_lifetime"]),
-                reverse=True,
+        world = self.world
+
+        for resource in self.commodities:
+            price, matches = self.order_books[resource].clear(world.rng)
+            if not matches:
+                continue
+            # The trades are executed together, so the bookkeeping is vectorized
+            # (and per-agent updates aggregate all the agent's trades)
+            buyers, bid_prices, bid_created, sellers, ask_prices, ask_created = (
+                np.array(
+                    [
+                        (b["agent"], b["price"], b["created"])
+                        + (a["agent"], a["price"], a["created"])
+                        for b, a in matches
+                    ],
+                    dtype=np.int64,
+                ).T
             )
-            asks = sorted(
-                self.asks[resource], key=lambda a: (a["ask"], -a["ask_lifetime"])
+            bid_levels = bid_prices - self.price_floor
+            ask_levels = ask_prices - self.price_floor
+            n_prices = len(self.total_bids[resource])
+
+            # Bookkeeping
+            np.subtract.at(self.bid_hists[resource], (buyers, bid_levels), 1)
+            self.total_bids[resource] -= np.bincount(bid_levels, minlength=n_prices)
+            np.subtract.at(self.ask_hists[resource], (sellers, ask_levels), 1)
+            self.total_asks[resource] -= np.bincount(ask_levels, minlength=n_prices)
+            self.trade_tape.extend(
+                resource,
+                buyers,
+                sellers,
+                bid_prices,
+                ask_prices,
+                price,
+                self.book_step - bid_created,
+                self.book_step - ask_created,
             )
+            sale = 1.0 / self._price_history_scale
+            np.add.at(self._price_history[resource][:, price], sellers, sale)
+            self._net_price_history[resource][price] += len(matches) * sale
+
+            n_bought = np.bincount(buyers, minlength=self.n_agents)
+            prepaid = np.bincount(buyers, weights=bid_prices, minlength=self.n_agents)
+            n_sold = np.bincount(sellers, minlength=self.n_agents)
+            for agent_idx in np.flatnonzero(n_bought).tolist():
+                buyer = world.agents[agent_idx]
+                n = int(n_bought[agent_idx])
+                pre_payment = int(prepaid[agent_idx])
+                self.n_orders[resource][agent_idx] -= n
+                buyer.state["inventory"][resource] += n
+                # Buyer's money (already set aside) leaves escrow, and the excess
+                # over the clearing price is returned to the buyer
+                buyer.state["escrow"]["Coin"] -= pre_payment
+                assert buyer.state["escrow"]["Coin"] >= 0
+                buyer.state["inventory"]["Coin"] += pre_payment - n * int(price)
+            for agent_idx in np.flatnonzero(n_sold).tolist():
+                seller = world.agents[agent_idx]
+                n = int(n_sold[agent_idx])
+                self.n_orders[resource][agent_idx] -= n
+                # The resource leaves the seller's escrow, and the seller receives
+                # the clearing price for each unit
+                seller.state["escrow"][resource] -= n
+                seller.state["inventory"]["Coin"] += n * int(price)
+
+    def _execute_trade(self, resource, bid, ask, price):
+        """
+        Execute the trade of a unit of resource between a matched bid and ask.
 
-            while any(possible_match) and keep_checking:
-                idx_bid, idx_ask = 0, 0
-                while True:
-                    # Out of bids to check. Exit both loops.
-                    if idx_bid >= len(bids):
-                        keep_checking = False
-                        break
-
-                    # Already know this buyer is no good for this round.
-                    # Skip to next bid.
-                    if not possible_match[bids[idx_bid]["buyer"]]:
-                        idx_bid += 1
-
-                    # Out of asks to check. This buyer won't find a match on this round.
-                    # (maybe) Restart inner loop.
-                    elif idx_ask >= len(asks):
-                        possible_match[bids[idx_bid]["buyer"]] = False
-                        break
-
-                    # Skip to next ask if this ask comes from the buyer
-                    # of the current bid.
-                    elif asks[idx_ask]["seller"] == bids[idx_bid]["buyer"]:
-                        idx_ask += 1
-
-                    # If this bid/ask pair can't be matched, this buyer
-                    # can't be matched. (maybe) Restart inner loop.
-                    elif bids[idx_bid]["bid"] < asks[idx_ask]["ask"]:
-                        possible_match[bids[idx_bid]["buyer"]] = False
-                        break
-
-                    # TRADE! (then restart inner loop)
-                    else:
-                        bid = bids.pop(idx_bid)
-                        ask = asks.pop(idx_ask)
-
-                        trade = {"commodity": resource}
-                        trade.update(bid)
-                        trade.update(ask)
-
-                        if (
-                            bid["bid_lifetime"] <= ask["ask_lifetime"]
-                        ):  # Ask came earlier. (in other words,
-                            # trade triggered by new bid)
-                            trade["price"] = int(trade["ask"])
-                        else:  # Bid came earlier. (in other words,
-                            # trade triggered by new ask)
-                            trade["price"] = int(trade["bid"])
-                        trade["cost"] = trade["price"]  # What the buyer pays in total
-                        trade["income"] = trade[
-                            "price"
-                        ]  # What the seller receives in total
-
-                        buyer = self.world.agents[trade["buyer"]]
-                        seller = self.world.agents[trade["seller"]]
-
-                        # Bookkeeping
-                        self.bid_hists[resource][bid["buyer"]][
-                            bid["bid"] - self.price_floor
-                        ] -= 1
-                        self.ask_hists[resource][ask["seller"]][
-                            ask["ask"] - self.price_floor
-                        ] -= 1
-                        self.n_orders[trade["commodity"]][seller.idx] -= 1
-                        self.n_orders[trade["commodity"]][buyer.idx] -= 1
-                        self.executed_trades[-1].append(trade)
-                        self.price_history[resource][trade["seller"]][
-                            trade["price"]
-                        ] += 1
-
-                        # The resource goes from the seller's escrow
-                        # to the buyer's inventory
-                        seller.state["escrow"][resource] -= 1
-                        buyer.state["inventory"][resource] += 1
-
-                        # Buyer's money (already set aside) leaves escrow
-                        pre_payment = int(trade["bid"])
-                        buyer.state["escrow"]["Coin"] -= pre_payment
-                        assert buyer.state["escrow"]["Coin"] >= 0
-
-                        # Payment is removed from the pre_payment
-                        # and given to the seller. Excess returned to buyer.
-                        payment_to_seller = int(trade["price"])
-                        excess_payment_from_buyer = pre_payment - payment_to_seller
-                        assert excess_payment_from_buyer >= 0
-                        seller.state["inventory"]["Coin"] += payment_to_seller
-                        buyer.state["inventory"]["Coin"] += excess_payment_from_buyer
-
-                        # Restart the inner loop
-                        break
-
-            # Keep the unfilled bids/asks
-            self.bids[resource] = bids
-            self.asks[resource] = asks
+        Trading removes the payment and resource from bidder's and asker's escrow,
+        respectively, and puts them in the other's inventory.
+        """
+        buyer = self.world.agents[bid["agent"]]
+        seller = self.world.agents[ask["agent"]]
+
+        # Bookkeeping
+        bid_level = bid["price"] - self.price_floor
+        ask_level = ask["price"] - self.price_floor
+        self.bid_hists[resource][buyer.idx, bid_level] -= 1
+        self.total_bids[resource][bid_level] -= 1
+        self.ask_hists[resource][seller.idx, ask_level] -= 1
+        self.total_asks[resource][ask_level] -= 1
+        self.n_orders[resource][seller.idx] -= 1
+        self.n_orders[resource][buyer.idx] -= 1
+        self.trade_tape.append(
+            resource,
+            buyer.idx,
+            seller.idx,
+            bid["price"],
+            ask["price"],
+            price,
+            self.book_step - bid["created"],
+            self.book_step - ask["created"],
+        )
+        sale = 1.0 / self._price_history_scale
+        self._price_history[resource][seller.idx, price] += sale
+        self._net_price_history[resource][price] += sale
+
+        # The resource goes from the seller's escrow
+        # to the buyer's inventory
+        seller.state["escrow"][resource] -= 1
+        buyer.state["inventory"][resource] += 1
+
+        # Buyer's money (already set aside) leaves escrow
+        pre_payment = int(bid["price"])
+        buyer.state["escrow"]["Coin"] -= pre_payment
+        assert buyer.state["escrow"]["Coin"] >= 0
+
+        # Payment is removed from the pre_payment
+        # and given to the seller. Excess returned to buyer.
+        payment_to_seller = int(price)
+        excess_payment_from_buyer = pre_payment - payment_to_seller
+        assert excess_payment_from_buyer >= 0
+        seller.state["inventory"]["Coin"] += payment_to_seller
+        buyer.state["inventory"]["Coin"] += excess_payment_from_buyer
 
     def remove_expired_orders(self):
         """
-        Increment the time counter for any unfilled bids/asks and remove expired
-        orders from the market.
-
-        When orders expire, the payment or resource is removed from escrow and
-        returned to the inventory and the associated order is removed from the order
-        books.
+        Age the unfilled bids/asks by one timestep and remove expired orders from
+        the market.
+
+        Orders expire once they have been in the books for more than order_duration
+        timesteps. Only the orders created order_duration timesteps ago can expire
+        at a given timestep, so they are looked up in the expiry buckets of the
+        order books. When orders expire, the payment or resource is removed from
+        escrow and returned to the inventory and the associated order is removed
+        from the order books.
         """
         world = self.world
+        expired_step = self.book_step - self.order_duration
 
         for resource in self.commodities:
+            expired_bids, expired_asks = self.order_books[resource].expire(expired_step)
 
-            bids_ = []
-            for bid in self.bids[resource]:
-                bid["bid_lifetime"] += 1
-                # If the bid is not expired, keep it in the bids
-                if bid["bid_lifetime"] <= self.order_duration:
-                    bids_.append(bid)
-                # Otherwise, remove it and do the associated bookkeeping
-                else:
-                    # Return the set aside money to the buyer
-                    amount = world.agents[bid["buyer"]].escrow_to_inventory(
-                        "Coin", bid["bid"]
-                    )
-                    assert amount == bid["bid"]
-                    # Adjust the bid histogram to reflect the removal of the bid
-                    self.bid_hists[resource][bid["buyer"]][
-                        bid["bid"] - self.price_floor
-                    ] -= 1
-                    # Adjust the order counter
-                    self.n_orders[resource][bid["buyer"]] -= 1
-
-            asks_ = []
-            for ask in self.asks[resource]:
-                ask["ask_lifetime"] += 1
-                # If the ask is not expired, keep it in the asks
-                if ask["ask_lifetime"] <= self.order_duration:
-                    asks_.append(ask)
-                # Otherwise, remove it and do the associated bookkeeping
-                else:
-                    # Return the set aside resource to the seller
-                    resource_unit = world.agents[ask["seller"]].escrow_to_inventory(
-                        resource, 1
-                    )
-                    assert resource_unit == 1
-                    # Adjust the ask histogram to reflect the removal of the ask
-                    self.ask_hists[resource][ask["seller"]][
-                        ask["ask"] - self.price_floor
-                    ] -= 1
-                    # Adjust the order counter
-                    self.n_orders[resource][ask["seller"]] -= 1
+            for bid in expired_bids:
+                # Return the set aside money to the buyer
+                amount = world.agents[bid["agent"]].escrow_to_inventory(
+                    "Coin", bid["price"]
+                )
+                assert amount == bid["price"]
+                # Adjust the bid histogram to reflect the removal of the bid
+                level = bid["price"] - self.price_floor
+                self.bid_hists[resource][bid["agent"], level] -= 1
+                self.total_bids[resource][level] -= 1
+                # Adjust the order counter
+                self.n_orders[resource][bid["agent"]] -= 1
+
+            for ask in expired_asks:
+                # Return the set aside resource to the seller
+                resource_unit = world.agents[ask["agent"]].escrow_to_inventory(
+                    resource, 1
+                )
+                assert resource_unit == 1
+                # Adjust the ask histogram to reflect the removal of the ask
+                level = ask["price"] - self.price_floor
+                self.ask_hists[resource][ask["agent"], level] -= 1
+                self.total_asks[resource][level] -= 1
+                # Adjust the order counter
+                self.n_orders[resource][ask["agent"]] -= 1
 
-            self.bids[resource] = bids_
-            self.asks[resource] = asks_
+        self.book_step += 1
 
     # Required methods for implementing components
     # --------------------------------------------
@@ -446,10 +512,10 @@ class ContinuousDoubleAuction(BaseComponent):
         """
         world = self.world
 
+        self._decay_price_history()
+
         for resource in self.commodities:
             for agent in world.agents:
-                self.price_history[resource][agent.idx] *= 0.995
-
                 # Create bid action
                 # -----------------
                 resource_action = agent.get_component_action(
@@ -485,7 +551,10 @@ class ContinuousDoubleAuction(BaseComponent):
                     raise ValueError
 
         # Here's where the magic happens:
-        self.match_orders()  # Pair bids and asks
+        if self.clearing_mode == "call_auction":
+            self.clear_call_auction()  # Clear the books at a uniform price
+        else:
+            self.match_orders()  # Pair bids and asks
         self.remove_expired_orders()  # Get rid of orders that have expired
 
     def generate_observations(self):
@@ -503,10 +572,7 @@ class ContinuousDoubleAuction(BaseComponent):
 
         prices = np.arange(self.price_floor, self.price_ceiling + 1)
         for c in self.commodities:
-            net_price_history = np.sum(
-                np.stack([self.price_history[c][i] for i in range(self.n_agents)]),
-                axis=0,
-            )
+            net_price_history = self._net_price_history[c] * self._price_history_scale
             market_rate = prices.dot(net_price_history) / np.maximum(
                 0.001, np.sum(net_price_history)
             )
@@ -514,6 +580,12 @@ class ContinuousDoubleAuction(BaseComponent):
 
             full_asks = self.available_asks(c, agent=None)
             full_bids = self.available_bids(c, agent=None)
+            # [n_agents, n_prices] views of the orders of each agent and of the
+            # orders it could respond to
+            my_asks = self.ask_hists[c].copy()
+            my_bids = self.bid_hists[c].copy()
+            available_asks = full_asks[None] - my_asks
+            available_bids = full_bids[None] - my_bids
 
             obs[world.planner.idx].update(
                 {
@@ -530,12 +602,10 @@ class ContinuousDoubleAuction(BaseComponent):
                     {
                         "market_rate-{}".format(c): market_rate,
                         "price_history-{}".format(c): scaled_price_history,
-                        "available_asks-{}".format(c): full_asks
-                        - self.ask_hists[c][agent.idx],
-                        "available_bids-{}".format(c): full_bids
-                        - self.bid_hists[c][agent.idx],
-                        "my_asks-{}".format(c): self.ask_hists[c][agent.idx],
-                        "my_bids-{}".format(c): self.bid_hists[c][agent.idx],
+                        "available_asks-{}".format(c): available_asks[agent.idx],
+                        "available_bids-{}".format(c): available_bids[agent.idx],
+                        "my_asks-{}".format(c): my_asks[agent.idx],
+                        "my_bids-{}".format(c): my_bids[agent.idx],
                     }
                 )
 
@@ -594,49 +664,42 @@ class ContinuousDoubleAuction(BaseComponent):
 
         trade_keys = ["price", "cost", "income"]
 
-        selling_stats = {
-            a.idx: {
-                c: {k: 0 for k in trade_keys + ["n_sales"]} for c in self.commodities
-            }
-            for a in world.agents
-        }
-        buying_stats = {
-            a.idx: {
-                c: {k: 0 for k in trade_keys + ["n_sales"]} for c in self.commodities
-            }
-            for a in world.agents
-        }
-
-        n_trades = 0
-
-        for trades in self.executed_trades:
-            for trade in trades:
-                n_trades += 1
-                i_s, i_b, c = trade["seller"], trade["buyer"], trade["commodity"]
-                selling_stats[i_s][c]["n_sales"] += 1
-                buying_stats[i_b][c]["n_sales"] += 1
-                for k in trade_keys:
-                    selling_stats[i_s][c][k] += trade[k]
-                    buying_stats[i_b][c][k] += trade[k]
+        # Number and total price of the sales/purchases of each
+        # [agent, commodity] pair
+        records = self.trade_tape.records
+        n_commodities = len(self.commodities)
+        n_pairs = self.n_agents * n_commodities
+        prices = records["price"].astype(np.float64)
+        stats = {}
+        for prefix, agent_key in [("Sell", "seller"), ("Buy", "buyer")]:
+            pair = (
+                records[agent_key].astype(np.int64) * n_commodities
+                + records["commodity"]
+            )
+            n = np.bincount(pair, minlength=n_pairs)
+            total_price = np.bincount(pair, weights=prices, minlength=n_pairs)
+            mean_price = total_price / np.maximum(n, 1)
+            mean_price[n == 0] = np.nan
+            stats[prefix] = (
+                n.reshape(self.n_agents, n_commodities),
+                mean_price.reshape(self.n_agents, n_commodities),
+            )
 
         out_dict = {}
         for a in world.agents:
-            for c in self.commodities:
-                for stats, prefix in zip(
-                    [selling_stats, buying_stats], ["Sell", "Buy"]
-                ):
-                    n = stats[a.idx][c]["n_sales"]
-                    if n == 0:
-                        for k in trade_keys:
-                            stats[a.idx][c][k] = np.nan
-                    else:
-                        for k in trade_keys:
-                            stats[a.idx][c][k] /= n
-
-                    for k, v in stats[a.idx][c].items():
-                        out_dict["{}/{}{}/{}".format(a.idx, prefix, c, k)] = v
-
-        out_dict["n_trades"] = n_trades
+            for c_idx, c in enumerate(self.commodities):
+                for prefix in ["Sell", "Buy"]:
+                    n, mean_price = stats[prefix]
+                    # Cost and income both equal the price of a trade
+                    for k in trade_keys:
+                        out_dict["{}/{}{}/{}".format(a.idx, prefix, c, k)] = float(
+                            mean_price[a.idx, c_idx]
+                        )
+                    out_dict["{}/{}{}/n_sales".format(a.idx, prefix, c)] = int(
+                        n[a.idx, c_idx]
+                    )
+
+        out_dict["n_trades"] = len(self.trade_tape)
 
         return out_dict
 
@@ -646,26 +709,29 @@ class ContinuousDoubleAuction(BaseComponent):
 
         Reset the order books.
         """
-        self.bids = {c: [] for c in self.commodities}
-        self.asks = {c: [] for c in self.commodities}
+        self.order_books = {
+            c: OrderBook(self.price_floor, self.price_ceiling) for c in self.commodities
+        }
+        self.book_step = 0
         self.n_orders = {
             c: {i: 0 for i in range(self.n_agents)} for c in self.commodities
         }
 
-        self.price_history = {
-            c: {i: self._price_zeros() for i in range(self.n_agents)}
-            for c in self.commodities
+        # Per-agent histograms are [n_agents, n_prices] arrays, and the totals over
+        # agents are kept up to date alongside them
+        # Price histories are stored undecayed: their values are the stored values
+        # times _price_history_scale (see price_history)
+        self._price_history = {
+            c: self._price_zeros(self.n_agents) for c in self.commodities
         }
-        self.bid_hists = {
-            c: {i: self._price_zeros() for i in range(self.n_agents)}
-            for c in self.commodities
-        }
-        self.ask_hists = {
-            c: {i: self._price_zeros() for i in range(self.n_agents)}
-            for c in self.commodities
-        }
-
-        self.executed_trades = []
+        self._net_price_history = {c: self._price_zeros() for c in self.commodities}
+        self._price_history_scale = 1.0
+        self.bid_hists = {c: self._price_zeros(self.n_agents) for c in self.commodities}
+        self.ask_hists = {c: self._price_zeros(self.n_agents) for c in self.commodities}
+        self.total_bids = {c: self._price_zeros() for c in self.commodities}
+        self.total_asks = {c: self._price_zeros() for c in self.commodities}
+
+        self.trade_tape = TradeTape(self.commodities)
 
     def get_dense_log(self):
         """
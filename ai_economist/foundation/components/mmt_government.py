@@ -211,9 +211,9 @@ class MMTGovernment(BaseComponent):
 
     def handle_international_trade(self):
         for agent in self.world.get_agents_of_type("BasicMobileAgent"):
-            if np.random.rand() < 0.1:
+            if self.world.rng.random() < 0.1:
                 trade_amount = agent.state["money"] * 0.1
-                if np.random.rand() < 0.5:
+                if self.world.rng.random() < 0.5:
                     agent.state["money"] += trade_amount
                     agent.state["foreign_currency"] += trade_amount / self.exchange_rate
                 else:
@@ -63,7 +63,7 @@ class MMTLaborMarket(BaseComponent):
             participation_probability = self.labor_force_participation_rate
             if agent.state["education_progress"] > 0:
                 participation_probability *= 0.5  # Students are less likely to participate
-            if np.random.rand() < participation_probability:
+            if self.world.rng.random() < participation_probability:
                 agent.state["job_search_active"] = True
             else:
                 agent.state["job_search_active"] = False
@@ -81,7 +81,7 @@ class MMTLaborMarket(BaseComponent):
 
     def update_automation(self):
         for corp in self.world.get_agents_of_type("CorporateAgent"):
-            if np.random.rand() < self.automation_rate:
+            if self.world.rng.random() < self.automation_rate:
                 corp.state["automation_level"] = min(1, corp.state["automation_level"] + 0.1)
 
     def match_jobs(self):
@@ -94,7 +94,9 @@ class MMTLaborMarket(BaseComponent):
                                  if agent.state["wage_expectation"] <= self.sector_wages[sector]]
             
             matches = min(sector_openings, len(sector_applicants))
-            matched_agents = np.random.choice(sector_applicants, matches, replace=False)
+            matched_agents = self.world.rng.choice(
+                sector_applicants, matches, replace=False
+            )
             
             for agent in matched_agents:
                 agent.state["labor"] = 1
@@ -109,7 +111,7 @@ class MMTLaborMarket(BaseComponent):
             agent.state["money"] -= self.job_search_cost
 
     def handle_gig_economy(self):
-        gig_workers = np.random.choice(
+        gig_workers = self.world.rng.choice(
             [agent for agent in self.world.get_agents_of_type("BasicMobileAgent") if agent.state["labor"] == 0],
             int(len(self.world.get_agents_of_type("BasicMobileAgent")) * self.gig_economy_share),
             replace=False
@@ -160,14 +162,18 @@ class MMTLaborMarket(BaseComponent):
                     agent.state["education_level"] += 1
                     agent.state["education_progress"] = 0
                     agent.state["skill_level"] += 0.2  # Increase skill level upon education completion
-            elif agent.state["money"] > self.education_cost and np.random.rand() < 0.1:  # 10% chance to start education
+            elif (
+                agent.state["money"] > self.education_cost
+                and self.world.rng.random() < 0.1  # 10% chance to start education
+            ):
                 agent.state["money"] -= self.education_cost
                 agent.state["education_progress"] = 1
 
     def update_unions(self):
         for agent in self.world.get_agents_of_type("BasicMobileAgent"):
             if agent.state["labor"] > 0 and not agent.state["union_member"]:
-                if np.random.rand() < self.union_strength * 0.1:  # Chance to join union
+                # Chance to join union
+                if self.world.rng.random() < self.union_strength * 0.1:
                     agent.state["union_member"] = True
 
     def get_unemployment_rate(self):
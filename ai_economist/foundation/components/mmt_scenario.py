@@ -42,7 +42,7 @@ class MMTScenario(BaseScenario):
                 "job_guarantee_participant": False,
                 "savings": 0,
                 "debt": 0,
-                "skill_level": np.random.rand(),
+                "skill_level": self.world.rng.random(),
                 "employer": None,
                 "productivity": 1.0,
                 "inflation_expectation": self.get_component("MMTGovernment").inflation_target,
@@ -113,7 +113,7 @@ class MMTScenario(BaseScenario):
         if agent.state["money"] > 1000:
             investment = (agent.state["money"] - 1000) * 0.2
             agent.state["money"] -= investment
-            asset_allocation = np.random.dirichlet(np.ones(3))
+            asset_allocation = self.world.rng.dirichlet(np.ones(3))
             agent.state["stocks"] += investment * asset_allocation[0]
             agent.state["bonds"] += investment * asset_allocation[1]
             commodity_investment = investment * asset_allocation[2]
@@ -153,9 +153,9 @@ class MMTScenario(BaseScenario):
     def handle_international_trade(self):
         govt = self.get_component("MMTGovernment")
         for agent in self.world.get_agents_of_type("BasicMobileAgent"):
-            if np.random.rand() < 0.1:
+            if self.world.rng.random() < 0.1:
                 trade_amount = agent.state["money"] * 0.1
-                if np.random.rand() < 0.5:  # Export
+                if self.world.rng.random() < 0.5:  # Export
                     agent.state["money"] += trade_amount
                     agent.state["foreign_currency"] += trade_amount / govt.exchange_rate
                 else:  # Import
@@ -163,9 +163,9 @@ class MMTScenario(BaseScenario):
                     agent.state["foreign_currency"] -= trade_amount / govt.exchange_rate
 
         for foreign_agent in self.world.get_agents_of_type("ForeignAgent"):
-            if np.random.rand() < 0.2:
+            if self.world.rng.random() < 0.2:
                 investment_amount = foreign_agent.state["foreign_currency"] * 0.05
-                if np.random.rand() < 0.5:  # Investment in domestic economy
+                if self.world.rng.random() < 0.5:  # Investment in domestic economy
                     foreign_agent.state["foreign_currency"] -= investment_amount
                     foreign_agent.state["domestic_currency"] += investment_amount * govt.exchange_rate
                     self.foreign_investment_allocation(foreign_agent, investment_amount * govt.exchange_rate)
@@ -175,7 +175,7 @@ class MMTScenario(BaseScenario):
                     foreign_agent.state["foreign_currency"] += divestment_amount / govt.exchange_rate
 
     def foreign_investment_allocation(self, foreign_agent, amount):
-        allocation = np.random.dirichlet(np.ones(3))
+        allocation = self.world.rng.dirichlet(np.ones(3))
         foreign_agent.state["investment_portfolio"]["stocks"] += amount * allocation[0]
         foreign_agent.state["investment_portfolio"]["bonds"] += amount * allocation[1]
         commodity_investment = amount * allocation[2]
@@ -201,8 +201,8 @@ class MMTScenario(BaseScenario):
         bond_price = financial_market.get_average_price("bond")
         
         for agent in self.world.get_agents_of_type("BasicMobileAgent"):
-            if np.random.rand() < 0.1:  # 10% chance of trading
-                if np.random.rand() < 0.5:  # Buy
+            if self.world.rng.random() < 0.1:  # 10% chance of trading
+                if self.world.rng.random() < 0.5:  # Buy
                     if agent.state["money"] > stock_price:
                         agent.state["stocks"] += 1
                         agent.state["money"] -= stock_price
@@ -211,8 +211,8 @@ class MMTScenario(BaseScenario):
                         agent.state["stocks"] -= 1
                         agent.state["money"] += stock_price
 
-            if np.random.rand() < 0.1:  # 10% chance of trading bonds
-                if np.random.rand() < 0.5:  # Buy
+            if self.world.rng.random() < 0.1:  # 10% chance of trading bonds
+                if self.world.rng.random() < 0.5:  # Buy
                     if agent.state["money"] > bond_price:
                         agent.state["bonds"] += 1
                         agent.state["money"] -= bond_price
@@ -223,7 +223,8 @@ class MMTScenario(BaseScenario):
 
     def update_commodity_prices(self):
         for commodity in self.commodity_prices:
-            price_change = np.random.normal(0, 0.02)  # Random walk with 2% standard deviation
+            # Random walk with 2% standard deviation
+            price_change = self.world.rng.normal(0, 0.02)
             self.commodity_prices[commodity] *= (1 + price_change)
 
     def get_additional_plots(self):
@@ -5,7 +5,6 @@
 # or https://opensource.org/licenses/BSD-3-Clause
 
 import numpy as np
-from numpy.random import rand
 
 from ai_economist.foundation.base.base_component import (
     BaseComponent,
@@ -36,6 +35,7 @@ class Gather(BaseComponent):
 
     name = "Gather"
     required_entities = ["Coin", "House", "Labor"]
+    snapshot_shallow_attributes = ("gathers",)
     agent_subclasses = ["BasicMobileAgent"]
 
     def __init__(
@@ -135,7 +135,9 @@ class Gather(BaseComponent):
 
             for resource, health in world.location_resources(new_r, new_c).items():
                 if health >= 1:
-                    n_gathered = 1 + (rand() < agent.state["bonus_gather_prob"])
+                    n_gathered = 1 + (
+                        world.rng.random() < agent.state["bonus_gather_prob"]
+                    )
                     agent.state["inventory"][resource] += n_gathered
                     world.consume_resource(resource, new_r, new_c)
                     # Incur the labor cost of collecting a resource
@@ -174,14 +176,12 @@ class Gather(BaseComponent):
         world = self.world
 
         coords = np.array([agent.loc for agent in world.agents])[:, :, None]
-        ris = coords[:, 0] + self._roff + 1
-        cis = coords[:, 1] + self._coff + 1
+        ris = coords[:, 0] + self._roff
+        cis = coords[:, 1] + self._coff
 
-        occ = np.pad(world.maps.unoccupied, ((1, 1), (1, 1)))
-        acc = np.pad(world.maps.accessibility, ((0, 0), (1, 1), (1, 1)))
-        mask_array = np.logical_and(occ[ris, cis], acc[self._aidx, ris, cis]).astype(
-            np.float32
-        )
+        occ = world.maps.unoccupied_at(ris, cis)
+        acc = world.maps.accessible_at(self._aidx, ris, cis)
+        mask_array = np.logical_and(occ, acc).astype(np.float32)
 
         masks = {agent.idx: mask_array[i] for i, agent in enumerate(world.agents)}
 
@@ -200,9 +200,9 @@ class Gather(BaseComponent):
             if self.skill_dist == "none":
                 bonus_rate = 0.0
             elif self.skill_dist == "pareto":
-                bonus_rate = np.minimum(2, np.random.pareto(3)) / 2
+                bonus_rate = np.minimum(2, self.world.rng.pareto(3)) / 2
             elif self.skill_dist == "lognormal":
-                bonus_rate = np.minimum(2, np.random.lognormal(-2.022, 0.938)) / 2
+                bonus_rate = np.minimum(2, self.world.rng.lognormal(-2.022, 0.938)) / 2
             else:
                 raise NotImplementedError
             agent.state["bonus_gather_prob"] = float(bonus_rate)
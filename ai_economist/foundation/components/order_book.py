@@ -0,0 +1,432 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+from collections import deque
+
+import numpy as np
+
+# Fields of the records of a TradeTape
+TRADE_DTYPE = np.dtype(
+    [
+        ("step", np.int64),
+        ("commodity", np.int16),
+        ("buyer", np.int32),
+        ("seller", np.int32),
+        ("bid", np.int32),
+        ("ask", np.int32),
+        ("price", np.int32),
+        ("bid_lifetime", np.int32),
+        ("ask_lifetime", np.int32),
+    ]
+)
+
+
+class OrderBook:
+    """Limit order book of a single commodity over an integer price grid.
+
+    Each price level of each side holds a FIFO queue of orders, and the book keeps
+    pointers to the best (highest) bid and best (lowest) ask levels with open
+    orders. Orders are also filed in expiry buckets keyed by the step at which
+    they were created. Orders are dictionaries:
+        {"agent": agent index, "price": price, "created": creation step,
+         "open": whether the order is still in the book}.
+
+    Removing an order from the middle of a queue only flags it as closed; closed
+    orders are dropped once they reach the front of their queue. Matching and
+    expiry therefore take time proportional to the number of trades and expired
+    orders (plus the orders that they skip, see match).
+
+    Args:
+        price_floor (int): Lowest price of the grid.
+        price_ceiling (int): Highest price of the grid.
+    """
+
+    def __init__(self, price_floor, price_ceiling):
+        assert price_ceiling >= price_floor
+        self.price_floor = int(price_floor)
+        self.price_ceiling = int(price_ceiling)
+        self.n_prices = 1 + self.price_ceiling - self.price_floor
+
+        self._bids = [deque() for _ in range(self.n_prices)]
+        self._asks = [deque() for _ in range(self.n_prices)]
+        # Number of open orders at each price level
+        self._n_bids = [0] * self.n_prices
+        self._n_asks = [0] * self.n_prices
+        # Best levels with open orders (-1 / n_prices when a side is empty)
+        self._best_bid = -1
+        self._best_ask = self.n_prices
+        # {creation step: [orders created at that step]}
+        self._expiry = {}
+
+    # Adding and removing orders
+    # --------------------------
+
+    def add_bid(self, agent_idx, price, step):
+        """Add a bid by agent agent_idx at price, created at step. Return it."""
+        level = int(price) - self.price_floor
+        order = {"agent": agent_idx, "price": int(price), "created": step, "open": True}
+        self._bids[level].append(order)
+        self._n_bids[level] += 1
+        self._best_bid = max(self._best_bid, level)
+        self._expiry.setdefault(step, []).append((True, order))
+        return order
+
+    def add_ask(self, agent_idx, price, step):
+        """Add an ask by agent agent_idx at price, created at step. Return it."""
+        level = int(price) - self.price_floor
+        order = {"agent": agent_idx, "price": int(price), "created": step, "open": True}
+        self._asks[level].append(order)
+        self._n_asks[level] += 1
+        self._best_ask = min(self._best_ask, level)
+        self._expiry.setdefault(step, []).append((False, order))
+        return order
+
+    def _close(self, order, is_bid):
+        """Take an open order out of the book and update the best-price pointers."""
+        order["open"] = False
+        level = order["price"] - self.price_floor
+        if is_bid:
+            queue, counts = self._bids[level], self._n_bids
+        else:
+            queue, counts = self._asks[level], self._n_asks
+        counts[level] -= 1
+        while queue and not queue[0]["open"]:
+            queue.popleft()
+
+        if is_bid:
+            while self._best_bid >= 0 and self._n_bids[self._best_bid] == 0:
+                self._best_bid -= 1
+        else:
+            while self._best_ask < self.n_prices and self._n_asks[self._best_ask] == 0:
+                self._best_ask += 1
+
+    def expire(self, created):
+        """Remove the open orders created at step created.
+
+        Returns:
+            expired_bids (list): The removed bids.
+            expired_asks (list): The removed asks.
+        """
+        expired_bids, expired_asks = [], []
+        for is_bid, order in self._expiry.pop(created, []):
+            if order["open"]:
+                self._close(order, is_bid)
+                (expired_bids if is_bid else expired_asks).append(order)
+        return expired_bids, expired_asks
+
+    # Matching
+    # --------
+
+    def _best_ask_for(self, buyer, max_level):
+        """Return the first open ask up to max_level not placed by buyer (or None)."""
+        for level in range(self._best_ask, max_level + 1):
+            if self._n_asks[level] == 0:
+                continue
+            for ask in self._asks[level]:
+                if ask["open"] and ask["agent"] != buyer:
+                    return ask
+        return None
+
+    def match(self):
+        """Pair crossing bids and asks, removing them from the book.
+
+        Bids are considered in priority order: highest price first and, within a
+        price level, earliest first. The current bid is paired with the first ask
+        in priority order (lowest price first, earliest first) that was not placed
+        by the same agent, if that ask does not cost more than the bid. Otherwise,
+        the agent of the bid cannot trade anymore during this call and its bids
+        are skipped. Matching stops when no remaining bid can trade.
+
+        Returns:
+            matches (list): (bid, ask) pairs, in the order they were made.
+        """
+        matches = []
+        excluded = set()
+        level = self._best_bid
+        pos = 0
+        while level >= 0 and level >= self._best_ask:
+            queue = self._bids[level]
+            if pos >= len(queue):
+                level -= 1
+                pos = 0
+                continue
+            bid = queue[pos]
+            if not bid["open"] or bid["agent"] in excluded:
+                pos += 1
+                continue
+
+            ask = self._best_ask_for(bid["agent"], level)
+            if ask is None:
+                excluded.add(bid["agent"])
+                pos += 1
+                continue
+
+            matches.append((bid, ask))
+            is_head = pos == 0
+            self._close(bid, True)
+            self._close(ask, False)
+            # Closing the front bid dropped it (and any closed bids behind it)
+            if is_head:
+                pos = 0
+        return matches
+
+    def _take_best(self, queues, levels, n_fills, rng):
+        """Return n_fills open orders of queues, taken level by level in the order
+        of levels. Orders of the last level are drawn at random."""
+        orders = []
+        for level in levels:
+            remaining = n_fills - len(orders)
+            if remaining == 0:
+                break
+            level_orders = [o for o in queues[level] if o["open"]]
+            if len(level_orders) > remaining:
+                chosen = rng.choice(len(level_orders), remaining, replace=False)
+                level_orders = [level_orders[i] for i in np.sort(chosen)]
+            orders.extend(level_orders)
+        return orders
+
+    def clear(self, rng):
+        """Clear the book as a call auction, at a single price.
+
+        The clearing price maximizes the number of units traded, given by the
+        cumulative demand (bids at or above a price) and supply (asks at or below
+        it). Ties are broken by the smallest demand-supply imbalance, and then by
+        the median of the remaining prices. Bids and asks are filled in price
+        order, and orders at the marginal price level are picked at random. Filled
+        bids and asks are then paired at random, and self-trading pairs are
+        re-paired in a single pass over the pairs. Orders of self-trading pairs that
+        cannot be re-paired stay in the book. Clearing takes time proportional to
+        the number of price levels and orders.
+
+        Args:
+            rng (Generator): Random number generator for the tie-breaking.
+
+        Returns:
+            price (int): The clearing price (None if no orders cross).
+            matches (list): (bid, ask) pairs, which trade at the clearing price.
+        """
+        demand = np.cumsum(self._n_bids[::-1])[::-1]
+        supply = np.cumsum(self._n_asks)
+        volume = np.minimum(demand, supply)
+        n_fills = int(volume.max())
+        if n_fills == 0:
+            return None, []
+        candidates = np.flatnonzero(volume == n_fills)
+        imbalance = np.abs(demand - supply)[candidates]
+        candidates = candidates[imbalance == imbalance.min()]
+        level = int(candidates[(len(candidates) - 1) // 2])
+
+        bids = self._take_best(
+            self._bids, range(self.n_prices - 1, level - 1, -1), n_fills, rng
+        )
+        asks = self._take_best(self._asks, range(level + 1), n_fills, rng)
+        asks = [asks[i] for i in rng.permutation(n_fills)]
+
+        # Re-pair the self-trading pairs, grouped by agent
+        conflicts = {}
+        for i in range(n_fills):
+            agent = bids[i]["agent"]
+            if agent == asks[i]["agent"]:
+                conflicts.setdefault(agent, []).append(i)
+        matched = [True] * n_fills
+        if conflicts:
+            groups = sorted(conflicts.values(), key=len)
+            largest = groups.pop()
+            others = [i for group in groups for i in group]
+            if len(largest) <= len(others):
+                # With contiguous groups, rotating the asks by the size of the
+                # largest group gives every bid the ask of another agent
+                positions = others + largest
+                rotated = [
+                    asks[positions[(k + len(largest)) % len(positions)]]
+                    for k in range(len(positions))
+                ]
+                for i, ask in zip(positions, rotated):
+                    asks[i] = ask
+            else:
+                # Swap asks between the largest group and the other groups, then
+                # the rest of the largest group with pairs not involving its agent
+                for i, j in zip(others, largest):
+                    asks[i], asks[j] = asks[j], asks[i]
+                agent = bids[largest[0]]["agent"]
+                j = 0
+                for i in largest[len(others) :]:
+                    while j < n_fills and agent in (
+                        bids[j]["agent"],
+                        asks[j]["agent"],
+                    ):
+                        j += 1
+                    if j == n_fills:
+                        matched[i] = False
+                    else:
+                        asks[i], asks[j] = asks[j], asks[i]
+
+        matches = []
+        for bid, ask, is_matched in zip(bids, asks, matched):
+            if is_matched:
+                self._close(bid, True)
+                self._close(ask, False)
+                matches.append((bid, ask))
+        return self.price_floor + level, matches
+
+    # Inspection
+    # ----------
+
+    @property
+    def best_bid(self):
+        """Highest open bid price (None if there are no bids)."""
+        if self._best_bid < 0:
+            return None
+        return self.price_floor + self._best_bid
+
+    @property
+    def best_ask(self):
+        """Lowest open ask price (None if there are no asks)."""
+        if self._best_ask >= self.n_prices:
+            return None
+        return self.price_floor + self._best_ask
+
+    @property
+    def bids(self):
+        """List of the open bids, in priority order."""
+        return [b for queue in reversed(self._bids) for b in queue if b["open"]]
+
+    @property
+    def asks(self):
+        """List of the open asks, in priority order."""
+        return [a for queue in self._asks for a in queue if a["open"]]
+
+    def __len__(self):
+        return sum(self._n_bids) + sum(self._n_asks)
+
+
+class TradeTape:
+    """Append-only record of executed trades, stored as a structured array.
+
+    Each trade is a record of TRADE_DTYPE: the step at which it happened, the
+    index of the commodity, the buyer and seller indices, the bid and ask prices,
+    the trade price and the lifetimes of the bid and ask. The array grows by
+    doubling, so appending a trade takes amortized constant time, and aggregate
+    statistics can be computed from its columns without Python loops.
+
+    Args:
+        commodities (list): Names of the traded commodities (indexed by the
+            "commodity" field).
+        capacity (int): Number of records to allocate initially.
+    """
+
+    def __init__(self, commodities, capacity=256):
+        self.commodities = list(commodities)
+        self._commodity_idx = {c: i for i, c in enumerate(self.commodities)}
+        self._records = np.zeros(max(1, int(capacity)), dtype=TRADE_DTYPE)
+        self._n_trades = 0
+        self.n_steps = 0
+
+    def new_step(self):
+        """Start recording the trades of a new step."""
+        self.n_steps += 1
+
+    def append(
+        self, commodity, buyer, seller, bid, ask, price, bid_lifetime, ask_lifetime
+    ):
+        """Record a trade of the current step (commodity is the commodity name)."""
+        self._reserve(1)
+        self._records[self._n_trades] = (
+            self.n_steps - 1,
+            self._commodity_idx[commodity],
+            buyer,
+            seller,
+            bid,
+            ask,
+            price,
+            bid_lifetime,
+            ask_lifetime,
+        )
+        self._n_trades += 1
+
+    def extend(
+        self,
+        commodity,
+        buyers,
+        sellers,
+        bids,
+        asks,
+        prices,
+        bid_lifetimes,
+        ask_lifetimes,
+    ):
+        """Record trades of commodity at the current step (see append). The other
+        arguments are arrays (or scalars, for values shared by all the trades)."""
+        n = len(buyers)
+        self._reserve(n)
+        records = self._records[self._n_trades : self._n_trades + n]
+        records["step"] = self.n_steps - 1
+        records["commodity"] = self._commodity_idx[commodity]
+        records["buyer"] = buyers
+        records["seller"] = sellers
+        records["bid"] = bids
+        records["ask"] = asks
+        records["price"] = prices
+        records["bid_lifetime"] = bid_lifetimes
+        records["ask_lifetime"] = ask_lifetimes
+        self._n_trades += n
+
+    def _reserve(self, n):
+        """Grow the records (by doubling) until n more trades fit."""
+        capacity = len(self._records)
+        while self._n_trades + n > capacity:
+            capacity *= 2
+        if capacity > len(self._records):
+            records = np.zeros(capacity, dtype=TRADE_DTYPE)
+            records[: self._n_trades] = self.records
+            self._records = records
+
+    @property
+    def records(self):
+        """Structured array of the recorded trades (a view, in recording order)."""
+        return self._records[: self._n_trades]
+
+    def __len__(self):
+        return self._n_trades
+
+    def __deepcopy__(self, memo):
+        # Only copy the filled records
+        tape = TradeTape(self.commodities, capacity=len(self._records))
+        tape._records[: self._n_trades] = self.records
+        tape._n_trades = self._n_trades
+        tape.n_steps = self.n_steps
+        return tape
+
+    def to_dicts(self):
+        """
+        Return the trades as dictionaries, grouped by step.
+
+        Returns:
+            trades (list): One list per step, holding a dictionary for each trade
+                of the step, with the keys "commodity", "buyer", "bid",
+                "bid_lifetime", "seller", "ask", "ask_lifetime", "price", "cost" and
+                "income" (what the buyer pays and the seller receives, both equal to
+                the price).
+        """
+        trades = [[] for _ in range(self.n_steps)]
+        columns = {k: self.records[k].tolist() for k in TRADE_DTYPE.names}
+        for i, step in enumerate(columns["step"]):
+            price = columns["price"][i]
+            trades[step].append(
+                {
+                    "commodity": self.commodities[columns["commodity"][i]],
+                    "buyer": columns["buyer"][i],
+                    "bid": columns["bid"][i],
+                    "bid_lifetime": columns["bid_lifetime"][i],
+                    "seller": columns["seller"][i],
+                    "ask": columns["ask"][i],
+                    "ask_lifetime": columns["ask_lifetime"][i],
+                    "price": price,
+                    "cost": price,
+                    "income": price,
+                }
+            )
+        return trades
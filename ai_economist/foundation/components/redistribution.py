@@ -132,6 +132,12 @@ class PeriodicBracketTax(BaseComponent):
     name = "PeriodicBracketTax"
     component_type = "PeriodicTax"
     required_entities = ["Coin"]
+    snapshot_shallow_attributes = (
+        "taxes",
+        "all_effective_tax_rates",
+        "_local_saez_buffer",
+        "_global_saez_buffer",
+    )
     agent_subclasses = ["BasicMobileAgent", "BasicPlanner"]
 
     def __init__(
@@ -449,7 +455,7 @@ class PeriodicBracketTax(BaseComponent):
 
         # If no enough samples, use random taxes.
         if not self._reached_min_samples:
-            self.curr_bracket_tax_rates = np.random.uniform(
+            self.curr_bracket_tax_rates = self.world.rng.uniform(
                 low=self.rate_min,
                 high=self.curr_rate_max,
                 size=self.curr_bracket_tax_rates.shape,
@@ -0,0 +1,382 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Process-pool backend that runs Foundation environments in worker processes and
+exchanges observations, rewards, dones and actions through shared memory.
+"""
+
+import multiprocessing as mp
+import random
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ai_economist import foundation
+
+# Commands broadcast by the parent process to the workers
+_CMD_RESET = 0
+_CMD_STEP = 1
+_CMD_CLOSE = 2
+
+# Byte alignment of each array inside the shared memory block
+_ALIGNMENT = 64
+
+
+def _flatten_leaves(data, prefix=()):
+    """Return a list of (path, array) tuples for the leaves of a nested dict."""
+    if isinstance(data, dict):
+        leaves = []
+        for k, v in data.items():
+            leaves += _flatten_leaves(v, prefix + (k,))
+        return leaves
+    return [(prefix, np.asarray(data))]
+
+
+def _unflatten_leaves(leaves):
+    """Inverse of _flatten_leaves: build a nested dict from (path, value) tuples."""
+    data = {}
+    for path, value in leaves:
+        node = data
+        for k in path[:-1]:
+            node = node.setdefault(k, {})
+        node[path[-1]] = value
+    return data
+
+
+class _SharedArrays:
+    """
+    A set of named NumPy arrays that all live inside a single shared memory block.
+
+    Args:
+        specs (list): List of (name, shape, dtype) tuples describing the arrays.
+        shm_name (str): Name of an existing shared memory block to attach to. If
+            None (the default), a new block is created.
+    """
+
+    def __init__(self, specs, shm_name=None):
+        self.specs = [
+            (name, tuple(shape), np.dtype(dtype)) for name, shape, dtype in specs
+        ]
+
+        offsets = []
+        n_bytes = 0
+        for _, shape, dtype in self.specs:
+            offsets.append(n_bytes)
+            size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            n_bytes += -(-size // _ALIGNMENT) * _ALIGNMENT
+
+        if shm_name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(n_bytes, 1))
+            self._owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=shm_name)
+            self._owner = False
+
+        self.arrays = {}
+        for (name, shape, dtype), offset in zip(self.specs, offsets):
+            self.arrays[name] = np.ndarray(
+                shape, dtype=dtype, buffer=self.shm.buf, offset=offset
+            )
+            if self._owner:
+                self.arrays[name][...] = 0
+
+    @property
+    def name(self):
+        """Name of the underlying shared memory block."""
+        return self.shm.name
+
+    def close(self):
+        """Release the views and the block (and unlink it if this is the owner)."""
+        self.arrays = {}
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def _worker(
+    worker_idx,
+    env_config,
+    env_indices,
+    shm_name,
+    specs,
+    barrier,
+    seed,
+):
+    """Worker loop: wait for a command, execute it on the local envs, repeat."""
+    shared = _SharedArrays(specs, shm_name=shm_name)
+    arrays = shared.arrays
+    command = arrays["command"]
+
+    # Each env draws from its own generator; when a seed is given, env i of the pool
+    # is seeded with seed + i, independently of how envs are split across workers.
+    # The global RNGs are reseeded too, since forked workers would otherwise share
+    # the same state.
+    if seed is None:
+        np.random.seed()
+        random.seed()
+        envs = [foundation.make_env_instance(**env_config) for _ in env_indices]
+    else:
+        np.random.seed((int(seed) + worker_idx) % 2 ** 32)
+        random.seed(int(seed) + worker_idx)
+        envs = [
+            foundation.make_env_instance(**dict(env_config, seed=int(seed) + env_idx))
+            for env_idx in env_indices
+        ]
+
+    def write_obs(prefix, env_idx, obs):
+        for path, value in _flatten_leaves(obs):
+            arrays[prefix + "/".join(path)][env_idx] = value
+
+    try:
+        while True:
+            barrier.wait()
+            cmd = int(command[0])
+
+            if cmd == _CMD_CLOSE:
+                break
+
+            for env_idx, env in zip(env_indices, envs):
+                if cmd == _CMD_RESET:
+                    write_obs("obs/", env_idx, env.stack_agent_obs(env.reset()))
+                    continue
+
+                obs, rew, done = env.step_arrays(
+                    arrays["actions"][env_idx], arrays["planner_actions"][env_idx]
+                )
+                arrays["rew_a"][env_idx] = rew[:-1]
+                arrays["rew_p"][env_idx] = rew[-1]
+                arrays["done"][env_idx] = done
+
+                if done:
+                    write_obs("terminal_obs/", env_idx, obs)
+                    obs = env.stack_agent_obs(env.reset())
+                write_obs("obs/", env_idx, obs)
+
+            barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    except Exception:
+        # Unblock the parent (and the other workers) instead of deadlocking.
+        barrier.abort()
+        raise
+    finally:
+        shared.close()
+
+
+class SharedMemoryEnvPool:
+    """
+    Run environment instances built from a single config in worker processes.
+
+    Each worker process holds a contiguous slice of the environments. Workers write
+    observations (including action masks), rewards and dones directly into
+    preallocated multiprocessing.shared_memory buffers, and read actions from them,
+    so nothing is pickled while stepping. The parent process sees the buffers as
+    zero-copy NumPy views. Stepping is synchronized through a single
+    multiprocessing.Barrier shared by the parent and all workers, rather than
+    through per-env messages.
+
+    Observations are laid out like the outputs of VectorEnv (see vector_env.py):
+    mobile agents are grouped under "a" with leaves of shape [n_envs, n_agents, ...]
+    and the planner under "p" with leaves of shape [n_envs, ...]. Because the buffer
+    sizes are fixed at construction, observations must have a fixed structure,
+    which requires flatten_masks=True (the default).
+
+    Environments that finish their episode are reset automatically. The
+    observations produced by their final step are written to terminal_obs.
+
+    Note:
+        The arrays returned by reset and step are views into the shared buffers
+        and are overwritten by the next call. Copy them if they need to persist.
+
+    Example:
+        with SharedMemoryEnvPool(env_config, n_envs=256, n_workers=64) as pool:
+            obs = pool.reset()
+            for _ in range(1000):
+                actions = policy(obs)
+                obs, rew, done = pool.step(actions)
+
+    Args:
+        env_config (dict): The kwargs used to create each environment instance
+            through foundation.make_env_instance. Must include "scenario_name".
+        n_envs (int): Total number of environment instances.
+        n_workers (int): Number of worker processes. The environments are split
+            evenly amongst the workers. Defaults to min(n_envs, cpu_count).
+        seed (int, optional): If provided, environment i is seeded with seed + i
+            (see BaseEnvironment.seed). Otherwise, environments seed from OS entropy.
+        start_method (str, optional): The multiprocessing start method to use
+            (e.g. "fork", "spawn"). Defaults to the platform default.
+    """
+
+    def __init__(
+        self, env_config, n_envs, n_workers=None, seed=None, start_method=None
+    ):
+        assert isinstance(env_config, dict)
+        assert "scenario_name" in env_config
+        assert env_config.get("flatten_masks", True)
+
+        assert isinstance(n_envs, int)
+        assert n_envs >= 1
+        self.n_envs = n_envs
+
+        if n_workers is None:
+            n_workers = min(n_envs, mp.cpu_count())
+        assert 1 <= n_workers <= n_envs
+        self.n_workers = int(n_workers)
+
+        self.env_config = dict(env_config)
+        self.env_config["collate_agent_step_and_reset_data"] = False
+
+        # Use a probe environment to figure out the buffer shapes.
+        probe_env = foundation.make_env_instance(**self.env_config)
+        self.n_agents = probe_env.n_agents
+        planner = probe_env.world.planner
+        probe_obs = probe_env.stack_agent_obs(probe_env.reset())
+
+        agent = probe_env.world.agents[0]
+        action_shape = (n_envs, self.n_agents)
+        if agent.multi_action_mode:
+            action_shape += (len(agent.action_spaces),)
+        planner_action_shape = (n_envs,)
+        if planner.multi_action_mode:
+            planner_action_shape += (len(planner.action_spaces),)
+        del probe_env
+
+        self._obs_leaves = _flatten_leaves(probe_obs)
+        specs = [
+            ("command", (1,), np.int32),
+            ("actions", action_shape, np.int32),
+            ("planner_actions", planner_action_shape, np.int32),
+            ("rew_a", (n_envs, self.n_agents), np.float32),
+            ("rew_p", (n_envs,), np.float32),
+            ("done", (n_envs,), np.bool_),
+        ]
+        for prefix in ["obs/", "terminal_obs/"]:
+            for path, value in self._obs_leaves:
+                specs.append(
+                    (prefix + "/".join(path), (n_envs,) + value.shape, value.dtype)
+                )
+
+        self._shared = _SharedArrays(specs)
+        arrays = self._shared.arrays
+
+        self.actions = arrays["actions"]
+        self.planner_actions = arrays["planner_actions"]
+        self.rew = {"a": arrays["rew_a"], "p": arrays["rew_p"]}
+        self.done = arrays["done"]
+        self.obs = _unflatten_leaves(
+            [(path, arrays["obs/" + "/".join(path)]) for path, _ in self._obs_leaves]
+        )
+        self.terminal_obs = _unflatten_leaves(
+            [
+                (path, arrays["terminal_obs/" + "/".join(path)])
+                for path, _ in self._obs_leaves
+            ]
+        )
+
+        ctx = mp.get_context(start_method)
+        self._barrier = ctx.Barrier(self.n_workers + 1)
+        self._processes = []
+        for worker_idx, env_indices in enumerate(
+            np.array_split(np.arange(n_envs), self.n_workers)
+        ):
+            process = ctx.Process(
+                target=_worker,
+                args=(
+                    worker_idx,
+                    self.env_config,
+                    [int(i) for i in env_indices],
+                    self._shared.name,
+                    self._shared.specs,
+                    self._barrier,
+                    seed,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+        self._closed = False
+
+    def _run(self, cmd):
+        """Broadcast a command to the workers and wait until all are done."""
+        assert not self._closed
+        self._shared.arrays["command"][0] = cmd
+        try:
+            self._barrier.wait()
+            self._barrier.wait()
+        except threading.BrokenBarrierError:
+            self.close()
+            raise RuntimeError("An environment worker process failed.")
+
+    def reset(self):
+        """
+        Reset all the environments.
+
+        Returns:
+            obs (dict): Shared views of the stacked observations
+                {"a": agent_obs, "p": planner_obs}.
+        """
+        self._run(_CMD_RESET)
+        return self.obs
+
+    def step(self, actions=None, planner_actions=None):
+        """
+        Step all the environments in lockstep.
+
+        Args:
+            actions (ndarray): Integer array of mobile agent actions with shape
+                [n_envs, n_agents] (or [n_envs, n_agents, n_action_subspaces] in
+                multi_action_mode). If None, the contents of the shared action
+                buffer (self.actions) are used, which allows policies to write their
+                actions there directly.
+            planner_actions (ndarray): Integer array of planner actions with shape
+                [n_envs] (or [n_envs, n_action_subspaces] in multi_action_mode). If
+                None, the contents of self.planner_actions are used.
+
+        Returns:
+            obs (dict): Shared views of the stacked observations (after any
+                automatic resets).
+            rew (dict): Shared views of the rewards {"a": [n_envs, n_agents] float32,
+                "p": [n_envs] float32}.
+            done (ndarray): Shared view of the [n_envs] boolean done flags.
+        """
+        if actions is not None:
+            self.actions[...] = actions
+        if planner_actions is not None:
+            self.planner_actions[...] = planner_actions
+        self._run(_CMD_STEP)
+        return self.obs, self.rew, self.done
+
+    def close(self):
+        """Shut down the worker processes and release the shared memory."""
+        if self._closed:
+            return
+        if not self._barrier.broken:
+            self._shared.arrays["command"][0] = _CMD_CLOSE
+            try:
+                self._barrier.wait(timeout=10)
+            except threading.BrokenBarrierError:
+                pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.obs = self.terminal_obs = self.rew = None
+        self.actions = self.planner_actions = self.done = None
+        self._shared.close()
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if not getattr(self, "_closed", True):
+            self.close()
@@ -388,10 +388,16 @@ class FoundationEnvWrapper:
         if "a" in obs:
             # This means the env uses collated obs.
             # Set each individual agent as obs keys for processing with WarpDrive.
+            # Move the agent axis (last) to the front once per key, so that each
+            # agent's obs is a contiguous array view rather than a strided slice.
+            agent_first = {
+                key: np.ascontiguousarray(np.moveaxis(np.asarray(value), -1, 0))
+                for key, value in obs["a"].items()
+            }
             for agent_id in range(self.env.n_agents):
-                obs[str(agent_id)] = {}
-                for key in obs["a"].keys():
-                    obs[str(agent_id)][key] = obs["a"][key][..., agent_id]
+                obs[str(agent_id)] = {
+                    key: value[agent_id] for key, value in agent_first.items()
+                }
             del obs["a"]  # remove the key "a"
         return obs
 
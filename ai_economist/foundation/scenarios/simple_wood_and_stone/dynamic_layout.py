@@ -4,13 +4,19 @@
 # For full license text, see the LICENSE file in the repo root
 # or https://opensource.org/licenses/BSD-3-Clause
 
+import os
 from copy import deepcopy
 
 import numpy as np
 from scipy import signal
 
 from ai_economist.foundation.base.base_env import BaseEnvironment, scenario_registry
-from ai_economist.foundation.scenarios.utils import rewards, social_metrics
+from ai_economist.foundation.scenarios.utils import (
+    layout_pool,
+    regeneration,
+    rewards,
+    social_metrics,
+)
 
 
 @scenario_registry.add
@@ -70,6 +76,16 @@ class Uniform(BaseEnvironment):
         mixing_weight_gini_vs_coin (float): Degree to which equality is ignored w/
             "coin_eq_times_productivity". Default is 0, which weights equality and
             productivity equally. If set to 1, only productivity is rewarded.
+        layout_pool_size (int): If positive, starting layouts are drawn from a pool
+            of this many layouts, which is filled in a background thread and shared
+            by the environments (of this process) with the same layout parameters.
+            Default is 0, which generates a new layout at each reset.
+        layout_pool_max_uses (int): Number of resets after which a pooled layout is
+            replaced by a freshly generated one. Default is 0, which keeps pooled
+            layouts indefinitely.
+        layout_pool_dir (str): Directory where the layout pool is saved (as a .npz
+            file) and loaded from, so that it persists across runs. Default is None
+            (no persistence).
 
     """
 
@@ -77,6 +93,9 @@ class Uniform(BaseEnvironment):
     agent_subclasses = ["BasicMobileAgent", "BasicPlanner"]
     required_entities = ["Wood", "Stone"]
 
+    # The layout pool is shared with other environments and holds no episode state
+    _snapshot_exclude = BaseEnvironment._snapshot_exclude + ("_layout_pool",)
+
     def __init__(
         self,
         *base_env_args,
@@ -102,6 +121,9 @@ class Uniform(BaseEnvironment):
         energy_warmup_method="decay",
         planner_reward_type="coin_eq_times_productivity",
         mixing_weight_gini_vs_coin=0.0,
+        layout_pool_size=0,
+        layout_pool_max_uses=0,
+        layout_pool_dir=None,
         **base_env_kwargs
     ):
         super().__init__(*base_env_args, **base_env_kwargs)
@@ -113,6 +135,18 @@ class Uniform(BaseEnvironment):
         self._full_observability = bool(full_observability)
 
         self._mobile_agent_observation_range = int(mobile_agent_observation_range)
+        if not self._full_observability:
+            # Pad the maps so that observation windows are read without copies
+            self.world.maps.reserve_window_padding(
+                self._mobile_agent_observation_range
+            )
+        # Value of each agent's own index in the (shifted) idx_map observations,
+        # shaped to broadcast against [n_agents, channels, height, width] arrays
+        self._own_idx_values = (np.arange(self.n_agents) + 2)[:, None, None, None]
+
+        # Source blocks and regeneration kernels of the current layout
+        # (see reset_agent_states)
+        self._source_cells = None
 
         # For controlling how resource regeneration behavior
         #  - Coverage: if fraction, target fraction of total tiles;
@@ -176,6 +210,15 @@ class Uniform(BaseEnvironment):
             k: np.zeros_like(v) for k, v in self.source_prob_maps.items()
         }
 
+        # Pool of pre-generated starting layouts (created upon the first reset, once
+        # the layout parameters are final)
+        self._layout_pool_size = int(layout_pool_size)
+        assert self._layout_pool_size >= 0
+        self._layout_pool_max_uses = int(layout_pool_max_uses)
+        assert self._layout_pool_max_uses >= 0
+        self._layout_pool_dir = layout_pool_dir
+        self._layout_pool = None
+
         # How much coin do agents begin with at upon reset
         self.starting_agent_coin = float(starting_agent_coin)
         assert self.starting_agent_coin >= 0.0
@@ -307,37 +350,61 @@ class Uniform(BaseEnvironment):
             * self.layout_specs["Wood"]["starting_coverage"],
         }
 
-    # The following methods must be implemented for each scenario
-    # -----------------------------------------------------------
+    def layout_params(self):
+        """
+        Parameters that determine the distribution of starting layouts, used as the
+        key of the layout pool.
 
-    def reset_starting_layout(self):
+        Returns:
+            params (dict): JSON-serializable layout parameters.
         """
-        Part 1/2 of scenario reset. This method handles resetting the state of the
-        environment managed by the scenario (i.e. resource & landmark layout).
+        return {
+            "scenario": self.name,
+            "world_size": [int(v) for v in self.world_size],
+            "starting_coverage": {
+                k: v["starting_coverage"] for k, v in self.layout_specs.items()
+            },
+            "clumpiness": self.clumpiness,
+            "gradient_steepness": self.gradient_steepness,
+            "checker_source_blocks": self._checker_source_blocks,
+        }
 
-        Here, generate a resource source layout consistent with target parameters.
+    def generate_source_maps(self, rng, source_prob_maps=None):
         """
+        Generate a resource source layout consistent with target parameters.
+
+        This does not modify the environment, so that layouts can be generated in
+        the background (see layout_pool_size).
+
+        Args:
+            rng (Generator): The random number generator to draw from.
+            source_prob_maps (dict): The source probability maps to use. Defaults to
+                self.source_prob_maps.
+
+        Returns:
+            source_maps (dict): Contains a (boolean) source map for both stone and
+                wood.
+        """
+        if source_prob_maps is None:
+            source_prob_maps = self.source_prob_maps
+
         happy_coverage = False
         n_reset_tries = 0
 
         # Attempt to do a reset until an attempt limit is reached or coverage is good
         while n_reset_tries < 100 and not happy_coverage:
-            self.world.maps.clear()
+            empty = np.ones(self.world_size, dtype=bool)
 
-            self.source_maps = {
-                k: np.zeros_like(v) for k, v in self.source_prob_maps.items()
-            }
+            source_maps = {}
 
             resources = ["Wood", "Stone"]
 
             for resource in resources:
                 clump = 1 - np.clip(self.clumpiness[resource], 0.0, 0.99)
 
-                source_prob = self.source_prob_maps[resource] * 0.1 * clump
+                source_prob = source_prob_maps[resource] * 0.1 * clump
 
-                empty = self.world.maps.empty
-
-                tmp = np.random.rand(*source_prob.shape)
+                tmp = rng.random(source_prob.shape)
                 maybe_source_map = (tmp < source_prob) * empty
 
                 n_tries = 0
@@ -354,27 +421,24 @@ class Uniform(BaseEnvironment):
                     np.mean(maybe_source_map)
                     < self.layout_specs[resource]["starting_coverage"]
                 ):
-                    kernel = np.random.randn(7, 7) > 0
+                    kernel = rng.standard_normal((7, 7)) > 0
                     tmp = signal.convolve2d(
                         maybe_source_map
-                        + (0.2 * np.random.randn(*maybe_source_map.shape))
+                        + (0.2 * rng.standard_normal(maybe_source_map.shape))
                         - 0.25,
                         kernel.astype(np.float32),
                         "same",
                     )
                     maybe_source_map = np.maximum(tmp > 0, maybe_source_map) * empty
 
-                self.source_maps[resource] = maybe_source_map
-                self.world.maps.set(
-                    resource, maybe_source_map
-                )  # * self.layout_specs[resource]['max_health'])
-                self.world.maps.set(resource + "SourceBlock", maybe_source_map)
+                source_maps[resource] = maybe_source_map
+                empty = empty & ~maybe_source_map
 
             # Restart if the resource distribution is too far off the target coverage
             happy_coverage = True
             for resource in resources:
                 coverage_quotient = (
-                    np.mean(self.source_maps[resource])
+                    np.mean(source_maps[resource])
                     / self.layout_specs[resource]["starting_coverage"]
                 )
                 bound = 0.4
@@ -385,11 +449,40 @@ class Uniform(BaseEnvironment):
 
         # Apply checkering, if applicable
         if self._checker_source_blocks:
-            for resource, source_map in self.source_maps.items():
-                source_map = source_map * self._checker_mask
-                self.source_maps[resource] = source_map
-                self.world.maps.set(resource, source_map)
-                self.world.maps.set(resource + "SourceBlock", source_map)
+            for resource, source_map in source_maps.items():
+                source_maps[resource] = source_map * self._checker_mask
+
+        return source_maps
+
+    # The following methods must be implemented for each scenario
+    # -----------------------------------------------------------
+
+    def reset_starting_layout(self):
+        """
+        Part 1/2 of scenario reset. This method handles resetting the state of the
+        environment managed by the scenario (i.e. resource & landmark layout).
+
+        Here, generate a resource source layout consistent with target parameters,
+        or draw one from the layout pool (if using one).
+        """
+        if self._layout_pool_size > 0:
+            # (A pool inherited through a fork is replaced by one of this process)
+            if self._layout_pool is None or self._layout_pool.pid != os.getpid():
+                self._layout_pool = layout_pool.get_layout_pool(
+                    self.layout_params(),
+                    self.generate_source_maps,
+                    self._layout_pool_size,
+                    max_uses=self._layout_pool_max_uses,
+                    directory=self._layout_pool_dir,
+                )
+            self.source_maps = self._layout_pool.draw(self.world.rng)
+        else:
+            self.source_maps = self.generate_source_maps(self.world.rng)
+
+        self.world.maps.clear()
+        for resource, source_map in self.source_maps.items():
+            self.world.maps.set(resource, source_map)
+            self.world.maps.set(resource + "SourceBlock", source_map)
 
     def reset_agent_states(self):
         """
@@ -399,6 +492,11 @@ class Uniform(BaseEnvironment):
         Here, empty inventories, give mobile agents any starting coin, and place them
         in random accessible locations to start.
         """
+        # The layout is in place: precompute where resources can regenerate
+        self._source_cells = regeneration.get_source_cells(
+            self.world.maps, self.layout_specs, ["Wood", "Stone"]
+        )
+
         self.world.clear_agent_locs()
 
         for agent in self.world.agents:
@@ -419,12 +517,12 @@ class Uniform(BaseEnvironment):
 
         # Place the agents randomly in the world
         for agent in self.world.get_random_order_agents():
-            r = np.random.randint(0, self.world_size[0])
-            c = np.random.randint(0, self.world_size[1])
+            r = self.world.rng.integers(0, self.world_size[0])
+            c = self.world.rng.integers(0, self.world_size[1])
             n_tries = 0
             while not self.world.can_agent_occupy(r, c, agent):
-                r = np.random.randint(0, self.world_size[0])
-                c = np.random.randint(0, self.world_size[1])
+                r = self.world.rng.integers(0, self.world_size[0])
+                c = self.world.rng.integers(0, self.world_size[1])
                 n_tries += 1
                 if n_tries > 200:
                     raise TimeoutError
@@ -442,33 +540,9 @@ class Uniform(BaseEnvironment):
         regeneration.
         """
 
-        resources = ["Wood", "Stone"]
-
-        for resource in resources:
-            d = 1 + (2 * self.layout_specs[resource]["regen_halfwidth"])
-            kernel = (
-                self.layout_specs[resource]["regen_weight"] * np.ones((d, d)) / (d ** 2)
-            )
-
-            resource_map = self.world.maps.get(resource)
-            resource_source_blocks = self.world.maps.get(resource + "SourceBlock")
-            spawnable = (
-                self.world.maps.empty + resource_map + resource_source_blocks
-            ) > 0
-            spawnable *= resource_source_blocks > 0
-
-            health = np.maximum(resource_map, resource_source_blocks)
-            respawn = np.random.rand(*health.shape) < signal.convolve2d(
-                health, kernel, "same"
-            )
-            respawn *= spawnable
-
-            self.world.maps.set(
-                resource,
-                np.minimum(
-                    resource_map + respawn, self.layout_specs[resource]["max_health"]
-                ),
-            )
+        regeneration.regenerate_resources(
+            self.world.maps, self.world.rng, self._source_cells
+        )
 
     def generate_observations(self):
         """
@@ -492,13 +566,6 @@ class Uniform(BaseEnvironment):
         config) as well as the inventory of each of the mobile agents.
         """
         obs = {}
-        curr_map = self.world.maps.state
-
-        owner_map = self.world.maps.owner_state
-        loc_map = self.world.loc_map
-        agent_idx_maps = np.concatenate([owner_map, loc_map[None, :, :]], axis=0)
-        agent_idx_maps += 2
-        agent_idx_maps[agent_idx_maps == 1] = 0
 
         agent_locs = {
             str(agent.idx): {
@@ -518,6 +585,17 @@ class Uniform(BaseEnvironment):
             "inventory-" + k: v * self.inv_scale
             for k, v in self.world.planner.inventory.items()
         }
+
+        # The full maps are only built if some observation includes them
+        if self._planner_gets_spatial_info or self._full_observability:
+            # The maps are updated in place, so the observations need a copy
+            curr_map = self.world.maps.state.copy()
+            owner_map = self.world.maps.owner_state
+            loc_map = self.world.loc_map
+            agent_idx_maps = np.concatenate([owner_map, loc_map[None, :, :]], axis=0)
+            agent_idx_maps += 2
+            agent_idx_maps[agent_idx_maps == 1] = 0
+
         if self._planner_gets_spatial_info:
             obs[self.world.planner.idx].update(
                 dict(map=curr_map, idx_map=agent_idx_maps)
@@ -525,11 +603,11 @@ class Uniform(BaseEnvironment):
 
         # Mobile agents see the full map. Convey location info via one-hot map channels.
         if self._full_observability:
-            for agent in self.world.agents:
-                my_map = np.array(agent_idx_maps)
-                my_map[my_map == int(agent.idx) + 2] = 1
+            my_maps = np.repeat(agent_idx_maps[None], self.n_agents, axis=0)
+            my_maps[my_maps == self._own_idx_values] = 1
+            for i, agent in enumerate(self.world.agents):
                 sidx = str(agent.idx)
-                obs[sidx] = {"map": curr_map, "idx_map": my_map}
+                obs[sidx] = {"map": curr_map, "idx_map": my_maps[i]}
                 obs[sidx].update(agent_invs[sidx])
 
         # Mobile agents only see within a window around their position
@@ -538,34 +616,16 @@ class Uniform(BaseEnvironment):
                 self._mobile_agent_observation_range
             )  # View halfwidth (only applicable without full observability)
 
-            padded_map = np.pad(
-                curr_map,
-                [(0, 1), (w, w), (w, w)],
-                mode="constant",
-                constant_values=[(0, 1), (0, 0), (0, 0)],
-            )
-
-            padded_idx = np.pad(
-                agent_idx_maps,
-                [(0, 0), (w, w), (w, w)],
-                mode="constant",
-                constant_values=[(0, 0), (0, 0), (0, 0)],
-            )
-
-            for agent in self.world.agents:
-                r, c = [c + w for c in agent.loc]
-                visible_map = padded_map[
-                    :, (r - w) : (r + w + 1), (c - w) : (c + w + 1)
-                ]
-                visible_idx = np.array(
-                    padded_idx[:, (r - w) : (r + w + 1), (c - w) : (c + w + 1)]
-                )
-
-                visible_idx[visible_idx == int(agent.idx) + 2] = 1
+            rs, cs = np.array([agent.loc for agent in self.world.agents]).T
+            visible_maps, visible_idxs = self.world.maps.windows(rs, cs, w)
+            visible_idxs += 2
+            visible_idxs[visible_idxs == 1] = 0
+            visible_idxs[visible_idxs == self._own_idx_values] = 1
 
+            for i, agent in enumerate(self.world.agents):
                 sidx = str(agent.idx)
 
-                obs[sidx] = {"map": visible_map, "idx_map": visible_idx}
+                obs[sidx] = {"map": visible_maps[i], "idx_map": visible_idxs[i]}
                 obs[sidx].update(agent_locs[sidx])
                 obs[sidx].update(agent_invs[sidx])
 
@@ -751,6 +811,16 @@ class MultiZone(Uniform):
         mixing_weight_gini_vs_coin (float): Degree to which equality is ignored w/
             "coin_eq_times_productivity". Default is 0, which weights equality and
             productivity equally. If set to 1, only productivity is rewarded.
+        layout_pool_size (int): If positive, starting layouts are drawn from a pool
+            of this many layouts, which is filled in a background thread and shared
+            by the environments (of this process) with the same layout parameters.
+            Default is 0, which generates a new layout at each reset.
+        layout_pool_max_uses (int): Number of resets after which a pooled layout is
+            replaced by a freshly generated one. Default is 0, which keeps pooled
+            layouts indefinitely.
+        layout_pool_dir (str): Directory where the layout pool is saved (as a .npz
+            file) and loaded from, so that it persists across runs. Default is None
+            (no persistence).
     """
 
     name = "multi_zone/simple_wood_and_stone"
@@ -775,15 +845,22 @@ class MultiZone(Uniform):
 
         super().__init__(*args, **kwargs)
 
-    def make_source_prob_maps(self):
+    def make_source_prob_maps(self, rng=None):
         """
         Make maps specifying how likely each location is to be assigned as a resource
         source tile.
 
+        Args:
+            rng (Generator): The random number generator used to place the zones.
+                Defaults to the world's.
+
         Returns:
             source_prob_maps (dict): Contains a source probability map for both
                 stone and wood.
         """
+        if rng is None:
+            rng = self.world.rng
+
         # determines initial world probability masses
         zone_names = list(self.zone_specs.keys())
         zone_indices = [v[0] for _, v in self.zone_specs.items()]
@@ -811,7 +888,7 @@ class MultiZone(Uniform):
                 np.array([-1] * (num_regions - num_zones)),
             ]
         )
-        np.random.shuffle(grid_zone_indices)
+        rng.shuffle(grid_zone_indices)
         grid_zone_indices = grid_zone_indices.reshape(
             (num_partitions_row, num_partitions_col)
         )
@@ -863,13 +940,25 @@ class MultiZone(Uniform):
             "Stone": stone_prob * self.layout_specs["Wood"]["starting_coverage"],
         }
 
-    def reset_starting_layout(self):
+    def layout_params(self):
         """
-        Reset the starting layout of the world. Modifies parent scenario method such
-        that, before doing the reset, it first remakes the source prob maps.
+        Parameters that determine the distribution of starting layouts. Extends the
+        parent scenario method with the zone parameters.
         """
-        self.source_prob_maps = self.make_source_prob_maps()
-        super().reset_starting_layout()
+        params = super().layout_params()
+        params["num_partitions"] = [self.num_partitions_row, self.num_partitions_col]
+        params["zone_specs"] = self.zone_specs
+        return params
+
+    def generate_source_maps(self, rng, source_prob_maps=None):
+        """
+        Generate a resource source layout. Modifies parent scenario method such that,
+        before generating the layout, it first remakes the source prob maps (unless
+        they are given).
+        """
+        if source_prob_maps is None:
+            source_prob_maps = self.make_source_prob_maps(rng)
+        return super().generate_source_maps(rng, source_prob_maps)
 
 
 @scenario_registry.add
@@ -930,6 +1019,16 @@ class Quadrant(Uniform):
         mixing_weight_gini_vs_coin (float): Degree to which equality is ignored w/
             "coin_eq_times_productivity". Default is 0, which weights equality and
             productivity equally. If set to 1, only productivity is rewarded.
+        layout_pool_size (int): If positive, starting layouts are drawn from a pool
+            of this many layouts, which is filled in a background thread and shared
+            by the environments (of this process) with the same layout parameters.
+            Default is 0, which generates a new layout at each reset.
+        layout_pool_max_uses (int): Number of resets after which a pooled layout is
+            replaced by a freshly generated one. Default is 0, which keeps pooled
+            layouts indefinitely.
+        layout_pool_dir (str): Directory where the layout pool is saved (as a .npz
+            file) and loaded from, so that it persists across runs. Default is None
+            (no persistence).
 
     """
 
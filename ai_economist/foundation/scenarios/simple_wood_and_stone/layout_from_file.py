@@ -8,10 +8,15 @@ from copy import deepcopy
 from pathlib import Path
 
 import numpy as np
-from scipy import signal
 
 from ai_economist.foundation.base.base_env import BaseEnvironment, scenario_registry
-from ai_economist.foundation.scenarios.utils import rewards, social_metrics
+from ai_economist.foundation.base.snapshot import freeze
+from ai_economist.foundation.scenarios.utils import (
+    layout_cache,
+    regeneration,
+    rewards,
+    social_metrics,
+)
 
 
 @scenario_registry.add
@@ -32,6 +37,9 @@ class LayoutFromFile(BaseEnvironment):
         env_layout_file (str): Name of the layout file in ./map_txt/ to use.
             Note: The world dimensions of that layout must match the world dimensions
             argument used to construct the environment.
+        layout_cache_dir (str): Directory where parsed layouts are cached (as .npz
+            files), in addition to the in-memory cache shared by the environments of
+            a process. Default is None (in-memory cache only).
         resource_regen_prob (float): Probability that an empty source tile will
             regenerate a new resource unit.
         fixed_four_skill_and_loc (bool): Whether to use a fixed set of build skills and
@@ -72,6 +80,7 @@ class LayoutFromFile(BaseEnvironment):
         full_observability=False,
         mobile_agent_observation_range=5,
         env_layout_file="quadrant_25x25_20each_30clump.txt",
+        layout_cache_dir=None,
         resource_regen_prob=0.01,
         fixed_four_skill_and_loc=False,
         starting_agent_coin=0,
@@ -92,24 +101,29 @@ class LayoutFromFile(BaseEnvironment):
         self._full_observability = bool(full_observability)
 
         self._mobile_agent_observation_range = int(mobile_agent_observation_range)
+        if not self._full_observability:
+            # Pad the maps so that observation windows are read without copies
+            self.world.maps.reserve_window_padding(
+                self._mobile_agent_observation_range
+            )
+        # Value of each agent's own index in the (shifted) idx_map observations,
+        # shaped to broadcast against [n_agents, channels, height, width] arrays
+        self._own_idx_values = (np.arange(self.n_agents) + 2)[:, None, None, None]
+
+        # Source blocks and regeneration kernels of the current layout
+        # (see reset_agent_states)
+        self._source_cells = None
 
         # Load in the layout
         path_to_layout_file = Path(f"{Path(__file__).parent}/map_txt/{env_layout_file}")
 
-        with open(path_to_layout_file, "r") as f:
-            self.env_layout_string = f.read()
-            self.env_layout = self.env_layout_string.split(";")
-
-        # Convert the layout to landmark maps
-        landmark_lookup = {"W": "Wood", "S": "Stone", "@": "Water"}
-        self._source_maps = {
-            r: np.zeros(self.world_size) for r in landmark_lookup.values()
-        }
-        for r, symbol_row in enumerate(self.env_layout):
-            for c, symbol in enumerate(symbol_row):
-                landmark = landmark_lookup.get(symbol, None)
-                if landmark:
-                    self._source_maps[landmark][r, c] = 1
+        # Convert the layout to landmark maps. Parsed layouts are cached and their
+        # (read-only) maps shared by all instances, and by env snapshots
+        self.env_layout_string, source_maps = layout_cache.load_layout(
+            path_to_layout_file, self.world_size, cache_dir=layout_cache_dir
+        )
+        self.env_layout = self.env_layout_string.split(";")
+        self._source_maps = dict(source_maps)
 
         # For controlling how resource regeneration behavior
         self.layout_specs = dict(
@@ -178,21 +192,11 @@ class LayoutFromFile(BaseEnvironment):
             assert bm.skill_dist == "pareto"
             pmsm = bm.payment_max_skill_multiplier
 
-            # Temporarily switch to a fixed seed for controlling randomness
-            seed_state = np.random.get_state()
-            np.random.seed(seed=1)
-
-            # Generate a batch (100000) of num_agents (sorted/clipped) Pareto samples.
-            pareto_samples = np.random.pareto(4, size=(100000, self.n_agents))
-            clipped_skills = np.minimum(pmsm, (pmsm - 1) * pareto_samples + 1)
-            sorted_clipped_skills = np.sort(clipped_skills, axis=1)
-            # The skill level of the i-th skill-ranked agent is the average of the
-            # i-th ranked samples throughout the batch.
-            average_ranked_skills = sorted_clipped_skills.mean(axis=0)
+            # Skill multipliers by rank, averaged over a fixed-seed batch of Pareto
+            # samples (cached across instances)
+            average_ranked_skills = layout_cache.get_ranked_skills(self.n_agents, pmsm)
             self._avg_ranked_skill = average_ranked_skills * bm.payment
 
-            np.random.set_state(seed_state)
-
             # Fill in the starting location associated with each skill rank
             starting_ranked_locs = [
                 # Worst group of agents goes in top right
@@ -209,8 +213,8 @@ class LayoutFromFile(BaseEnvironment):
             # Based on skill, assign each agent to one of the location groups
             skill_groups = np.floor(
                 np.arange(self.n_agents) * (4 / self.n_agents),
-            ).astype(np.int)
-            n_in_group = np.zeros(4, dtype=np.int)
+            ).astype(int)
+            n_in_group = np.zeros(4, dtype=int)
             for g in skill_groups:
                 # The position within the group is given by the number of agents
                 # counted in the group thus far.
@@ -342,6 +346,11 @@ class LayoutFromFile(BaseEnvironment):
         locations to start. Note: If using fixed_four_skill_and_loc, the starting
         locations will be overridden in self.additional_reset_steps.
         """
+        # The layout is in place: precompute where resources can regenerate
+        self._source_cells = regeneration.get_source_cells(
+            self.world.maps, self.layout_specs, ["Wood", "Stone"]
+        )
+
         self.world.clear_agent_locs()
         for agent in self.world.agents:
             agent.state["inventory"] = {k: 0 for k in agent.inventory.keys()}
@@ -358,12 +367,12 @@ class LayoutFromFile(BaseEnvironment):
         }
 
         for agent in self.world.agents:
-            r = np.random.randint(0, self.world_size[0])
-            c = np.random.randint(0, self.world_size[1])
+            r = self.world.rng.integers(0, self.world_size[0])
+            c = self.world.rng.integers(0, self.world_size[1])
             n_tries = 0
             while not self.world.can_agent_occupy(r, c, agent):
-                r = np.random.randint(0, self.world_size[0])
-                c = np.random.randint(0, self.world_size[1])
+                r = self.world.rng.integers(0, self.world_size[0])
+                c = self.world.rng.integers(0, self.world_size[1])
                 n_tries += 1
                 if n_tries > 200:
                     raise TimeoutError
@@ -381,33 +390,9 @@ class LayoutFromFile(BaseEnvironment):
         regeneration.
         """
 
-        resources = ["Wood", "Stone"]
-
-        for resource in resources:
-            d = 1 + (2 * self.layout_specs[resource]["regen_halfwidth"])
-            kernel = (
-                self.layout_specs[resource]["regen_weight"] * np.ones((d, d)) / (d ** 2)
-            )
-
-            resource_map = self.world.maps.get(resource)
-            resource_source_blocks = self.world.maps.get(resource + "SourceBlock")
-            spawnable = (
-                self.world.maps.empty + resource_map + resource_source_blocks
-            ) > 0
-            spawnable *= resource_source_blocks > 0
-
-            health = np.maximum(resource_map, resource_source_blocks)
-            respawn = np.random.rand(*health.shape) < signal.convolve2d(
-                health, kernel, "same"
-            )
-            respawn *= spawnable
-
-            self.world.maps.set(
-                resource,
-                np.minimum(
-                    resource_map + respawn, self.layout_specs[resource]["max_health"]
-                ),
-            )
+        regeneration.regenerate_resources(
+            self.world.maps, self.world.rng, self._source_cells
+        )
 
     def generate_observations(self):
         """
@@ -431,13 +416,6 @@ class LayoutFromFile(BaseEnvironment):
         config) as well as the inventory of each of the mobile agents.
         """
         obs = {}
-        curr_map = self.world.maps.state
-
-        owner_map = self.world.maps.owner_state
-        loc_map = self.world.loc_map
-        agent_idx_maps = np.concatenate([owner_map, loc_map[None, :, :]], axis=0)
-        agent_idx_maps += 2
-        agent_idx_maps[agent_idx_maps == 1] = 0
 
         agent_locs = {
             str(agent.idx): {
@@ -457,6 +435,17 @@ class LayoutFromFile(BaseEnvironment):
             "inventory-" + k: v * self.inv_scale
             for k, v in self.world.planner.inventory.items()
         }
+
+        # The full maps are only built if some observation includes them
+        if self._planner_gets_spatial_info or self._full_observability:
+            # The maps are updated in place, so the observations need a copy
+            curr_map = self.world.maps.state.copy()
+            owner_map = self.world.maps.owner_state
+            loc_map = self.world.loc_map
+            agent_idx_maps = np.concatenate([owner_map, loc_map[None, :, :]], axis=0)
+            agent_idx_maps += 2
+            agent_idx_maps[agent_idx_maps == 1] = 0
+
         if self._planner_gets_spatial_info:
             obs[self.world.planner.idx].update(
                 dict(map=curr_map, idx_map=agent_idx_maps)
@@ -464,11 +453,11 @@ class LayoutFromFile(BaseEnvironment):
 
         # Mobile agents see the full map. Convey location info via one-hot map channels.
         if self._full_observability:
-            for agent in self.world.agents:
-                my_map = np.array(agent_idx_maps)
-                my_map[my_map == int(agent.idx) + 2] = 1
+            my_maps = np.repeat(agent_idx_maps[None], self.n_agents, axis=0)
+            my_maps[my_maps == self._own_idx_values] = 1
+            for i, agent in enumerate(self.world.agents):
                 sidx = str(agent.idx)
-                obs[sidx] = {"map": curr_map, "idx_map": my_map}
+                obs[sidx] = {"map": curr_map, "idx_map": my_maps[i]}
                 obs[sidx].update(agent_invs[sidx])
 
         # Mobile agents only see within a window around their position
@@ -477,34 +466,16 @@ class LayoutFromFile(BaseEnvironment):
                 self._mobile_agent_observation_range
             )  # View halfwidth (only applicable without full observability)
 
-            padded_map = np.pad(
-                curr_map,
-                [(0, 1), (w, w), (w, w)],
-                mode="constant",
-                constant_values=[(0, 1), (0, 0), (0, 0)],
-            )
-
-            padded_idx = np.pad(
-                agent_idx_maps,
-                [(0, 0), (w, w), (w, w)],
-                mode="constant",
-                constant_values=[(0, 0), (0, 0), (0, 0)],
-            )
-
-            for agent in self.world.agents:
-                r, c = [c + w for c in agent.loc]
-                visible_map = padded_map[
-                    :, (r - w) : (r + w + 1), (c - w) : (c + w + 1)
-                ]
-                visible_idx = np.array(
-                    padded_idx[:, (r - w) : (r + w + 1), (c - w) : (c + w + 1)]
-                )
-
-                visible_idx[visible_idx == int(agent.idx) + 2] = 1
+            rs, cs = np.array([agent.loc for agent in self.world.agents]).T
+            visible_maps, visible_idxs = self.world.maps.windows(rs, cs, w)
+            visible_idxs += 2
+            visible_idxs[visible_idxs == 1] = 0
+            visible_idxs[visible_idxs == self._own_idx_values] = 1
 
+            for i, agent in enumerate(self.world.agents):
                 sidx = str(agent.idx)
 
-                obs[sidx] = {"map": visible_map, "idx_map": visible_idx}
+                obs[sidx] = {"map": visible_maps[i], "idx_map": visible_idxs[i]}
                 obs[sidx].update(agent_locs[sidx])
                 obs[sidx].update(agent_invs[sidx])
 
@@ -674,6 +645,9 @@ class SplitLayout(LayoutFromFile):
         env_layout_file (str): Name of the layout file in ./map_txt/ to use.
             Note: The world dimensions of that layout must match the world dimensions
             argument used to construct the environment.
+        layout_cache_dir (str): Directory where parsed layouts are cached (as .npz
+            files), in addition to the in-memory cache shared by the environments of
+            a process. Default is None (in-memory cache only).
         resource_regen_prob (float): Probability that an empty source tile will
             regenerate a new resource unit.
         starting_agent_coin (int, float): Amount of coin agents have at t=0. Defaults
@@ -721,8 +695,9 @@ class SplitLayout(LayoutFromFile):
             self._water_line = int(water_row)
             assert 0 < self._water_line < self.world_size[0] - 1
         for landmark, landmark_map in self._source_maps.items():
+            landmark_map = landmark_map.copy()
             landmark_map[self._water_line, :] = 1 if landmark == "Water" else 0
-            self._source_maps[landmark] = landmark_map
+            self._source_maps[landmark] = freeze(landmark_map)
 
         # Controls logic for which agents (by skill rank) get placed on the top
         if skill_rank_of_top_agents is None:
@@ -746,7 +721,7 @@ class SplitLayout(LayoutFromFile):
         assert bm.skill_dist == "pareto"
         pmsm = bm.payment_max_skill_multiplier
         # Generate a batch (100000) of num_agents (sorted/clipped) Pareto samples.
-        pareto_samples = np.random.pareto(4, size=(100000, self.n_agents))
+        pareto_samples = self.world.rng.pareto(4, size=(100000, self.n_agents))
         clipped_skills = np.minimum(pmsm, (pmsm - 1) * pareto_samples + 1)
         sorted_clipped_skills = np.sort(clipped_skills, axis=1)
         # The skill level of the i-th skill-ranked agent is the average of the
@@ -781,12 +756,12 @@ class SplitLayout(LayoutFromFile):
             else:
                 r_min, r_max = self._water_line + 1, self.world_size[0]
 
-            r = np.random.randint(r_min, r_max)
-            c = np.random.randint(0, self.world_size[1])
+            r = self.world.rng.integers(r_min, r_max)
+            c = self.world.rng.integers(0, self.world_size[1])
             n_tries = 0
             while not self.world.can_agent_occupy(r, c, agent):
-                r = np.random.randint(r_min, r_max)
-                c = np.random.randint(0, self.world_size[1])
+                r = self.world.rng.integers(r_min, r_max)
+                c = self.world.rng.integers(0, self.world_size[1])
                 n_tries += 1
                 if n_tries > 200:
                     raise TimeoutError
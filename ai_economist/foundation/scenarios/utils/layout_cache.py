@@ -0,0 +1,142 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Process-wide caches of the static tables that scenarios build at construction
+(parsed layout files and skill tables), so that creating many copies of an
+environment only parses and samples them once.
+
+Cached arrays are flagged read-only and shared by all the environments that use
+them (and their snapshots).
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from ai_economist.foundation.base.snapshot import freeze
+
+# Symbols of the layout files and the landmarks they stand for
+LANDMARK_LOOKUP = {"W": "Wood", "S": "Stone", "@": "Water"}
+
+_layouts = {}
+_ranked_skills = {}
+_lock = threading.Lock()
+
+
+def parse_layout(layout_string, world_size):
+    """
+    Convert a layout string to landmark maps.
+
+    Args:
+        layout_string (str): The layout, with rows separated by ";" and one symbol
+            per location (see LANDMARK_LOOKUP; other symbols are empty locations).
+        world_size (list): [height, width] of the maps.
+
+    Returns:
+        landmark_maps (dict): {landmark: map} with a 1 wherever the landmark is.
+    """
+    landmark_maps = {k: np.zeros(world_size) for k in LANDMARK_LOOKUP.values()}
+    for r, symbol_row in enumerate(layout_string.split(";")):
+        for c, symbol in enumerate(symbol_row):
+            landmark = LANDMARK_LOOKUP.get(symbol, None)
+            if landmark:
+                landmark_maps[landmark][r, c] = 1
+    return landmark_maps
+
+
+def load_layout(path, world_size, cache_dir=None):
+    """
+    Read and parse a layout file, reusing the maps of earlier calls.
+
+    Layouts are cached by the hash of the file contents, so that an edited file
+    is parsed again.
+
+    Args:
+        path (str): Path to the layout file.
+        world_size (list): [height, width] of the maps.
+        cache_dir (str): If not None, parsed layouts are also saved as .npz files
+            in this directory and loaded from it, so that they are shared across
+            processes and runs.
+
+    Returns:
+        layout_string (str): The contents of the layout file.
+        landmark_maps (dict): {landmark: map} with a 1 wherever the landmark is
+            (see parse_layout). The maps are read-only.
+    """
+    with open(path, "r") as f:
+        layout_string = f.read()
+    digest = hashlib.sha1(layout_string.encode()).hexdigest()
+    key = (digest, tuple(int(v) for v in world_size))
+
+    with _lock:
+        landmark_maps = _layouts.get(key)
+    if landmark_maps is not None:
+        return layout_string, landmark_maps
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            cache_dir, "layout_{}_{}x{}.npz".format(digest[:16], *key[1])
+        )
+    if cache_path is not None and os.path.isfile(cache_path):
+        with np.load(cache_path) as data:
+            landmark_maps = {k: data[k] for k in data.files}
+    else:
+        landmark_maps = parse_layout(layout_string, world_size)
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file first, so that readers never see a
+            # partial file
+            tmp_path = "{}.{}.tmp.npz".format(
+                os.path.splitext(cache_path)[0], os.getpid()
+            )
+            np.savez(tmp_path, **landmark_maps)
+            os.replace(tmp_path, cache_path)
+
+    landmark_maps = {k: freeze(v) for k, v in landmark_maps.items()}
+    with _lock:
+        landmark_maps = _layouts.setdefault(key, landmark_maps)
+    return layout_string, landmark_maps
+
+
+def get_ranked_skills(n_agents, max_skill_multiplier, n_samples=100000, seed=1):
+    """
+    Expected Pareto skill multipliers of agents, ranked by skill.
+
+    The skill level of the i-th skill-ranked agent is the average of the i-th
+    ranked samples throughout a batch of n_samples sorted, clipped Pareto draws
+    (made with a dedicated, fixed-seed generator).
+
+    Args:
+        n_agents (int): The number of agents.
+        max_skill_multiplier (float): Maximum skill multiplier of the Pareto draws.
+        n_samples (int): Number of draws per agent.
+        seed (int): Seed of the generator.
+
+    Returns:
+        average_ranked_skills (ndarray): [n_agents] read-only array of skill
+            multipliers, in increasing order.
+    """
+    key = (int(n_agents), float(max_skill_multiplier), int(n_samples), int(seed))
+    with _lock:
+        average_ranked_skills = _ranked_skills.get(key)
+    if average_ranked_skills is None:
+        fixed_rng = np.random.RandomState(seed=seed)
+        pareto_samples = fixed_rng.pareto(4, size=(n_samples, n_agents))
+        clipped_skills = np.minimum(
+            max_skill_multiplier,
+            (max_skill_multiplier - 1) * pareto_samples + 1,
+        )
+        sorted_clipped_skills = np.sort(clipped_skills, axis=1)
+        average_ranked_skills = freeze(sorted_clipped_skills.mean(axis=0))
+        with _lock:
+            average_ranked_skills = _ranked_skills.setdefault(
+                key, average_ranked_skills
+            )
+    return average_ranked_skills
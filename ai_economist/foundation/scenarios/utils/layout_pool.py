@@ -0,0 +1,217 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Pools of procedurally generated layouts, filled in a background thread so that
+scenario resets only have to copy a ready-made layout.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from ai_economist.foundation.base.snapshot import freeze
+
+# Pools shared by all the environments of this process, keyed by layout parameters
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Drop the pools inherited from the parent process, whose threads are gone."""
+    global _pools_lock
+    _pools.clear()
+    # The parent may have held the lock while forking
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def layout_key(params):
+    """Return a canonical string describing the layout parameters in params."""
+    return json.dumps(params, sort_keys=True)
+
+
+def get_layout_pool(params, generate_layout, size, max_uses=0, directory=None):
+    """
+    Return the layout pool of the given layout parameters, creating it if needed.
+
+    Environments with the same layout parameters share a pool, so that a layout
+    generated for one of them can be used by all of them.
+
+    Args:
+        params (dict): JSON-serializable parameters that fully determine the
+            distribution of layouts (such as the scenario name, world size and
+            coverage targets).
+        generate_layout (callable): Function of a random number generator that
+            returns a new layout, as a {name: array} dictionary. Only used if
+            the pool does not exist yet.
+        size (int): See LayoutPool.
+        max_uses (int): See LayoutPool.
+        directory (str): If not None, the pool is persisted as a .npz file in
+            this directory and loaded from it when it is created.
+
+    Returns:
+        pool (LayoutPool): The pool of the given layout parameters.
+    """
+    key = layout_key(params)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed or pool.pid != os.getpid():
+            path = None
+            if directory is not None:
+                digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+                path = os.path.join(directory, "layouts_{}.npz".format(digest))
+            pool = LayoutPool(
+                generate_layout, size, max_uses=max_uses, path=path, key=key
+            )
+            _pools[key] = pool
+    return pool
+
+
+class LayoutPool:
+    """
+    A set of layouts that a background thread keeps topped up.
+
+    Layouts are drawn at random from the pool. A layout that has been drawn
+    max_uses times is dropped from the pool and the background thread generates a
+    fresh one in its place. If the pool is empty when a layout is requested (e.g.
+    right after it is created), a layout is generated on the spot.
+
+    A pool belongs to the process that created it: a forked child process has to
+    create its own pool (see get_layout_pool), since the background thread is not
+    carried over by the fork.
+
+    Note: Which layouts are in the pool depends on the timing of the background
+    thread (and on the layouts previously saved to path), so drawing from a pool
+    is not reproducible from the environment seed alone.
+
+    Args:
+        generate_layout (callable): Function of a random number generator that
+            returns a new layout, as a {name: array} dictionary.
+        size (int): Number of layouts to keep in the pool.
+        max_uses (int): Number of draws after which a layout is replaced by a
+            freshly generated one. If 0 (default), layouts are never replaced.
+        path (str): If not None, .npz file that the pool is loaded from (if it
+            exists) and saved to whenever the pool has been topped up.
+        key (str): Description of the layout parameters. Saved along with the
+            layouts, so that a file saved with other parameters is not loaded.
+    """
+
+    def __init__(self, generate_layout, size, max_uses=0, path=None, key=""):
+        self.size = int(size)
+        assert self.size > 0
+        self.max_uses = int(max_uses)
+        assert self.max_uses >= 0
+        self.path = path
+        self.key = str(key)
+        self._generate_layout = generate_layout
+
+        self._layouts = []
+        self._uses = []
+        self._lock = threading.Lock()
+        self._needs_layouts = threading.Condition(self._lock)
+        self.closed = False
+        self.pid = os.getpid()
+
+        if self.path is not None and os.path.isfile(self.path):
+            self.load()
+
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._layouts)
+
+    def _add(self, layout):
+        """Add a layout to the pool (the lock must be held)."""
+        self._layouts.append({k: freeze(np.array(v)) for k, v in layout.items()})
+        self._uses.append(0)
+
+    def _fill(self):
+        """Background loop that generates layouts whenever the pool is not full."""
+        rng = np.random.default_rng()
+        while True:
+            with self._lock:
+                while not self.closed and len(self._layouts) >= self.size:
+                    self._needs_layouts.wait()
+                if self.closed:
+                    return
+            layout = self._generate_layout(rng)
+            with self._lock:
+                if len(self._layouts) < self.size:
+                    self._add(layout)
+                is_full = len(self._layouts) >= self.size
+            if is_full and self.path is not None:
+                self.save()
+
+    def draw(self, rng):
+        """
+        Draw a layout from the pool.
+
+        Args:
+            rng (Generator): The random number generator used to pick the layout,
+                and to generate one if the pool is empty.
+
+        Returns:
+            layout (dict): A (writable) copy of the drawn layout.
+        """
+        with self._lock:
+            is_empty = not self._layouts
+        if is_empty:
+            layout = self._generate_layout(rng)
+            with self._lock:
+                self._add(layout)
+
+        with self._lock:
+            idx = int(rng.integers(len(self._layouts)))
+            layout = self._layouts[idx]
+            self._uses[idx] += 1
+            if self.max_uses and self._uses[idx] >= self.max_uses:
+                del self._layouts[idx]
+                del self._uses[idx]
+                self._needs_layouts.notify()
+        return {k: v.copy() for k, v in layout.items()}
+
+    def save(self):
+        """Save the layouts of the pool to path."""
+        assert self.path is not None
+        with self._lock:
+            layouts = list(self._layouts)
+        if not layouts:
+            return
+        arrays = {k: np.stack([layout[k] for layout in layouts]) for k in layouts[0]}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first, so that readers never see a partial file
+        tmp_path = "{}.{}.tmp.npz".format(os.path.splitext(self.path)[0], os.getpid())
+        np.savez_compressed(tmp_path, _key=np.array(self.key), **arrays)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Add the layouts saved at path to the pool (up to the pool size)."""
+        with np.load(self.path) as data:
+            if "_key" not in data or str(data["_key"]) != self.key:
+                return
+            arrays = {k: data[k] for k in data.files if k != "_key"}
+        n_layouts = min(len(v) for v in arrays.values())
+        with self._lock:
+            for i in range(min(n_layouts, self.size - len(self._layouts))):
+                self._add({k: v[i] for k, v in arrays.items()})
+
+    def close(self):
+        """Stop the background thread."""
+        with self._lock:
+            self.closed = True
+            self._needs_layouts.notify_all()
+        self._thread.join()
@@ -0,0 +1,148 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+import numpy as np
+
+from ai_economist.foundation.base.snapshot import freeze
+
+
+def get_source_cells(maps, layout_specs, resources):
+    """Precompute where and how resources can regenerate in the current layout.
+
+    A resource regenerates only on its source blocks. At each step, a source block
+    gains a unit of its resource with probability
+        regen_weight / d**2 * (total health within the d x d square around it),
+    where d = 1 + 2 * regen_halfwidth and the health of a location is the maximum of
+    its resource and source block values. Health is capped at max_health.
+    This is the law of convolving the health map with a uniform d x d kernel and
+    comparing it with uniform draws, restricted to the source blocks (the only
+    locations where resources can spawn).
+
+    Args:
+        maps (Maps, BatchedMaps): The world maps, with the layout in place. With
+            batched maps, the source blocks of all the copies are listed together.
+        layout_specs (dict): {resource: specs}, where specs holds the
+            "regen_halfwidth", "regen_weight" and "max_health" of the resource.
+        resources (list): The resources that regenerate.
+
+    Returns:
+        source_cells (dict): Arrays describing the n source blocks of all resources
+            (flagged read-only):
+                rows, cols: [n] locations of the source blocks;
+                resource_channel, source_channel: [n] map channels of the resource
+                    and of its source block (see Maps.channel);
+                neighbor_rows, neighbor_cols, neighbor_valid: [n, max_d**2]
+                    locations counted by the regeneration kernel of each source
+                    block (neighbor_valid is False for locations outside of the
+                    world and for padding);
+                weight: [n] regeneration probability per unit of health;
+                max_health: [n] maximum health;
+                env (only with batched maps): [n] copy of the source blocks.
+    """
+    h, w = maps.size
+    max_d = max(1 + 2 * layout_specs[r]["regen_halfwidth"] for r in resources)
+    cells = {
+        k: []
+        for k in [
+            "rows",
+            "cols",
+            "resource_channel",
+            "source_channel",
+            "neighbor_rows",
+            "neighbor_cols",
+            "neighbor_valid",
+            "weight",
+            "max_health",
+        ]
+    }
+    for resource in resources:
+        specs = layout_specs[resource]
+        halfwidth = specs["regen_halfwidth"]
+        d = 1 + 2 * halfwidth
+        # (The source block maps of batched maps have a leading env dimension)
+        *envs, rs, cs = np.nonzero(maps.get(resource + "SourceBlock") > 0)
+        n = len(rs)
+        if envs:
+            cells.setdefault("env", []).append(envs[0])
+
+        offsets = np.arange(-halfwidth, halfwidth + 1)
+        dr, dc = [a.ravel() for a in np.meshgrid(offsets, offsets, indexing="ij")]
+        is_padding = np.arange(max_d * max_d) >= d * d
+        dr = np.pad(dr, (0, max_d * max_d - d * d))
+        dc = np.pad(dc, (0, max_d * max_d - d * d))
+        neighbor_rows = rs[:, None] + dr[None]
+        neighbor_cols = cs[:, None] + dc[None]
+        neighbor_valid = (
+            (neighbor_rows >= 0)
+            & (neighbor_rows < h)
+            & (neighbor_cols >= 0)
+            & (neighbor_cols < w)
+            & ~is_padding[None]
+        )
+
+        cells["rows"].append(rs)
+        cells["cols"].append(cs)
+        cells["resource_channel"].append(np.full(n, maps.channel(resource)))
+        cells["source_channel"].append(
+            np.full(n, maps.channel(resource + "SourceBlock"))
+        )
+        cells["neighbor_rows"].append(np.clip(neighbor_rows, 0, h - 1))
+        cells["neighbor_cols"].append(np.clip(neighbor_cols, 0, w - 1))
+        cells["neighbor_valid"].append(neighbor_valid)
+        cells["weight"].append(np.full(n, specs["regen_weight"] / (d * d)))
+        cells["max_health"].append(np.full(n, specs["max_health"], dtype=np.float32))
+
+    return {k: freeze(np.concatenate(v)) for k, v in cells.items()}
+
+
+def regenerate_resources(maps, rng, source_cells):
+    """Stochastically regenerate resources on their source blocks.
+
+    Args:
+        maps (Maps, BatchedMaps): The world maps.
+        rng (Generator): The random number generator to draw from.
+        source_cells (dict): The output of get_source_cells for the current layout.
+    """
+    rows, cols = source_cells["rows"], source_cells["cols"]
+    if len(rows) == 0:
+        return
+    resource_channel = source_cells["resource_channel"]
+    neighbor_rows = source_cells["neighbor_rows"]
+    neighbor_cols = source_cells["neighbor_cols"]
+    # Batched maps also take the copy of each point
+    if "env" in source_cells:
+        at_cells = (source_cells["env"],)
+        at_neighbors = (source_cells["env"][:, None],)
+    else:
+        at_cells = at_neighbors = ()
+
+    health = np.maximum(
+        maps.get_points(
+            resource_channel[:, None], neighbor_rows, neighbor_cols, *at_neighbors
+        ),
+        maps.get_points(
+            source_cells["source_channel"][:, None],
+            neighbor_rows,
+            neighbor_cols,
+            *at_neighbors,
+        ),
+    )
+    prob = (health * source_cells["neighbor_valid"]).sum(axis=1) * source_cells[
+        "weight"
+    ]
+    respawn = rng.random(len(rows)) < prob
+
+    current = maps.get_points(resource_channel, rows, cols, *at_cells)
+    new = np.minimum(current + respawn, source_cells["max_health"])
+    changed = new != current
+    if changed.any():
+        maps.set_points(
+            resource_channel[changed],
+            rows[changed],
+            cols[changed],
+            new[changed],
+            *[v[changed] for v in at_cells],
+        )
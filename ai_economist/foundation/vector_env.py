@@ -0,0 +1,197 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+CPU vectorized environment: steps several Foundation environments in lockstep
+and returns stacked array outputs.
+"""
+
+import numpy as np
+
+from ai_economist import foundation
+
+
+def stack_env_data(data_list):
+    """Recursively stack a list of (possibly nested) per-env data along a new
+    leading axis.
+
+    Args:
+        data_list (list): List with one entry per environment. Entries are either
+            dictionaries (which must share the same keys) or array-likes (which
+            must share the same shape).
+
+    Returns:
+        The stacked data. Dictionaries are preserved, with each leaf replaced by an
+            array with a leading dimension of len(data_list).
+    """
+    first = data_list[0]
+    if isinstance(first, dict):
+        return {k: stack_env_data([d[k] for d in data_list]) for k in first.keys()}
+    return np.stack([np.asarray(d) for d in data_list], axis=0)
+
+
+class VectorEnv:
+    """
+    Hold several environment instances built from a single config and step them in
+    lockstep.
+
+    All environments are stepped from a single array of agent actions, and their
+    observations, rewards and dones are returned as stacked arrays with a leading
+    environment dimension. Environments that finish their episode are reset
+    automatically; the observation of the final step is then made available through
+    the per-env info (see step).
+
+    Observations are grouped the same way as for collated environments, that is,
+    mobile agents under "a" and the planner under "p". Unlike
+    collate_agent_obs (which appends the agent dimension last), the agent
+    dimension directly follows the environment dimension, so that every observation
+    of the mobile agents has shape [n_envs, n_agents, ...].
+
+    Example:
+        vec_env = VectorEnv(env_config, n_envs=8)
+        obs = vec_env.reset()
+        # obs["a"]["action_mask"].shape == (8, n_agents, n_actions)
+
+        actions = np.zeros((8, vec_env.n_agents), dtype=np.int32)
+        obs, rew, done, info = vec_env.step(actions)
+        # rew["a"].shape == (8, n_agents), rew["p"].shape == (8,), done.shape == (8,)
+
+    Args:
+        env_config (dict): The kwargs used to create each environment instance
+            through foundation.make_env_instance. Must include "scenario_name".
+        n_envs (int): Number of environment instances to hold.
+        auto_reset (bool): Whether to automatically reset environments as soon as
+            their episode is done. Default is True.
+        seed (int, optional): If provided, environment i is seeded with seed + i
+            (see BaseEnvironment.seed). Otherwise, environments seed from OS entropy.
+    """
+
+    def __init__(self, env_config, n_envs=1, auto_reset=True, seed=None):
+        assert isinstance(env_config, dict)
+        assert "scenario_name" in env_config
+
+        assert isinstance(n_envs, int)
+        assert n_envs >= 1
+        self.n_envs = n_envs
+
+        self.auto_reset = bool(auto_reset)
+
+        # Grouping agents into "a" and "p" is handled here (with the agent axis
+        # placed first), so the environments themselves should not collate.
+        self.env_config = dict(env_config)
+        self.env_config["collate_agent_step_and_reset_data"] = False
+
+        if seed is not None:
+            assert isinstance(seed, int)
+            assert seed > 0
+        self.envs = []
+        for env_idx in range(n_envs):
+            env_kwargs = dict(self.env_config)
+            if seed is not None:
+                env_kwargs["seed"] = seed + env_idx
+            self.envs.append(foundation.make_env_instance(**env_kwargs))
+
+        self.n_agents = self.envs[0].n_agents
+
+    @property
+    def episode_length(self):
+        """Length of an episode, in timesteps (shared by all environments)."""
+        return self.envs[0].episode_length
+
+    @property
+    def timesteps(self):
+        """Array with the current timestep of each environment."""
+        return np.array([env.world.timestep for env in self.envs], dtype=np.int32)
+
+    def _actions_of_env(self, env_idx, actions, planner_actions):
+        """Select the (agent, planner) actions of a single environment."""
+        return (
+            None if actions is None else actions[env_idx],
+            None if planner_actions is None else planner_actions[env_idx],
+        )
+
+    def reset(self):
+        """
+        Reset all the environments.
+
+        Returns:
+            obs (dict): Stacked observations {"a": agent_obs, "p": planner_obs}.
+                Each leaf of agent_obs has shape [n_envs, n_agents, ...] and each
+                leaf of planner_obs has shape [n_envs, ...].
+        """
+        return stack_env_data([env.stack_agent_obs(env.reset()) for env in self.envs])
+
+    def reset_env(self, env_idx):
+        """
+        Reset a single environment.
+
+        Args:
+            env_idx (int): Index of the environment to reset.
+
+        Returns:
+            obs (dict): Observations {"a": agent_obs, "p": planner_obs} of that
+                environment (without the leading environment dimension).
+        """
+        env = self.envs[env_idx]
+        return env.stack_agent_obs(env.reset())
+
+    def step(self, actions=None, planner_actions=None):
+        """
+        Step all the environments in lockstep.
+
+        Args:
+            actions (ndarray): Integer array of mobile agent actions with shape
+                [n_envs, n_agents] or, if the agents use multi_action_mode,
+                [n_envs, n_agents, n_action_subspaces]. If None, the mobile agents
+                take the NO-OP action.
+            planner_actions (ndarray): Integer array of planner actions with shape
+                [n_envs] or, if the planner uses multi_action_mode,
+                [n_envs, n_action_subspaces]. If None, the planner takes the NO-OP
+                action.
+
+        Returns:
+            obs (dict): Stacked observations (see reset). For environments that were
+                automatically reset, these are the observations after the reset.
+            rew (dict): Stacked rewards {"a": float32 array of shape
+                [n_envs, n_agents], "p": float32 array of shape [n_envs]}.
+            done (ndarray): Boolean array of shape [n_envs] indicating which
+                environments completed their episode this step.
+            info (list): List with one dictionary per environment. For environments
+                that were automatically reset, the observations produced by the final
+                step are stored under "terminal_observation".
+        """
+        if actions is not None:
+            actions = np.asarray(actions)
+            assert actions.shape[:2] == (self.n_envs, self.n_agents)
+        if planner_actions is not None:
+            planner_actions = np.asarray(planner_actions)
+            assert planner_actions.shape[0] == self.n_envs
+
+        env_obs = []
+        rew = {
+            "a": np.zeros((self.n_envs, self.n_agents), dtype=np.float32),
+            "p": np.zeros(self.n_envs, dtype=np.float32),
+        }
+        done = np.zeros(self.n_envs, dtype=bool)
+        info = []
+
+        for env_idx, env in enumerate(self.envs):
+            obs_e, rew_e, done_e = env.step_arrays(
+                *self._actions_of_env(env_idx, actions, planner_actions)
+            )
+            rew["a"][env_idx] = rew_e[:-1]
+            rew["p"][env_idx] = rew_e[-1]
+            info_e = {}
+
+            done[env_idx] = done_e
+            if done[env_idx] and self.auto_reset:
+                info_e["terminal_observation"] = obs_e
+                obs_e = self.reset_env(env_idx)
+
+            env_obs.append(obs_e)
+            info.append(info_e)
+
+        return stack_env_data(env_obs), rew, done, info
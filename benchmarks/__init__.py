@@ -0,0 +1,12 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Performance benchmarks of the Foundation environments.
+
+Run the throughput suite (from the repository root) with:
+    python -m benchmarks.env_throughput
+"""
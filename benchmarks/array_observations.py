@@ -0,0 +1,126 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Benchmark the per-step cost of getting numpy observations out of the environment,
+with and without array_observations.
+
+Without array_observations, scalar observation fields and unflattened action masks
+are returned as Python numbers/lists, and RL wrappers (see
+tutorials/rllib/env_wrapper.py) convert them back to arrays on every reset/step.
+With array_observations, the env returns arrays directly and the conversion is
+skipped.
+
+Usage:
+    python benchmarks/array_observations.py --n-agents 10 --n-steps 500
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ai_economist import foundation
+
+
+def recursive_list_to_np_array(d):
+    """Same conversion as tutorials/rllib/env_wrapper.py (which requires ray)."""
+    if isinstance(d, dict):
+        new_d = {}
+        for k, v in d.items():
+            if isinstance(v, list):
+                new_d[k] = np.array(v)
+            elif isinstance(v, dict):
+                new_d[k] = recursive_list_to_np_array(v)
+            elif isinstance(v, (float, int, np.floating, np.integer)):
+                new_d[k] = np.array([v])
+            elif isinstance(v, np.ndarray):
+                new_d[k] = v
+            else:
+                raise AssertionError
+        return new_d
+    raise AssertionError
+
+
+def get_env_config(n_agents, world_size, array_observations):
+    return {
+        "scenario_name": "layout_from_file/simple_wood_and_stone",
+        "components": [
+            {"Build": {}},
+            {"ContinuousDoubleAuction": {"max_num_orders": 5}},
+            {"Gather": {}},
+        ],
+        "env_layout_file": "quadrant_25x25_20each_30clump.txt",
+        "n_agents": n_agents,
+        "world_size": world_size,
+        "episode_length": 1000,
+        "flatten_observations": False,
+        "flatten_masks": False,
+        "array_observations": array_observations,
+    }
+
+
+def time_steps(n_agents, world_size, n_steps, seed):
+    """
+    Step an env without and an env with array_observations in alternation (using
+    the same seed and actions) and return the per-step times (seconds) of each,
+    including the conversion of observations to numpy arrays.
+    """
+    envs = {}
+    for array_observations in [False, True]:
+        env = foundation.make_env_instance(
+            **get_env_config(n_agents, world_size, array_observations)
+        )
+        env.seed(seed)
+        env.reset()
+        envs[array_observations] = env
+
+    n_actions = envs[False].world.agents[0].action_spaces
+    rng = np.random.RandomState(seed)
+    step_times = {array_observations: [] for array_observations in envs}
+
+    for _ in range(n_steps):
+        actions = rng.randint(0, n_actions, n_agents)
+        # Both envs consume the same random numbers
+        state = np.random.get_state()
+        for array_observations, env in envs.items():
+            np.random.set_state(state)
+            t0 = time.perf_counter()
+            obs, _, done, _ = env.step({str(i): a for i, a in enumerate(actions)})
+            if not array_observations:
+                obs = recursive_list_to_np_array(obs)
+            step_times[array_observations].append(time.perf_counter() - t0)
+            if done["__all__"]:
+                env.reset()
+    return step_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--n-agents", type=int, default=10)
+    parser.add_argument("--world-size", type=int, nargs=2, default=[25, 25])
+    parser.add_argument("--n-steps", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    step_times = time_steps(args.n_agents, args.world_size, args.n_steps, args.seed)
+    medians = {k: float(np.median(v)) for k, v in step_times.items()}
+    for array_observations, median in medians.items():
+        print(
+            "array_observations={}: {:.3f} ms/step (median)".format(
+                array_observations, 1e3 * median
+            )
+        )
+    print(
+        "Savings: {:.3f} ms/step ({:.1f}%)".format(
+            1e3 * (medians[False] - medians[True]),
+            100 * (1 - medians[True] / medians[False]),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
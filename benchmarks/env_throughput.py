@@ -0,0 +1,463 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Environment throughput benchmark suite.
+
+For each benchmark case (a scenario and a combination of n_agents, world size,
+dense logging on/off and flattened/unflattened observations), this measures:
+    - reset latency (median over several resets),
+    - steps per second (stepping with pre-sampled random actions; the episode is
+      reset outside of the timed region when it ends),
+    - per-step allocations (traced with tracemalloc in a separate pass): the mean
+      peak of memory allocated during a step and the mean net growth per step,
+    - peak RSS of the process running the case.
+
+Every case runs in a fresh process (so that peak RSS is attributable to the case)
+and the results are written to a JSON file, together with some metadata (commit,
+library versions, CPU count), so that runs on different commits can be compared.
+
+The covid19 scenario requires an activation code (see
+ai_economist/foundation/utils.py) and is skipped if it has not been activated.
+
+Usage:
+    python -m benchmarks.env_throughput                  # full sweep
+    python -m benchmarks.env_throughput --preset quick   # a few cases only
+    python -m benchmarks.env_throughput --scenarios uniform one_step \\
+        --output results.json
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MAP_TXT_DIR = (
+    REPO_ROOT / "ai_economist/foundation/scenarios/simple_wood_and_stone/map_txt"
+)
+
+# Sweeps, by preset
+PRESETS = {
+    "full": dict(
+        n_agents=[4, 10],
+        world_sizes=[15, 25, 40],
+        dense_logging=[False, True],
+        flatten_observations=[False, True],
+        map_files=None,  # All the files in map_txt
+        n_resets=5,
+        n_steps=200,
+        n_alloc_steps=20,
+    ),
+    "quick": dict(
+        n_agents=[4],
+        world_sizes=[25],
+        dense_logging=[False],
+        flatten_observations=[True],
+        map_files=["quadrant_25x25_20each_30clump.txt"],
+        n_resets=2,
+        n_steps=50,
+        n_alloc_steps=5,
+    ),
+}
+
+SCENARIOS = [
+    "layout_from_file",
+    "uniform",
+    "quadrant",
+    "multi_zone",
+    "one_step",
+    "covid",
+]
+
+WOOD_AND_STONE_COMPONENTS = [
+    {"Build": {}},
+    {"ContinuousDoubleAuction": {"max_num_orders": 5}},
+    {"Gather": {}},
+    {"PeriodicBracketTax": {}},
+]
+
+
+# Benchmark cases
+# ---------------
+
+
+def layout_world_size(map_file):
+    """Smallest world size that fits the layout in map_file (and its file name)."""
+    rows = [row for row in (MAP_TXT_DIR / map_file).read_text().split(";") if row]
+    height, width = len(rows), max(len(row) for row in rows)
+    match = re.search(r"(\d+)x(\d+)", map_file)
+    if match:
+        height = max(height, int(match.group(1)))
+        width = max(width, int(match.group(2)))
+    return [height, width]
+
+
+def covid_is_activated():
+    """Whether the covid19 scenario can be built without prompting for a code."""
+    from ai_economist.foundation import utils
+
+    return os.path.exists(
+        os.path.join(os.path.dirname(utils.__file__), "activation_code.txt")
+    )
+
+
+def covid_env_config():
+    """Env config of the covid19 tutorial (tutorials/covid19_and_economic...)."""
+    return {
+        "scenario_name": "CovidAndEconomySimulation",
+        "components": [
+            {"ControlUSStateOpenCloseStatus": {"action_cooldown_period": 28}},
+            {
+                "FederalGovernmentSubsidy": {
+                    "num_subsidy_levels": 20,
+                    "subsidy_interval": 90,
+                    "max_annual_subsidy_per_person": 20000,
+                }
+            },
+            {
+                "VaccinationCampaign": {
+                    "daily_vaccines_per_million_people": 3000,
+                    "delivery_interval": 1,
+                    "vaccine_delivery_start_date": "2021-01-12",
+                }
+            },
+        ],
+        "start_date": "2020-03-22",
+        "episode_length": 405,
+        "use_real_world_data": False,
+        "use_real_world_policies": False,
+        "health_priority_scaling_agents": 1,
+        "health_priority_scaling_planner": 1,
+        "infection_too_sick_to_work_rate": 0.1,
+        "pop_between_age_18_65": 0.6,
+        "risk_free_interest_rate": 0.03,
+        "economic_reward_crra_eta": 2,
+        "n_agents": 51,
+        "world_size": [1, 1],
+        "collate_agent_step_and_reset_data": True,
+    }
+
+
+def get_cases(scenarios, preset):
+    """
+    Build the list of benchmark cases.
+
+    Args:
+        scenarios (list): Which of SCENARIOS to include.
+        preset (dict): The sweeps to use (see PRESETS).
+
+    Returns:
+        cases (list): List of case dictionaries, each with a "name", the swept
+            parameters and the "env_config" to build the env with (or a "skipped"
+            reason).
+    """
+    cases = []
+
+    def add_case(name, env_config, **params):
+        cases.append(dict(name=name, env_config=env_config, **params))
+
+    for dense_logging in preset["dense_logging"]:
+        for flatten in preset["flatten_observations"]:
+            common = dict(
+                dense_log_frequency=1 if dense_logging else None,
+                flatten_observations=flatten,
+                flatten_masks=True,
+            )
+            params = dict(dense_logging=dense_logging, flatten_observations=flatten)
+
+            for n_agents in preset["n_agents"]:
+                if "layout_from_file" in scenarios:
+                    map_files = preset["map_files"] or sorted(
+                        p.name for p in MAP_TXT_DIR.glob("*.txt")
+                    )
+                    for map_file in map_files:
+                        world_size = layout_world_size(map_file)
+                        add_case(
+                            "layout_from_file/" + map_file,
+                            dict(
+                                scenario_name="layout_from_file/simple_wood_and_stone",
+                                components=WOOD_AND_STONE_COMPONENTS,
+                                env_layout_file=map_file,
+                                n_agents=n_agents,
+                                world_size=world_size,
+                                episode_length=1000,
+                                **common,
+                            ),
+                            n_agents=n_agents,
+                            world_size=world_size,
+                            **params,
+                        )
+
+                for scenario in ["uniform", "quadrant", "multi_zone"]:
+                    if scenario not in scenarios:
+                        continue
+                    for size in preset["world_sizes"]:
+                        add_case(
+                            scenario,
+                            dict(
+                                scenario_name=scenario + "/simple_wood_and_stone",
+                                components=WOOD_AND_STONE_COMPONENTS,
+                                n_agents=n_agents,
+                                world_size=[size, size],
+                                episode_length=1000,
+                                **common,
+                            ),
+                            n_agents=n_agents,
+                            world_size=[size, size],
+                            **params,
+                        )
+
+                if "one_step" in scenarios:
+                    add_case(
+                        "one_step",
+                        dict(
+                            scenario_name="one-step-economy",
+                            components=[
+                                {"PeriodicBracketTax": {"period": 1}},
+                                {"SimpleLabor": {}},
+                            ],
+                            n_agents=n_agents,
+                            world_size=[1, 1],
+                            episode_length=2,
+                            **common,
+                        ),
+                        n_agents=n_agents,
+                        world_size=[1, 1],
+                        **params,
+                    )
+
+            if "covid" in scenarios:
+                env_config = dict(covid_env_config(), **common)
+                case = dict(
+                    name="covid",
+                    env_config=env_config,
+                    n_agents=env_config["n_agents"],
+                    world_size=env_config["world_size"],
+                    **params,
+                )
+                if not covid_is_activated():
+                    case["skipped"] = "covid19 scenario is not activated"
+                cases.append(case)
+
+    return cases
+
+
+# Measurements
+# ------------
+
+
+def _max_rss_mib():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def _sample_actions(env, rng, n_steps):
+    """Pre-sample random actions (as step dictionaries) for n_steps."""
+    actions = []
+    for _ in range(n_steps):
+        actions.append(
+            {
+                str(agent.idx): rng.integers(agent.action_spaces)
+                for agent in env.all_agents
+            }
+        )
+    return actions
+
+
+def _step(env, action):
+    """Step env and return whether the episode is done."""
+    _, _, done, _ = env.step(action)
+    return done["__all__"]
+
+
+def run_case(case, n_resets, n_steps, n_alloc_steps, seed=1):
+    """
+    Run the measurements of a single benchmark case.
+
+    Returns:
+        result (dict): The case parameters and the measured metrics.
+    """
+    result = {k: v for k, v in case.items() if k != "env_config"}
+    if "skipped" in case:
+        return result
+
+    try:
+        from ai_economist import foundation
+
+        rss_before_env_mib = _max_rss_mib()
+
+        env = foundation.make_env_instance(**case["env_config"])
+        env.seed(seed)
+        rng = np.random.default_rng(seed)
+
+        # Reset latency
+        reset_times = []
+        for _ in range(n_resets):
+            start = time.perf_counter()
+            env.reset()
+            reset_times.append(time.perf_counter() - start)
+
+        # Throughput
+        actions = _sample_actions(env, rng, n_steps)
+        env.reset()
+        step_time = 0.0
+        for action in actions:
+            start = time.perf_counter()
+            done = _step(env, action)
+            step_time += time.perf_counter() - start
+            if done:
+                env.reset()
+
+        # Allocations (traced separately since tracing slows everything down)
+        env.reset()
+        tracemalloc.start()
+        peak_bytes, net_bytes = [], []
+        for action in actions[:n_alloc_steps]:
+            tracemalloc.reset_peak()
+            current_before, _ = tracemalloc.get_traced_memory()
+            done = _step(env, action)
+            current_after, peak = tracemalloc.get_traced_memory()
+            peak_bytes.append(peak - current_before)
+            net_bytes.append(current_after - current_before)
+            if done:
+                env.reset()
+        tracemalloc.stop()
+
+        result.update(
+            reset_latency_ms=1e3 * float(np.median(reset_times)),
+            steps_per_sec=n_steps / step_time,
+            step_time_ms=1e3 * step_time / n_steps,
+            alloc_peak_kib_per_step=float(np.mean(peak_bytes)) / 2**10,
+            alloc_net_kib_per_step=float(np.mean(net_bytes)) / 2**10,
+            rss_before_env_mib=rss_before_env_mib,
+            peak_rss_mib=_max_rss_mib(),
+        )
+    except Exception as error:  # Record the failure and move on to the next case
+        result["error"] = "{}: {}".format(type(error).__name__, error)
+    return result
+
+
+def _run_case_args(args):
+    return run_case(*args)
+
+
+# Entry point
+# -----------
+
+
+def get_metadata(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import scipy
+
+    return dict(
+        commit=commit,
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        scipy=scipy.__version__,
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        args=vars(args),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="full")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--n-steps", type=int, help="Override the preset.")
+    parser.add_argument("--n-resets", type=int, help="Override the preset.")
+    parser.add_argument("--n-alloc-steps", type=int, help="Override the preset.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run all the cases in this process (peak RSS is then cumulative).",
+    )
+    parser.add_argument("--output", default="env_throughput.json")
+    args = parser.parse_args(argv)
+
+    preset = dict(PRESETS[args.preset])
+    for key in ["n_steps", "n_resets", "n_alloc_steps"]:
+        if getattr(args, key) is not None:
+            preset[key] = getattr(args, key)
+
+    cases = get_cases(args.scenarios, preset)
+    task_args = [
+        (
+            case,
+            preset["n_resets"],
+            preset["n_steps"],
+            preset["n_alloc_steps"],
+            args.seed,
+        )
+        for case in cases
+    ]
+
+    results = []
+
+    def report(result):
+        results.append(result)
+        if "steps_per_sec" in result:
+            status = "{:9.1f} steps/s  reset {:8.2f} ms  peak RSS {:7.1f} MiB".format(
+                result["steps_per_sec"],
+                result["reset_latency_ms"],
+                result["peak_rss_mib"],
+            )
+        else:
+            status = result.get("skipped") or result.get("error")
+        print(
+            "[{:3d}/{:3d}] {:<50} n_agents={:<3} size={:<9} dense={:<1} flat={:<1} "
+            "{}".format(
+                len(results),
+                len(cases),
+                result["name"],
+                result["n_agents"],
+                "x".join(str(s) for s in result["world_size"]),
+                int(result["dense_logging"]),
+                int(result["flatten_observations"]),
+                status,
+            ),
+            flush=True,
+        )
+
+    if args.in_process:
+        for task in task_args:
+            report(run_case(*task))
+    else:
+        # A fresh worker process for every case
+        with mp.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+            for result in pool.imap(_run_case_args, task_args):
+                report(result)
+
+    with open(args.output, "w") as f:
+        json.dump(dict(metadata=get_metadata(args), results=results), f, indent=2)
+    print("Results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the batched world engine
+"""
+
+import unittest
+
+import numpy as np
+
+from ai_economist import foundation
+from ai_economist.foundation.batched_world import (
+    BatchedBuild,
+    BatchedGather,
+    BatchedWorld,
+)
+from ai_economist.foundation.scenarios.utils import regeneration
+
+env_config = {
+    "scenario_name": "layout_from_file/simple_wood_and_stone",
+    "components": [("Build", {}), ("Gather", {})],
+    "env_layout_file": "quadrant_25x25_20each_30clump.txt",
+    "n_agents": 4,
+    "world_size": [25, 25],
+    "episode_length": 100,
+}
+
+
+class ZeroDraws:
+    """Random number generator stand-in whose uniform draws are all 0."""
+
+    @staticmethod
+    def random(size):
+        return np.zeros(size)
+
+
+class TestBatchedWorld(unittest.TestCase):
+    """Unit tests for BatchedWorld, BatchedGather and BatchedBuild"""
+
+    def test_matches_envs(self):
+        """Batched dynamics match the Gather and Build components of each env"""
+        n_envs = 3
+        envs = []
+        for env_idx in range(n_envs):
+            env = foundation.make_env_instance(**env_config, seed=env_idx + 1)
+            env.reset()
+            for agent in env.world.agents:
+                agent.state["inventory"]["Wood"] = 5
+                agent.state["inventory"]["Stone"] = 5
+            envs.append(env)
+
+        world = BatchedWorld(envs[0].world, n_envs, seed=0)
+        for env_idx, env in enumerate(envs):
+            world.set_env(env_idx, env.world)
+        gather = BatchedGather.from_component(envs[0].get_component("Gather"), world)
+        build = BatchedBuild.from_component(envs[0].get_component("Build"), world)
+
+        rng = np.random.default_rng(0)
+        n_agents = env_config["n_agents"]
+        for _ in range(50):
+            gather_actions = rng.integers(0, 5, (n_envs, n_agents))
+            build_actions = rng.integers(0, 2, (n_envs, n_agents))
+            order = world.random_agent_order()
+            for env_idx, env in enumerate(envs):
+                agents = env.world.agents
+                np.testing.assert_array_equal(
+                    gather.generate_masks()[env_idx],
+                    np.stack(
+                        list(env.get_component("Gather").generate_masks().values())
+                    ),
+                )
+                np.testing.assert_array_equal(
+                    build.generate_masks()[env_idx],
+                    np.stack(
+                        list(env.get_component("Build").generate_masks().values())
+                    ),
+                )
+                for agent in agents:
+                    agent.set_component_action(
+                        "Gather", gather_actions[env_idx, agent.idx]
+                    )
+                    agent.set_component_action(
+                        "Build", build_actions[env_idx, agent.idx]
+                    )
+                env.world.get_random_order_agents = lambda: [
+                    agents[i] for i in order[env_idx]
+                ]
+                env.get_component("Gather").component_step()
+                env.get_component("Build").component_step()
+            gather.step(gather_actions, order=order)
+            build.step(build_actions)
+
+            for env_idx, env in enumerate(envs):
+                np.testing.assert_array_equal(
+                    world.maps.state[env_idx], env.world.maps.state
+                )
+                np.testing.assert_array_equal(
+                    world.maps.owner_state[env_idx], env.world.maps.owner_state
+                )
+                np.testing.assert_array_equal(
+                    world.maps.loc_map[env_idx], env.world.loc_map
+                )
+                for agent in env.world.agents:
+                    np.testing.assert_array_equal(
+                        world.loc[env_idx, agent.idx], agent.loc
+                    )
+                    self.assertEqual(
+                        list(world.inventory[env_idx, agent.idx]),
+                        [agent.inventory[k] for k in world.inventory_keys],
+                    )
+                    self.assertEqual(
+                        list(world.endogenous[env_idx, agent.idx]),
+                        [agent.endogenous[k] for k in world.endogenous_keys],
+                    )
+        self.assertGreater(world.maps.get("House").sum(), 0)
+
+    def test_regeneration(self):
+        """Batched regeneration matches regeneration in each env"""
+        env = foundation.make_env_instance(**env_config, seed=1)
+        env.reset()
+        maps = env.world.maps
+        for resource in ["Wood", "Stone"]:
+            maps.set(resource, np.zeros(maps.size))
+        world = BatchedWorld(env.world, 2)
+        # The second copy has no wood source blocks
+        world.maps.get("WoodSourceBlock")[1] = 0
+
+        source_cells = regeneration.get_source_cells(
+            world.maps, env.layout_specs, ["Wood", "Stone"]
+        )
+        regeneration.regenerate_resources(world.maps, ZeroDraws(), source_cells)
+
+        source_cells = regeneration.get_source_cells(
+            maps, env.layout_specs, ["Wood", "Stone"]
+        )
+        regeneration.regenerate_resources(maps, ZeroDraws(), source_cells)
+        np.testing.assert_array_equal(world.maps.state[0], maps.state)
+        self.assertGreater(world.maps.get("Wood")[0].sum(), 0)
+        self.assertEqual(world.maps.get("Wood")[1].sum(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the ContinuousDoubleAuction component
+"""
+
+import copy
+import unittest
+
+import numpy as np
+
+from ai_economist import foundation
+from ai_economist.foundation.components import continuous_double_auction
+
+env_config = {
+    "scenario_name": "uniform/simple_wood_and_stone",
+    "components": [("ContinuousDoubleAuction", {"max_num_orders": 5})],
+    "n_agents": 4,
+    "world_size": [10, 10],
+    "episode_length": 5000,
+    "starting_agent_coin": 10000,
+}
+
+
+def make_market(seed=1, config=env_config):
+    """Return a reset environment and its market, with well-stocked agents."""
+    env = foundation.make_env_instance(**config, seed=seed)
+    env.reset()
+    for agent in env.world.agents:
+        agent.state["inventory"]["Wood"] = 10000
+        agent.state["inventory"]["Stone"] = 10000
+    return env, env.get_component("ContinuousDoubleAuction")
+
+
+def random_market_step(env, market, rng):
+    """Submit random orders for every agent and commodity and step the market."""
+    for agent in env.world.agents:
+        for resource in market.commodities:
+            for action in ["Buy", "Sell"]:
+                agent.action["{}.{}_{}".format(market.name, action, resource)] = int(
+                    rng.integers(0, market.max_bid_ask + 2)
+                )
+    market.component_step()
+
+
+class TestContinuousDoubleAuction(unittest.TestCase):
+    """Unit tests for ContinuousDoubleAuction"""
+
+    def test_histograms(self):
+        """Histogram totals and lazily decayed price histories stay exact"""
+        env, market = make_market()
+        rng = np.random.default_rng(0)
+        price_history = {c: market._price_zeros(4) for c in market.commodities}
+        # Enough steps for the stored price histories to be renormalized
+        n_steps = 1 + int(
+            np.log(continuous_double_auction._MIN_PRICE_HISTORY_SCALE)
+            / np.log(continuous_double_auction.PRICE_HISTORY_DECAY)
+        )
+        for _ in range(n_steps):
+            random_market_step(env, market, rng)
+            for c in market.commodities:
+                price_history[c] *= continuous_double_auction.PRICE_HISTORY_DECAY
+            records = market.trade_tape.records
+            for trade in records[records["step"] == market.trade_tape.n_steps - 1]:
+                commodity = market.commodities[trade["commodity"]]
+                price_history[commodity][trade["seller"], trade["price"]] += 1
+        self.assertGreater(market._price_history_scale, 0.5)
+
+        for c in market.commodities:
+            np.testing.assert_allclose(market.price_history[c], price_history[c])
+            np.testing.assert_allclose(
+                market.net_price_history[c], price_history[c].sum(axis=0)
+            )
+            np.testing.assert_array_equal(
+                market.total_bids[c], market.bid_hists[c].sum(axis=0)
+            )
+            np.testing.assert_array_equal(
+                market.total_asks[c], market.ask_hists[c].sum(axis=0)
+            )
+            bids = market.order_books[c].bids
+            self.assertEqual(market.total_bids[c].sum(), len(bids))
+            self.assertEqual(
+                market.bid_hists[c][0].sum(), sum(b["agent"] == 0 for b in bids)
+            )
+
+    def test_trade_tape(self):
+        """Metrics and the dense log are computed from the trade tape"""
+        env, market = make_market()
+        rng = np.random.default_rng(1)
+        for _ in range(100):
+            random_market_step(env, market, rng)
+        snapshot = copy.deepcopy(market.trade_tape)
+        random_market_step(env, market, rng)
+        self.assertEqual(len(snapshot.to_dicts()), 100)
+        self.assertEqual(market.trade_tape.to_dicts()[:100], snapshot.to_dicts())
+
+        trades = [trade for step in market.get_dense_log() for trade in step]
+        self.assertEqual(len(trades), len(market.trade_tape))
+        self.assertGreater(len(trades), 0)
+        metrics = market.get_metrics()
+        self.assertEqual(metrics["n_trades"], len(trades))
+        for agent in env.world.agents:
+            for c in market.commodities:
+                sales = [
+                    t["income"]
+                    for t in trades
+                    if t["seller"] == agent.idx and t["commodity"] == c
+                ]
+                key = "{}/Sell{}/".format(agent.idx, c)
+                self.assertEqual(metrics[key + "n_sales"], len(sales))
+                if sales:
+                    self.assertAlmostEqual(metrics[key + "income"], np.mean(sales))
+                else:
+                    self.assertTrue(np.isnan(metrics[key + "income"]))
+
+    def test_call_auction(self):
+        """Call auctions trade at one price per commodity and conserve coin"""
+        config = dict(
+            env_config,
+            components=[
+                (
+                    "ContinuousDoubleAuction",
+                    {"max_num_orders": 5, "clearing_mode": "call_auction"},
+                )
+            ],
+        )
+        env, market = make_market(config=config)
+        rng = np.random.default_rng(2)
+
+        def total(resource):
+            return sum(
+                a.inventory[resource] + a.escrow[resource] for a in env.world.agents
+            )
+
+        coin, wood = total("Coin"), total("Wood")
+        for _ in range(100):
+            random_market_step(env, market, rng)
+        self.assertEqual((total("Coin"), total("Wood")), (coin, wood))
+
+        trades = market.trade_tape.records
+        self.assertGreater(len(trades), 0)
+        self.assertTrue((trades["buyer"] != trades["seller"]).all())
+        self.assertTrue((trades["ask"] <= trades["price"]).all())
+        self.assertTrue((trades["price"] <= trades["bid"]).all())
+        step_commodity = trades["step"] * len(market.commodities) + trades["commodity"]
+        for key in np.unique(step_commodity):
+            self.assertEqual(len(np.unique(trades["price"][step_commodity == key])), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,8 +9,12 @@ Unit tests for the wood and stone scenario + basic components
 """
 
 import unittest
+from copy import deepcopy
+
+import numpy as np
 
 from ai_economist import foundation
+from ai_economist.foundation.base.dense_log import recursive_cast
 
 
 class CreateEnv:
@@ -106,6 +110,204 @@ class TestEnv(unittest.TestCase):
         # Assert that __all__ is in done
         assert "__all__" in done
 
+    def test_step_arrays_matches_step(self):
+        """
+        Unit test that array-native stepping reproduces dictionary stepping
+        """
+        n_agents = 4
+        envs = [CreateEnv().env for _ in range(2)]
+        rng = np.random.RandomState(0)
+        n_actions = envs[0].world.agents[0].action_spaces
+        actions = rng.randint(0, n_actions, size=(10, n_agents))
+
+        results = []
+        for use_arrays, env in enumerate(envs):
+            env.seed(1)
+            env.reset()
+            for t in range(10):
+                if use_arrays:
+                    obs, rew, _ = env.step_arrays(actions[t])
+                else:
+                    obs, rew, _, _ = env.step(
+                        {str(i): a for i, a in enumerate(actions[t])}
+                    )
+                    obs = env.stack_agent_obs(obs)
+                    rew = np.array(
+                        [rew[str(i)] for i in range(n_agents)] + [rew["p"]],
+                        dtype=np.float32,
+                    )
+            results.append((obs, rew))
+
+        (obs_d, rew_d), (obs_a, rew_a) = results
+        np.testing.assert_array_equal(rew_d, rew_a)
+        for k in obs_d["a"]:
+            np.testing.assert_array_equal(obs_d["a"][k], obs_a["a"][k])
+
+        # Actions outside of the action spaces are rejected
+        env = envs[1]
+        for bad_actions in [np.full(n_agents, n_actions), np.full(n_agents, -1)]:
+            with self.assertRaises(ValueError):
+                env.parse_action_arrays(bad_actions)
+        with self.assertRaises(ValueError):
+            env.parse_action_arrays(planner_action=env.world.planner.action_spaces)
+
+    def test_array_observations(self):
+        """
+        Unit test that all observation fields are arrays with array_observations
+        """
+        create_env = CreateEnv()
+        create_env.env_config.update(array_observations=True, flatten_masks=False)
+        env = foundation.make_env_instance(**create_env.env_config)
+
+        def assert_arrays(d):
+            for v in d.values():
+                if isinstance(v, dict):
+                    assert_arrays(v)
+                else:
+                    self.assertIsInstance(v, np.ndarray)
+
+        assert_arrays(env.reset())
+        obs, _, _, _ = env.step({})
+        assert_arrays(obs)
+        self.assertEqual(obs["0"]["time"].dtype, np.float32)
+
+    def test_dense_log(self):
+        """
+        Unit test that the recorded dense log matches copies of the env state
+        """
+        create_env = CreateEnv()
+        create_env.env_config.update(
+            episode_length=20, dense_log_frequency=1, world_dense_log_frequency=3
+        )
+        env = foundation.make_env_instance(**create_env.env_config)
+        env.reset()
+
+        world, states = [], []
+        for t in range(20):
+            # State fields that appear, change type or disappear during the episode
+            if t == 5:
+                env.world.agents[0].state["late_key"] = 0
+                env.world.planner.state["gdp"] = 1
+            if t == 8:
+                env.world.agents[0].state["late_key"] = 2.5
+                env.world.planner.state["gdp"] = [1, 2]
+            if t == 12:
+                del env.world.agents[0].state["late_key"]
+            world.append(
+                deepcopy(env.world.maps.state_dict)
+                if env.world.timestep % 3 == 0
+                else {}
+            )
+            states.append({str(a.idx): deepcopy(a.state) for a in env.all_agents})
+            env.step(
+                {
+                    str(a.idx): np.random.randint(a.action_spaces)
+                    for a in env.world.agents
+                }
+            )
+        world.append(deepcopy(env.world.maps.state_dict))
+        states.append({str(a.idx): deepcopy(a.state) for a in env.all_agents})
+
+        dense_log = env.previous_episode_dense_log
+        self.assertEqual(dense_log["world"], recursive_cast(world))
+        # (Compare the representations, which tell ints, floats and bools apart)
+        self.assertEqual(repr(dense_log["states"]), repr(recursive_cast(states)))
+        self.assertIn("late_key", dense_log["states"][5]["0"])
+        self.assertNotIn("late_key", dense_log["states"][12]["0"])
+        self.assertEqual(len(dense_log["actions"]), 20)
+        self.assertEqual(len(dense_log["rewards"]), 20)
+
+    def test_replay_log(self):
+        """
+        Unit test that replaying the replay log reproduces the episode
+        """
+        create_env = CreateEnv()
+        create_env.env_config.update(episode_length=20, seed=3)
+        env = foundation.make_env_instance(**create_env.env_config)
+        env.reset()
+        for _ in range(20):
+            _, rew, _, _ = env.step(
+                {
+                    str(a.idx): np.random.randint(a.action_spaces)
+                    for a in env.world.agents
+                }
+            )
+        states = recursive_cast({str(a.idx): deepcopy(a.state) for a in env.all_agents})
+        replay_log = env.previous_episode_replay_log
+        self.assertEqual(len(replay_log["reset"]["seed_state"]), 2)
+        self.assertEqual(len(replay_log["step"][0]["seed_state"]), 3)
+
+        # Another env, stepped in between, should not matter
+        create_env.env_config.update(seed=7)
+        replay_env = foundation.make_env_instance(**create_env.env_config)
+        env.reset()
+        replay_env.reset(**replay_log["reset"])
+        for replay_step in replay_log["step"]:
+            env.step({})
+            _, replay_rew, _, _ = replay_env.step(**replay_step)
+        self.assertEqual(replay_rew, rew)
+        self.assertEqual(
+            recursive_cast(
+                {str(a.idx): deepcopy(a.state) for a in replay_env.all_agents}
+            ),
+            states,
+        )
+
+    def test_snapshot_restore(self):
+        """
+        Unit test that restoring a snapshot rewinds the episode
+        """
+        create_env = CreateEnv()
+        create_env.env_config["components"].append({"PeriodicBracketTax": {}})
+        env = foundation.make_env_instance(**create_env.env_config)
+        rng = np.random.RandomState(0)
+        n_actions = env.world.agents[0].action_spaces
+        actions = rng.randint(0, n_actions, size=(30, env.n_agents))
+
+        env.reset()
+        for t in range(10):
+            env.step_arrays(actions[t])
+        snap = env.snapshot()
+        states = recursive_cast({str(a.idx): deepcopy(a.state) for a in env.all_agents})
+
+        rollouts = []
+        for _ in range(2):
+            env.restore(snap)
+            self.assertEqual(env.world.timestep, 10)
+            self.assertEqual(
+                recursive_cast({str(a.idx): deepcopy(a.state) for a in env.all_agents}),
+                states,
+            )
+            rollouts.append(
+                np.stack([env.step_arrays(actions[t])[1] for t in range(10, 30)])
+            )
+        np.testing.assert_array_equal(rollouts[0], rollouts[1])
+
+    def test_profile_report(self):
+        """
+        Unit test that the step profiler reports every phase
+        """
+        create_env = CreateEnv()
+        create_env.env_config.update(profile_steps=True)
+        env = foundation.make_env_instance(**create_env.env_config)
+        env.reset()
+        env.reset_profile()
+        for _ in range(3):
+            env.step({})
+
+        report = env.profile_report()
+        self.assertEqual(report["env"]["step"]["calls"], 3)
+        self.assertEqual(report["env"]["parse_actions"]["calls"], 3)
+        self.assertEqual(report["scenario"]["scenario_step"]["calls"], 3)
+        self.assertEqual(report["scenario"]["generate_rewards"]["calls"], 3)
+        for component in ["Build", "ContinuousDoubleAuction", "Gather"]:
+            for phase in ["component_step", "generate_observations", "generate_masks"]:
+                self.assertEqual(report[component][phase]["calls"], 3)
+        self.assertIsInstance(env.profile_report(as_text=True), str)
+
+        # Disabled by default
+        self.assertEqual(CreateEnv().env.profile_report(), {})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,42 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the shared-memory env pool
+"""
+
+import unittest
+
+import numpy as np
+
+from ai_economist.foundation.env_pool import SharedMemoryEnvPool
+from tests.test_vector_env import env_config
+
+
+class TestSharedMemoryEnvPool(unittest.TestCase):
+    """Unit test to test stepping environments in worker processes"""
+
+    def test_reset_and_step(self):
+        n_envs = 4
+        n_agents = env_config["n_agents"]
+        with SharedMemoryEnvPool(env_config, n_envs=n_envs, n_workers=2) as pool:
+            obs = pool.reset()
+            self.assertEqual(obs["a"]["flat"].shape[:2], (n_envs, n_agents))
+            self.assertEqual(obs["p"]["action_mask"].shape[0], n_envs)
+
+            actions = np.zeros((n_envs, n_agents), dtype=np.int32)
+            for _ in range(env_config["episode_length"]):
+                obs, rew, done = pool.step(actions)
+
+            self.assertEqual(rew["a"].shape, (n_envs, n_agents))
+            self.assertTrue(done.all())
+            # Environments were reset automatically
+            np.testing.assert_array_equal(obs["a"]["time"], 0)
+            self.assertTrue((pool.terminal_obs["a"]["time"] == 1).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
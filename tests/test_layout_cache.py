@@ -0,0 +1,64 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the caches of parsed layouts and skill tables
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ai_economist.foundation.scenarios.utils import layout_cache
+
+
+class TestLayoutCache(unittest.TestCase):
+    """Unit tests for layout_cache"""
+
+    def test_load_layout(self):
+        """Parsed layouts are shared read-only and persisted to the cache dir"""
+        layout_string = "W S;@ W;  S"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "layout.txt")
+            with open(path, "w") as f:
+                f.write(layout_string)
+            cache_dir = os.path.join(directory, "cache")
+
+            loaded_string, maps = layout_cache.load_layout(path, [3, 3], cache_dir)
+            self.assertEqual(loaded_string, layout_string)
+            expected = layout_cache.parse_layout(layout_string, [3, 3])
+            self.assertEqual(set(maps), {"Wood", "Stone", "Water"})
+            for landmark, landmark_map in maps.items():
+                np.testing.assert_array_equal(landmark_map, expected[landmark])
+                self.assertFalse(landmark_map.flags.writeable)
+            self.assertEqual(expected["Wood"][1, 2], 1)
+            self.assertEqual(expected["Water"].sum(), 1)
+
+            # Same contents: the cached maps are reused
+            _, maps_again = layout_cache.load_layout(path, [3, 3])
+            self.assertIs(maps_again["Wood"], maps["Wood"])
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            # Edited contents: the layout is parsed again
+            with open(path, "w") as f:
+                f.write("SSS;WWW;@@@")
+            _, maps_edited = layout_cache.load_layout(path, [3, 3], cache_dir)
+            np.testing.assert_array_equal(maps_edited["Stone"][0], 1)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_ranked_skills(self):
+        """Ranked skill tables are computed once and sorted by skill"""
+        skills = layout_cache.get_ranked_skills(4, 3.0, n_samples=1000)
+        self.assertIs(skills, layout_cache.get_ranked_skills(4, 3.0, n_samples=1000))
+        self.assertFalse(skills.flags.writeable)
+        self.assertTrue((np.diff(skills) >= 0).all())
+        self.assertTrue(((skills >= 1) & (skills <= 3)).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
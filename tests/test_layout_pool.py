@@ -0,0 +1,140 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the pools of pre-generated scenario layouts
+"""
+
+import multiprocessing as mp
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from ai_economist import foundation
+from ai_economist.foundation.env_pool import SharedMemoryEnvPool
+from ai_economist.foundation.scenarios.utils.layout_pool import (
+    LayoutPool,
+    get_layout_pool,
+)
+from tests.test_env import CreateEnv
+from tests.test_vector_env import env_config as pool_env_config
+
+
+def generate_layout(rng):
+    """A random 4x4 layout."""
+    return {"Wood": rng.random((4, 4)) < 0.5, "Stone": rng.random((4, 4)) < 0.5}
+
+
+def generate_empty_layout(rng):
+    """An empty 4x4 layout."""
+    return {"Wood": np.zeros((4, 4), dtype=bool), "Stone": np.zeros((4, 4), dtype=bool)}
+
+
+def check_forked_pool(parent_pool, queue):
+    """Draw from the layout pool in a forked process and report on its state."""
+    pool = get_layout_pool({"test": "fork"}, generate_layout, 2, max_uses=1)
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        pool.draw(rng)
+    # The background thread of this process tops the pool up again
+    deadline = time.time() + 10
+    while len(pool) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    queue.put((pool is not parent_pool, pool.pid == os.getpid(), len(pool)))
+
+
+class TestLayoutPool(unittest.TestCase):
+    """Unit tests for LayoutPool"""
+
+    def test_reuse_and_persistence(self):
+        """Layouts are replaced after max_uses draws and persist across pools"""
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + "/layouts.npz"
+            pool = LayoutPool(generate_layout, 3, max_uses=1, path=path, key="a")
+            drawn = [pool.draw(rng) for _ in range(10)]
+            for layout in drawn:
+                self.assertEqual(set(layout), {"Wood", "Stone"})
+                self.assertTrue(layout["Wood"].flags.writeable)
+            # Each layout is used once
+            self.assertEqual(
+                len(
+                    {
+                        layout["Wood"].tobytes() + layout["Stone"].tobytes()
+                        for layout in drawn
+                    }
+                ),
+                10,
+            )
+            pool.close()
+
+            # The pool is never empty once a layout has been drawn
+            pool = LayoutPool(generate_layout, 3, path=path, key="a")
+            pool.draw(rng)
+            pool.close()
+            pool.save()
+            with np.load(path) as data:
+                saved = {w.tobytes() for w in data["Wood"]}
+            self.assertTrue(saved)
+
+            # Pools with the same key load the saved layouts, others ignore them
+            for key, expect_saved in [("a", True), ("b", False)]:
+                loaded = LayoutPool(generate_empty_layout, 1, path=path, key=key)
+                drawn = {loaded.draw(rng)["Wood"].tobytes() for _ in range(20)}
+                loaded.close()
+                empty = generate_empty_layout(rng)["Wood"].tobytes()
+                self.assertEqual(bool(drawn & saved), expect_saved)
+                self.assertTrue(drawn <= saved | {empty})
+
+    def test_env_layout_pool(self):
+        """Scenario resets draw their starting layouts from the pool"""
+        env_config = CreateEnv().env_config
+        env_config.update(layout_pool_size=2, layout_pool_max_uses=2)
+        env = foundation.make_env_instance(**env_config)
+        layouts = set()
+        for _ in range(6):
+            env.reset()
+            for resource in ["Wood", "Stone"]:
+                source_map = env.world.maps.get(resource + "SourceBlock")
+                np.testing.assert_array_equal(source_map, env.source_maps[resource])
+                np.testing.assert_array_equal(
+                    env.world.maps.get(resource), env.source_maps[resource]
+                )
+            layouts.add(env.source_maps["Wood"].tobytes())
+        self.assertGreater(len(layouts), 1)
+        snapshot = env.snapshot()
+        env.step()
+        env.restore(snapshot)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_fork(self):
+        """Forked processes create their own pool rather than reusing a dead one"""
+        pool = get_layout_pool({"test": "fork"}, generate_layout, 2, max_uses=1)
+        pool.draw(np.random.default_rng(0))
+        ctx = mp.get_context("fork")
+        queue = ctx.Queue()
+        process = ctx.Process(target=check_forked_pool, args=(pool, queue))
+        process.start()
+        self.assertEqual(queue.get(timeout=30), (True, True, 2))
+        process.join()
+        pool.close()
+
+        env_config = dict(pool_env_config, layout_pool_size=2, layout_pool_max_uses=1)
+        with SharedMemoryEnvPool(
+            env_config, n_envs=2, n_workers=2, seed=1, start_method="fork"
+        ) as env_pool:
+            env_pool.reset()
+            actions = np.zeros((2, env_config["n_agents"]), dtype=np.int32)
+            for _ in range(4 * env_config["episode_length"]):
+                _, _, done = env_pool.step(actions)
+            self.assertEqual(done.shape, (2,))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the precompiled observation packer
+"""
+
+import unittest
+
+import numpy as np
+
+from ai_economist.foundation.base.obs_packer import ObservationPacker
+
+
+def reference_pack(obs, put_in_both):
+    """Pack obs by concatenating the fields, as the environment used to."""
+    keep_as_is, flatten = [], []
+    for k, v in obs.items():
+        if k == "action_mask" or (isinstance(v, np.ndarray) and v.ndim > 1):
+            keep_as_is.append(k)
+        else:
+            flatten.append(k)
+            if k in put_in_both:
+                keep_as_is.append(k)
+    to_flatten = [[obs[k]] if np.isscalar(obs[k]) else obs[k] for k in sorted(flatten)]
+    new_obs = {k: obs[k] for k in keep_as_is}
+    new_obs["flat"] = np.concatenate(to_flatten).astype(np.float32)
+    return new_obs
+
+
+def random_obs(rng):
+    """An observation with scalar, vector, multi-dimensional and mask fields."""
+    return {
+        "time": int(rng.integers(100)),
+        "coin": float(rng.random() * 1e3),
+        "loc": rng.integers(0, 10, 2),
+        "skills": list(rng.random(3)),
+        "map": rng.random((2, 5, 5)),
+        "action_mask": rng.integers(0, 2, 7),
+    }
+
+
+class TestObservationPacker(unittest.TestCase):
+    """Unit tests for ObservationPacker"""
+
+    def test_matches_concatenate(self):
+        """Packing matches concatenating the fields and casting to float32"""
+        rng = np.random.default_rng(0)
+        for reuse_buffer in [False, True]:
+            packer = ObservationPacker(
+                random_obs(rng), put_in_both=["time"], reuse_buffer=reuse_buffer
+            )
+            packed = []
+            for _ in range(5):
+                obs = random_obs(rng)
+                expected = reference_pack(obs, ["time"])
+                new_obs = packer.pack(obs)
+                self.assertEqual(new_obs.keys(), expected.keys())
+                self.assertEqual(new_obs["flat"].dtype, np.float32)
+                np.testing.assert_array_equal(new_obs["flat"], expected["flat"])
+                self.assertIs(new_obs["map"], obs["map"])
+                packed.append(new_obs["flat"])
+            # Only reused buffers are overwritten by the next call
+            self.assertEqual(packed[0] is packed[-1], reuse_buffer)
+
+
+if __name__ == "__main__":
+    unittest.main()
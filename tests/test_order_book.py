@@ -0,0 +1,151 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the price-level order book
+"""
+
+import unittest
+
+import numpy as np
+
+from ai_economist.foundation.components.order_book import OrderBook
+
+
+def reference_match(bids, asks):
+    """Match sorted lists of (price, created, agent) orders by rescanning them."""
+    bids = sorted(bids, key=lambda b: (-b[0], b[1]))
+    asks = sorted(asks, key=lambda a: (a[0], a[1]))
+    excluded = set()
+    matches = []
+    while True:
+        bid = next((b for b in bids if b[2] not in excluded), None)
+        if bid is None:
+            return matches, bids, asks
+        ask = next((a for a in asks if a[2] != bid[2]), None)
+        if ask is None or ask[0] > bid[0]:
+            excluded.add(bid[2])
+            continue
+        bids.remove(bid)
+        asks.remove(ask)
+        matches.append((bid, ask))
+
+
+class TestOrderBook(unittest.TestCase):
+    """Unit tests for OrderBook"""
+
+    def test_matches_reference(self):
+        """Matching and expiry agree with rescanning sorted order lists"""
+        rng = np.random.default_rng(0)
+        book = OrderBook(0, 10)
+        bids, asks = [], []
+        duration = 4
+        for step in range(60):
+            for agent in range(5):
+                for side, orders, add in [
+                    (0, bids, book.add_bid),
+                    (1, asks, book.add_ask),
+                ]:
+                    for _ in range(rng.integers(3)):
+                        price = int(rng.integers(0, 7) + 4 * side)
+                        add(agent, price, step)
+                        # (The creation order breaks ties between orders of a step)
+                        orders.append((price, (step, len(orders)), agent))
+
+            matches, bids, asks = reference_match(bids, asks)
+            self.assertEqual(
+                [
+                    (b["price"], b["agent"], a["price"], a["agent"])
+                    for b, a in book.match()
+                ],
+                [(b[0], b[2], a[0], a[2]) for b, a in matches],
+            )
+
+            expired_bids, expired_asks = book.expire(step - duration)
+            self.assertEqual(
+                len(expired_bids), sum(b[1][0] == step - duration for b in bids)
+            )
+            self.assertEqual(
+                len(expired_asks), sum(a[1][0] == step - duration for a in asks)
+            )
+            bids = [b for b in bids if b[1][0] > step - duration]
+            asks = [a for a in asks if a[1][0] > step - duration]
+
+            self.assertEqual(
+                [(b["price"], b["agent"]) for b in book.bids],
+                [(b[0], b[2]) for b in bids],
+            )
+            self.assertEqual(
+                [(a["price"], a["agent"]) for a in book.asks],
+                [(a[0], a[2]) for a in asks],
+            )
+            self.assertEqual(book.best_bid, bids[0][0] if bids else None)
+            self.assertEqual(book.best_ask, asks[0][0] if asks else None)
+            self.assertEqual(len(book), len(bids) + len(asks))
+
+    def test_clear(self):
+        """Call auctions trade the largest volume at a single price"""
+        rng = np.random.default_rng(1)
+        for _ in range(50):
+            book = OrderBook(0, 10)
+            bid_prices = rng.integers(0, 11, rng.integers(0, 30))
+            ask_prices = rng.integers(0, 11, rng.integers(0, 30))
+            for i, price in enumerate(bid_prices):
+                book.add_bid(i % 7, price, 0)
+            for i, price in enumerate(ask_prices):
+                book.add_ask(7 + i % 5, price, 0)
+
+            prices = np.arange(11)
+            volume = np.minimum(
+                (bid_prices[None] >= prices[:, None]).sum(axis=1),
+                (ask_prices[None] <= prices[:, None]).sum(axis=1),
+            )
+            price, matches = book.clear(rng)
+            if volume.max() == 0:
+                self.assertIsNone(price)
+                self.assertEqual(matches, [])
+                continue
+            self.assertEqual(volume[price], volume.max())
+            self.assertEqual(len(matches), volume.max())
+            for bid, ask in matches:
+                self.assertNotEqual(bid["agent"], ask["agent"])
+                self.assertGreaterEqual(bid["price"], price)
+                self.assertLessEqual(ask["price"], price)
+            self.assertEqual(
+                len(book), len(bid_prices) + len(ask_prices) - 2 * len(matches)
+            )
+            # The remaining orders do not cross at the clearing price
+            self.assertTrue(
+                all(b["price"] <= price for b in book.bids)
+                or all(a["price"] >= price for a in book.asks)
+            )
+
+        # Agents that both buy and sell trade with each other, not with themselves
+        book = OrderBook(0, 10)
+        for agent in [0, 1]:
+            book.add_bid(agent, 5, 0)
+            book.add_ask(agent, 3, 0)
+        price, matches = book.clear(rng)
+        self.assertEqual(price, 4)
+        self.assertEqual(
+            sorted((b["agent"], a["agent"]) for b, a in matches), [(0, 1), (1, 0)]
+        )
+
+        # As many pairs as possible are formed when one agent dominates the book
+        for agents, n_matches in [([0, 1, 2], 3), ([0, 0, 0, 1], 2), ([0] * 4, 0)]:
+            for _ in range(20):
+                book = OrderBook(0, 10)
+                for agent in agents:
+                    book.add_bid(agent, 5, 0)
+                    book.add_ask(agent, 3, 0)
+                _, matches = book.clear(rng)
+                self.assertEqual(len(matches), n_matches)
+                self.assertTrue(all(b["agent"] != a["agent"] for b, a in matches))
+                self.assertEqual(len(book), 2 * (len(agents) - n_matches))
+
+
+if __name__ == "__main__":
+    unittest.main()
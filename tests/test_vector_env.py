@@ -0,0 +1,99 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the CPU vectorized environment
+"""
+
+import unittest
+
+import numpy as np
+
+from ai_economist.foundation.vector_env import VectorEnv
+
+env_config = {
+    "scenario_name": "uniform/simple_wood_and_stone",
+    "components": [
+        {"Build": {}},
+        {"ContinuousDoubleAuction": {"max_num_orders": 5}},
+        {"Gather": {}},
+    ],
+    "n_agents": 4,
+    "world_size": [15, 15],
+    "episode_length": 5,
+    "flatten_observations": True,
+    "flatten_masks": True,
+    "starting_agent_coin": 10,
+    "starting_stone_coverage": 0.10,
+    "starting_wood_coverage": 0.10,
+}
+
+
+class TestVectorEnv(unittest.TestCase):
+    """Unit test to test stacking and auto-resetting in the vectorized env"""
+
+    def test_reset_and_step_shapes(self):
+        n_envs = 3
+        vec_env = VectorEnv(env_config, n_envs=n_envs)
+        n_agents = env_config["n_agents"]
+
+        obs = vec_env.reset()
+        self.assertEqual(sorted(obs.keys()), ["a", "p"])
+        self.assertEqual(obs["a"]["flat"].shape[:2], (n_envs, n_agents))
+        self.assertEqual(obs["a"]["action_mask"].shape[:2], (n_envs, n_agents))
+        self.assertEqual(obs["p"]["action_mask"].shape[0], n_envs)
+
+        actions = np.zeros((n_envs, n_agents), dtype=np.int32)
+        obs, rew, done, info = vec_env.step(actions)
+        self.assertEqual(rew["a"].shape, (n_envs, n_agents))
+        self.assertEqual(rew["a"].dtype, np.float32)
+        self.assertEqual(rew["p"].shape, (n_envs,))
+        self.assertEqual(done.shape, (n_envs,))
+        self.assertEqual(len(info), n_envs)
+        self.assertFalse(done.any())
+
+    def test_auto_reset(self):
+        n_envs = 2
+        vec_env = VectorEnv(env_config, n_envs=n_envs)
+        vec_env.reset()
+
+        for _ in range(env_config["episode_length"]):
+            obs, _, done, info = vec_env.step()
+
+        self.assertTrue(done.all())
+        np.testing.assert_array_equal(vec_env.timesteps, np.zeros(n_envs))
+        for info_e in info:
+            self.assertIn("terminal_observation", info_e)
+        np.testing.assert_array_equal(obs["a"]["time"], np.zeros((n_envs, 4, 1)))
+
+    def test_reuse_observation_buffers(self):
+        """Reused observation buffers do not leak into the returned observations"""
+        results = []
+        for reuse in [False, True]:
+            vec_env = VectorEnv(
+                dict(env_config, reuse_observation_buffers=reuse), n_envs=2, seed=1
+            )
+            vec_env.reset()
+            for _ in range(env_config["episode_length"]):
+                obs, _, done, info = vec_env.step()
+            self.assertTrue(done.all())
+            results.append((obs, [i["terminal_observation"] for i in info]))
+
+        (obs, terminal_obs), (reuse_obs, reuse_terminal_obs) = results
+        for k in ["a", "p"]:
+            np.testing.assert_array_equal(obs[k]["flat"], reuse_obs[k]["flat"])
+            for t_obs, reuse_t_obs in zip(terminal_obs, reuse_terminal_obs):
+                np.testing.assert_array_equal(t_obs[k]["flat"], reuse_t_obs[k]["flat"])
+        # The terminal planner observation is not the one after the reset
+        self.assertFalse(
+            np.array_equal(
+                reuse_terminal_obs[0]["p"]["flat"], reuse_obs["p"]["flat"][0]
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
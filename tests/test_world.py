@@ -0,0 +1,309 @@
+# Copyright (c) 2021, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root
+# or https://opensource.org/licenses/BSD-3-Clause
+
+"""
+Unit tests for the spatial logic of the world maps
+"""
+
+import unittest
+
+import numpy as np
+from scipy import signal
+
+from ai_economist.foundation.base.spatial_hash import SpatialHash
+from ai_economist.foundation.base.world import Maps, SparseMaps, World
+from ai_economist.foundation.scenarios.utils import regeneration
+
+
+def reference_accessibility(maps):
+    """Accessibility recomputed from scratch from the landmark maps."""
+    accessible = np.ones([maps.n_agents] + maps.size, dtype=bool)
+    for landmark in maps._blocked:
+        accessible &= maps.get(landmark)[None] == 0
+    for landmark in maps._private:
+        owner = maps.get(landmark, owner=True)[None]
+        accessible &= (owner == -1) | (owner == np.arange(maps.n_agents)[:, None, None])
+    return accessible
+
+
+class TestMaps(unittest.TestCase):
+    """Unit tests for Maps accessibility"""
+
+    def setUp(self):
+        self.maps = Maps([6, 5], 3, ["Wood"], ["House", "Water"])
+
+    def test_set_point_blocking(self):
+        """Placing a blocking landmark only blocks its location"""
+        maps = self.maps
+        maps.accessibility  # Make sure the cached tensor is updated incrementally
+        maps.set_point("Water", 2, 3, 1)
+        self.assertFalse(maps.is_accessible(2, 3, 0))
+        self.assertEqual(maps.accessibility.sum(), 3 * (6 * 5 - 1))
+        maps.set_point("Water", 2, 3, 0)
+        self.assertTrue(maps.accessibility.all())
+
+    def test_incremental_accessibility(self):
+        """Incremental updates agree with a full recomputation"""
+        maps = self.maps
+        rng = np.random.default_rng(0)
+        water = (rng.random(maps.size) < 0.2).astype(float)
+        maps.set("Water", water)
+        maps.accessibility
+        for _ in range(100):
+            r, c = rng.integers(maps.size)
+            agent_idx = int(rng.integers(maps.n_agents))
+            if maps.get_point("House", r, c, owner=True) in [-1, agent_idx]:
+                maps.set_point("House", r, c, float(rng.integers(2)), owner=agent_idx)
+            np.testing.assert_array_equal(
+                maps.accessibility, reference_accessibility(maps)
+            )
+        rs, cs = np.meshgrid(np.arange(-1, 7), np.arange(-1, 6), indexing="ij")
+        for agent_idx in range(maps.n_agents):
+            expected = np.pad(maps.accessibility[agent_idx], 1)[: 6 + 2, : 5 + 2]
+            np.testing.assert_array_equal(
+                maps.accessible_at(agent_idx, rs, cs), expected
+            )
+        maps.clear("Water")
+        np.testing.assert_array_equal(maps.accessibility, reference_accessibility(maps))
+
+    def test_maps_are_views(self):
+        """Entity maps are views into the state and owner tensors"""
+        maps = self.maps
+        state = maps.state
+        self.assertEqual(state.dtype, np.float32)
+        self.assertEqual(state.shape, (len(list(maps.keys())), 6, 5))
+        maps.set("Wood", np.ones(maps.size))
+        maps.set_point("House", 1, 2, 1, owner=2)
+        channels = list(maps.keys())
+        self.assertIs(maps.state, state)
+        self.assertTrue(np.shares_memory(maps.get("Wood"), state))
+        self.assertTrue((state[channels.index("Wood")] == 1).all())
+        self.assertEqual(state[channels.index("House"), 1, 2], 1)
+        self.assertEqual(maps.owner_state[0, 1, 2], 2)
+        self.assertFalse(maps.empty[1, 2])
+        maps.clear()
+        self.assertFalse(state.any())
+        self.assertTrue(maps.empty.all())
+        self.assertTrue((maps.owner_state == -1).all())
+
+    def test_windows(self):
+        """Batched windows match windows sliced from explicitly padded maps"""
+        maps = self.maps
+        rng = np.random.default_rng(2)
+        maps.set("Wood", rng.integers(0, 3, maps.size).astype(float))
+        maps.set_point("House", 0, 4, 1, owner=1)
+        w = 2
+        padded_map = np.pad(
+            maps.state,
+            [(0, 1), (w, w), (w, w)],
+            constant_values=[(0, 1), (0, 0), (0, 0)],
+        )
+        padded_idx = np.pad(
+            np.concatenate([maps.owner_state, maps.loc_map[None]]),
+            [(0, 0), (w, w), (w, w)],
+            constant_values=-1,
+        )
+        rs, cs = np.array([0, 5, 3]), np.array([4, 0, 2])
+        maps_windows, idx_windows = maps.windows(rs, cs, w)
+        for i, (r, c) in enumerate(zip(rs, cs)):
+            np.testing.assert_array_equal(
+                maps_windows[i], padded_map[:, r : r + 2 * w + 1, c : c + 2 * w + 1]
+            )
+            np.testing.assert_array_equal(
+                idx_windows[i], padded_idx[:, r : r + 2 * w + 1, c : c + 2 * w + 1]
+            )
+
+    def test_loc_map(self):
+        """The agent index map follows the agent locations"""
+        for sparse_maps in [False, True]:
+            world = World([4, 4], 2, ["Wood"], ["House"], False, True, sparse_maps)
+            agent0, agent1 = world.agents
+            world.set_agent_loc(agent0, 1, 2)
+            world.set_agent_loc(agent1, 3, 0)
+            world.set_agent_loc(agent1, 1, 2)  # Occupied: agent1 does not move
+            world.set_agent_loc(agent0, 0, 0)
+            expected = -np.ones([4, 4], dtype=np.int16)
+            expected[0, 0], expected[3, 0] = 0, 1
+            np.testing.assert_array_equal(world.loc_map, expected)
+            self.assertFalse(world.maps.is_unoccupied(3, 0))
+            self.assertTrue(world.maps.is_unoccupied(1, 2))
+            world.clear_agent_locs()
+            self.assertTrue((world.loc_map == -1).all())
+
+
+class TestSparseMaps(unittest.TestCase):
+    """Unit tests for the sparse maps backend"""
+
+    def test_matches_dense_maps(self):
+        """Sparse maps behave like dense maps"""
+        dense = Maps([7, 6], 3, ["Wood"], ["House", "Water"])
+        sparse = SparseMaps([7, 6], 3, ["Wood"], ["House", "Water"])
+        self.assertEqual(list(dense.keys()), list(sparse.keys()))
+
+        rng = np.random.default_rng(1)
+        water = (rng.random(dense.size) < 0.2).astype(float)
+        wood = rng.integers(0, 3, dense.size).astype(float)
+        for maps in [dense, sparse]:
+            maps.set("Water", water)
+            maps.set("Wood", wood)
+        for _ in range(200):
+            r, c = rng.integers(dense.size)
+            agent_idx = int(rng.integers(dense.n_agents))
+            entity = ["Wood", "Water", "House"][rng.integers(3)]
+            value = float(rng.integers(3))
+            kwargs = dict(owner=agent_idx) if entity == "House" else {}
+            if entity == "House" and dense.get_point("House", r, c, owner=True) not in [
+                -1,
+                agent_idx,
+            ]:
+                continue
+            for maps in [dense, sparse]:
+                maps.set_point(entity, r, c, value, **kwargs)
+                self.assertEqual(
+                    maps.location_resources(r, c), dense.location_resources(r, c)
+                )
+            self.assertEqual(
+                sparse.is_accessible(r, c, 0), dense.is_accessible(r, c, 0)
+            )
+            for a, b in zip(dense.window(r, c, 2), sparse.window(r, c, 2)):
+                np.testing.assert_array_equal(a, b)
+
+        np.testing.assert_array_equal(dense.state, sparse.state)
+        np.testing.assert_array_equal(dense.owner_state, sparse.owner_state)
+        np.testing.assert_array_equal(dense.empty, sparse.empty)
+        np.testing.assert_array_equal(dense.accessibility, sparse.accessibility)
+        np.testing.assert_array_equal(
+            dense.get("House", owner=True), sparse.get("House", owner=True)
+        )
+
+
+class TestSpatialHash(unittest.TestCase):
+    """Unit tests for the spatial hash of agent locations"""
+
+    def test_matches_brute_force(self):
+        """Batched queries match distances computed between all pairs"""
+        rng = np.random.default_rng(2)
+        size, n_agents = [23, 17], 60
+        spatial_hash = SpatialHash(size, n_agents, bucket_size=4)
+        cells = rng.choice(size[0] * size[1], n_agents, replace=False)
+        locs = np.stack([cells // size[1], cells % size[1]], axis=1)
+        for i, (r, c) in enumerate(locs):
+            spatial_hash.set_loc(i, r, c)
+        spatial_hash.clear_loc(5)
+        placed = np.arange(n_agents) != 5
+
+        rs = rng.integers(-2, size[0] + 2, 40)
+        cs = rng.integers(-2, size[1] + 2, 40)
+        agent_map = -np.ones([size[0] + 4, size[1] + 4], dtype=int)
+        agent_map[locs[placed, 0] + 2, locs[placed, 1] + 2] = np.flatnonzero(placed)
+        np.testing.assert_array_equal(
+            spatial_hash.agents_at(rs, cs), agent_map[rs + 2, cs + 2]
+        )
+
+        dr = np.abs(rs[:, None] - locs[None, :, 0])
+        dc = np.abs(cs[:, None] - locs[None, :, 1])
+        distances = {
+            "chebyshev": np.maximum(dr, dc),
+            "manhattan": dr + dc,
+            "euclidean": np.sqrt(dr * dr + dc * dc),
+        }
+        for metric, distance in distances.items():
+            for radius in [0, 1, 3.5, 9]:
+                query_idx, agent_idx = spatial_hash.agents_within(
+                    rs, cs, radius, metric=metric
+                )
+                expected = (distance <= radius) & placed[None]
+                self.assertEqual(
+                    sorted(zip(query_idx, agent_idx)),
+                    sorted(zip(*np.nonzero(expected))),
+                )
+                np.testing.assert_array_equal(
+                    spatial_hash.count_within(rs, cs, radius, metric=metric),
+                    expected.sum(axis=1),
+                )
+
+    def test_follows_agent_locations(self):
+        """The world keeps the spatial hash in sync with the agent locations"""
+        for sparse_maps in [False, True]:
+            world = World([8, 8], 3, ["Wood"], ["House"], False, True, sparse_maps)
+            for agent, (r, c) in zip(world.agents, [(0, 0), (1, 1), (7, 7)]):
+                world.set_agent_loc(agent, r, c)
+            state = world.get_state()
+            world.set_agent_loc(world.agents[2], 2, 2)
+            query_idx, agent_idx = world.agents_within([0, 7], [0, 7], 2)
+            self.assertEqual(list(zip(query_idx, agent_idx)), [(0, 0), (0, 1), (0, 2)])
+            world.set_state(state)
+            self.assertEqual(list(world.agents_at([2, 7], [2, 7])), [-1, 2])
+            world.clear_agent_locs()
+            self.assertEqual(len(world.agents_within([0], [0], 8)[0]), 0)
+
+
+class TestRegeneration(unittest.TestCase):
+    """Unit tests for source-local resource regeneration"""
+
+    def test_matches_convolution(self):
+        """Regeneration agrees with convolving the health maps over the whole world"""
+        layout_specs = {
+            "Wood": {"regen_halfwidth": 1, "regen_weight": 0.3, "max_health": 2},
+            "Stone": {"regen_halfwidth": 2, "regen_weight": 0.5, "max_health": 1},
+        }
+        rng = np.random.default_rng(3)
+        for maps_cls in [Maps, SparseMaps]:
+            maps = maps_cls([9, 8], 2, ["Wood", "Stone"], ["House"])
+            for resource, specs in layout_specs.items():
+                # Resources only exist on their source blocks
+                source = rng.random(maps.size) < 0.3
+                health = rng.integers(0, specs["max_health"] + 1, maps.size)
+                maps.set(resource + "SourceBlock", source)
+                maps.set(resource, health * source)
+            source_cells = regeneration.get_source_cells(
+                maps, layout_specs, ["Wood", "Stone"]
+            )
+
+            for _ in range(5):
+                draws = {r: rng.random(maps.size) for r in ["Wood", "Stone"]}
+                expected = {}
+                for resource, specs in layout_specs.items():
+                    d = 1 + 2 * specs["regen_halfwidth"]
+                    kernel = specs["regen_weight"] * np.ones((d, d)) / (d * d)
+                    source = maps.get(resource + "SourceBlock")
+                    health = np.maximum(maps.get(resource), source)
+                    respawn = draws[resource] < signal.convolve2d(
+                        health, kernel, "same"
+                    )
+                    respawn *= source > 0
+                    expected[resource] = np.minimum(
+                        maps.get(resource) + respawn, specs["max_health"]
+                    )
+
+                class SourceDraws:
+                    """Hands out the draws of the source blocks, in order"""
+
+                    def random(self, n):
+                        channels = list(maps.keys())
+                        resources = [
+                            channels[c] for c in source_cells["resource_channel"]
+                        ]
+                        return np.array(
+                            [
+                                draws[r][i, j]
+                                for r, i, j in zip(
+                                    resources,
+                                    source_cells["rows"],
+                                    source_cells["cols"],
+                                )
+                            ]
+                        )
+
+                regeneration.regenerate_resources(maps, SourceDraws(), source_cells)
+                for resource in ["Wood", "Stone"]:
+                    np.testing.assert_array_equal(
+                        maps.get(resource), expected[resource]
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
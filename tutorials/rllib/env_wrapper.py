@@ -198,14 +198,22 @@ class RLlibEnvWrapper(MultiAgentEnv):
         seed = int(seed2)
         np.random.seed(seed2)
         random.seed(seed2)
+        # The environment draws from its own generator (env seeds must be > 0)
+        self.env.seed(seed2 + 1)
         self._seed = seed2
 
+    def _obs_to_np_arrays(self, obs):
+        # With array_observations, the env already returns numpy arrays
+        if getattr(self.env, "array_observations", False):
+            return obs
+        return recursive_list_to_np_array(obs)
+
     def reset(self, *args, **kwargs):
         obs = self.env.reset(*args, **kwargs)
-        return recursive_list_to_np_array(obs)
+        return self._obs_to_np_arrays(obs)
 
     def step(self, action_dict):
         obs, rew, done, info = self.env.step(action_dict)
         assert isinstance(obs[self.sample_agent_idx]["action_mask"], np.ndarray)
 
-        return recursive_list_to_np_array(obs), rew, done, info
+        return self._obs_to_np_arrays(obs), rew, done, info
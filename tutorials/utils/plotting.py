@@ -268,6 +268,13 @@ def report(c_trades, all_builds, n_agents, a_indices=None):
     print(full_build_str(all_builds, a_indices))
 
 
+def _total_by_agent(entries, agent_key, value_key, rank, n_agents):
+    """Sum entry[value_key] by the rank of agent entry[agent_key] (with bincount)."""
+    agents = np.array([e[agent_key] for e in entries], dtype=np.int64)
+    values = np.array([e[value_key] for e in entries], dtype=np.float64)
+    return np.bincount(rank[agents], weights=values, minlength=n_agents)
+
+
 def breakdown(log, remap_key=None):
     fig0 = vis_world_range(log, remap_key=remap_key)
 
@@ -280,6 +287,8 @@ def breakdown(log, remap_key=None):
         assert isinstance(remap_key, str)
         key_vals = np.array([log["states"][0][str(i)][remap_key] for i in range(n)])
         aidx = np.argsort(key_vals).tolist()
+    # Position of each agent index in aidx
+    rank = np.argsort(aidx)
 
     all_builds = []
     for t, builds in enumerate(log["Build"]):
@@ -308,36 +317,20 @@ def breakdown(log, remap_key=None):
                 this_trade.update(trade)
                 c_trades[trade["commodity"]].append(this_trade)
 
-        incomes = {
-            "Sell Stone": [
-                sum([t["income"] for t in c_trades["Stone"] if t["seller"] == aidx[i]])
-                for i in range(n)
-            ],
-            "Buy Stone": [
-                sum([-t["price"] for t in c_trades["Stone"] if t["buyer"] == aidx[i]])
-                for i in range(n)
-            ],
-            "Sell Wood": [
-                sum([t["income"] for t in c_trades["Wood"] if t["seller"] == aidx[i]])
-                for i in range(n)
-            ],
-            "Buy Wood": [
-                sum([-t["price"] for t in c_trades["Wood"] if t["buyer"] == aidx[i]])
-                for i in range(n)
-            ],
-            "Build": [
-                sum([b["income"] for b in all_builds if b["builder"] == aidx[i]])
-                for i in range(n)
-            ],
-        }
+        incomes = {}
+        for resource in ["Stone", "Wood"]:
+            incomes["Sell " + resource] = _total_by_agent(
+                c_trades[resource], "seller", "income", rank, n
+            )
+            incomes["Buy " + resource] = -_total_by_agent(
+                c_trades[resource], "buyer", "price", rank, n
+            )
+        incomes["Build"] = _total_by_agent(all_builds, "builder", "income", rank, n)
 
     else:
         c_trades = None
         incomes = {
-            "Build": [
-                sum([b["income"] for b in all_builds if b["builder"] == aidx[i]])
-                for i in range(n)
-            ],
+            "Build": _total_by_agent(all_builds, "builder", "income", rank, n),
         }
 
     incomes["Total"] = np.stack([v for v in incomes.values()]).sum(axis=0)